@@ -1,11 +1,14 @@
 # admin_gui.py
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QVBoxLayout, QLabel, QLineEdit, QPushButton, QTabWidget, QWidget, QMessageBox,
-    QListWidget, QListWidgetItem, QHBoxLayout, QCheckBox, QSizePolicy
+    QHBoxLayout, QSizePolicy, QTableView, QHeaderView, QAbstractItemView
 )
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QTimer
+import async_database
 import database
+import validation
 from motob_app import MotobApp
+from table_models import ActivityLogModel, UserPermissionsModel
 import re
 import hashlib  # Import hashlib for password hashing
 import sys
@@ -15,8 +18,9 @@ USERNAME_PATTERN = r"^[a-zA-Z0-9_-]{3,20}$"
 PASSWORD_PATTERN = r"^(?=.*\d)(?=.*[a-z])(?=.*[A-Z])(?=.*[!@#$%^&*()-+]).{8,}$"
 
 class AdminWindow(QMainWindow):
-    def __init__(self):
+    def __init__(self, motob_app=None, logout_function=None):
         super().__init__()
+        self.logout_function = logout_function
 
         self.setWindowTitle("Admin Interface")
 
@@ -34,7 +38,7 @@ class AdminWindow(QMainWindow):
         self.setup_user_management_tab()
         self.setup_permission_management_tab()
         self.setup_activity_log_tab()
-        self.setup_motob_app_tab()
+        self.setup_motob_app_tab(motob_app)
 
         # Add logout button
         self.logout_button = QPushButton("Logout")
@@ -50,6 +54,7 @@ class AdminWindow(QMainWindow):
 
         # Ensure visibility of the permission_management_tab
         self.tab_widget.setCurrentWidget(self.permission_management_tab)
+        self.tab_widget.currentChanged.connect(self.tab_changed)
 
 
     def setup_user_management_tab(self):
@@ -79,7 +84,14 @@ class AdminWindow(QMainWindow):
         layout = QVBoxLayout()
 
         self.user_list_label = QLabel("User List:")
-        self.user_list = QListWidget()
+        self.user_permissions_model = UserPermissionsModel(self)
+        self.user_permissions_model.write_failed.connect(
+            lambda error: self.show_database_error(error, "Failed to update permissions"))
+        self.user_table = QTableView()
+        self.user_table.setModel(self.user_permissions_model)
+        self.user_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.user_table.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.user_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
         self.refresh_user_list()
 
         # Add grant and revoke buttons
@@ -95,37 +107,84 @@ class AdminWindow(QMainWindow):
         button_layout.addWidget(self.revoke_button)
 
         layout.addWidget(self.user_list_label)
-        layout.addWidget(self.user_list)
+        layout.addWidget(self.user_table)
         layout.addLayout(button_layout)  # Add button layout to the main layout
 
         self.permission_management_tab.setLayout(layout)
         self.permission_management_tab.setVisible(True)  # Set the tab to be visible
         print("permission_management_tab visibility:", self.permission_management_tab.isVisible())
 
-    def setup_motob_app_tab(self):
-        layout = QVBoxLayout(self.motob_app_tab)
+    def setup_motob_app_tab(self, motob_app=None):
+        self.motob_app_layout = QVBoxLayout(self.motob_app_tab)
 
         label = QLabel("Motob Transactions:")
         label.setAlignment(Qt.AlignCenter)
-        layout.addWidget(label)
+        self.motob_app_layout.addWidget(label)
 
-        # Create an instance of MotobApp and add it to the layout
-        self.motob_app = MotobApp()
-        layout.addWidget(self.motob_app)
+        # Logged-in sessions share one MotobApp (see session.py); only a
+        # standalone AdminWindow creates its own
+        self.attach_motob_app(motob_app if motob_app is not None else MotobApp())
+
+    def attach_motob_app(self, motob_app):
+        self.motob_app = motob_app
+        self.motob_app_layout.addWidget(motob_app)
 
     def setup_activity_log_tab(self):
-        # Here, you can set up the activity log tab
         layout = QVBoxLayout()
-        self.activity_log_list = QListWidget()
-        layout.addWidget(self.activity_log_list)
+
+        filter_layout = QHBoxLayout()
+        self.activity_user = self.add_activity_filter(filter_layout, "User:", "Username")
+        self.activity_action = self.add_activity_filter(filter_layout, "Action:", "Contains")
+        self.activity_start_date = self.add_activity_filter(filter_layout, "From:", "YYYY-MM-DD")
+        self.activity_end_date = self.add_activity_filter(filter_layout, "To:", "YYYY-MM-DD")
+        refresh_button = QPushButton("Refresh")
+        refresh_button.clicked.connect(self.refresh_activity_log)
+        filter_layout.addWidget(refresh_button)
+        layout.addLayout(filter_layout)
+
+        # Nothing is read until the tab is first opened; after that the view
+        # asks the model for older entries as it is scrolled
+        self.activity_log_model = ActivityLogModel(self)
+        self.activity_log_loaded = False
+        self.activity_log_view = QTableView()
+        self.activity_log_view.setModel(self.activity_log_model)
+        self.activity_log_view.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.activity_log_view.setSelectionBehavior(QAbstractItemView.SelectRows)
+        # Sized from the first page only: ResizeToContents would measure every row fetched
+        self.activity_log_view.horizontalHeader().setStretchLastSection(True)
+        self.activity_log_model.loaded.connect(lambda: self.activity_log_view.resizeColumnsToContents())
+        layout.addWidget(self.activity_log_view)
         self.activity_log_tab.setLayout(layout)
 
+        self.activity_filter_timer = QTimer(self)
+        self.activity_filter_timer.setSingleShot(True)
+        self.activity_filter_timer.setInterval(250)
+        self.activity_filter_timer.timeout.connect(self.refresh_activity_log)
+
+    def add_activity_filter(self, layout, label, placeholder):
+        field = QLineEdit()
+        field.setPlaceholderText(placeholder)
+        field.textChanged.connect(lambda text: self.activity_filter_timer.start())
+        layout.addWidget(QLabel(label))
+        layout.addWidget(field)
+        return field
+
+    def tab_changed(self, index):
+        if self.tab_widget.widget(index) is self.activity_log_tab and not self.activity_log_loaded:
+            self.refresh_activity_log()
+
+    def activity_log_criteria(self):
+        criteria = {"username": self.activity_user.text().strip(), "action": self.activity_action.text().strip()}
+        # Half-typed dates are left out until they are complete
+        for name, field in (("start_date", self.activity_start_date), ("end_date", self.activity_end_date)):
+            if validation.DATE_PATTERN.fullmatch(field.text().strip()):
+                criteria[name] = field.text().strip()
+        return criteria
+
     def refresh_activity_log(self):
-        activities = database.get_activity_log()
-        self.activity_log_list.clear()
-        for activity in activities:
-            item = QListWidgetItem(activity)
-            self.activity_log_list.addItem(item)
+        self.activity_filter_timer.stop()
+        self.activity_log_loaded = True
+        self.activity_log_model.set_filter(**self.activity_log_criteria())
 
     def create_user(self):
         username = self.user_input.text().strip()
@@ -140,88 +199,75 @@ class AdminWindow(QMainWindow):
             QMessageBox.warning(self, "Warning", "Invalid password. Password must be at least 8 characters long and contain at least one digit, one lowercase letter, one uppercase letter, and one special character.")
             return
 
-        if database.get_user(username):
-            QMessageBox.warning(self, "Warning", "User already exists.")
-            return
-
         # Hash the password
         hashed_password = hash_password(password)
 
-        # Add user to the database with the hashed password
-        try:
+        def add():
+            if database.get_user(username):
+                raise ValueError("User already exists.")
+            # Add user to the database with the hashed password
             database.add_user(username, hashed_password)
-            QMessageBox.information(self, "Success", "User created successfully.")
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to create user: {str(e)}")
+
+        async_database.get_async_database().submit(
+            add, on_result=self.user_created,
+            on_error=lambda error: self.show_database_error(error, "Failed to create user"))
+
+    def user_created(self, result):
+        QMessageBox.information(self, "Success", "User created successfully.")
 
         # Clear input fields
         self.user_input.clear()
         self.password_input.clear()
+        self.refresh_user_list()
+
+    def show_database_error(self, error, message):
+        if isinstance(error, ValueError):
+            QMessageBox.warning(self, "Warning", str(error))
+        else:
+            QMessageBox.critical(self, "Error", f"{message}: {str(error)}")
 
     def refresh_user_list(self):
-        users = database.get_all_users_with_permissions()
-        print("Users fetched from the database:", users)  # Print out the users fetched from the database
-        self.user_list.clear()
-        for user in users:
-            username, is_admin, has_permissions = user
-            item = QListWidgetItem(username)
-
-            # Create a container widget to hold the layout
-            container_widget = QWidget()
-            main_layout = QVBoxLayout(container_widget)
-
-            # Add username label
-            username_label = QLabel(username)
-            main_layout.addWidget(username_label)
-
-            # Add checkboxes for edit and delete privileges
-            edit_privilege_checkbox = QCheckBox("Edit Privilege")
-            delete_privilege_checkbox = QCheckBox("Delete Privilege")
-
-            # Set initial checkbox states based on user's permissions
-            edit_privilege_checkbox.setChecked(bool(has_permissions))
-            delete_privilege_checkbox.setChecked(bool(has_permissions))
-
-            # Add checkboxes to the layout
-            main_layout.addWidget(edit_privilege_checkbox)
-            main_layout.addWidget(delete_privilege_checkbox)
-
-            # Set the container widget as the item widget
-            item.setSizeHint(container_widget.sizeHint())  # Set the size hint of the item
-            self.user_list.addItem(item)
-            self.user_list.setItemWidget(item, container_widget)
+        # The first page is read off the UI thread; a newer refresh cancels one still pending
+        self.user_permissions_model.refresh()
 
-    def grant_permission(self):
-        selected_items = self.user_list.selectedItems()
-        if not selected_items:
-            QMessageBox.warning(self, "Warning", "Please select a user.")
-            return
+    def selected_user_rows(self):
+        return sorted(index.row() for index in self.user_table.selectionModel().selectedRows())
 
-        for item in selected_items:
-            username = item.text()
-            # Update database with the new permission status
-            database.grant_permissions(username)  # Call the grant_permissions function
-            QMessageBox.information(self, "Success", f"Permission granted for user: {username}")
-        self.refresh_user_list()
+    def grant_permission(self):
+        self.change_selected_permissions(True, self.permissions_granted)
 
     def revoke_permission(self):
-        selected_items = self.user_list.selectedItems()
-        if not selected_items:
+        self.change_selected_permissions(False, self.permissions_revoked)
+
+    def change_selected_permissions(self, granted, on_result):
+        rows = self.selected_user_rows()
+        if not rows:
             QMessageBox.warning(self, "Warning", "Please select a user.")
             return
+        # Every selected user in one transaction
+        model = self.user_permissions_model
+        request = model.set_permissions(rows, **{permission: granted for permission in model.permissions})
+        request.finished.connect(on_result)
 
-        for item in selected_items:
-            username = item.text()
-            # Update database with the new permission status (revoke permissions)
-            database.revoke_permissions(username)  # Call the revoke_permissions function
-            QMessageBox.information(self, "Success", f"Permission revoked for user: {username}")
-        self.refresh_user_list()
+    def permissions_granted(self, usernames):
+        QMessageBox.information(self, "Success", permission_message("granted", usernames))
+
+    def permissions_revoked(self, usernames):
+        QMessageBox.information(self, "Success", permission_message("revoked", usernames))
 
     def logout(self):
         # Hide the AdminWindow
         self.hide()
-        # Show the UserManagementWindow
-        user_management_window.show()
+        # Let the UserManagementWindow end the session and show itself again
+        if self.logout_function:
+            self.logout_function()
+
+def permission_message(change, usernames):
+    if not usernames:
+        return f"Permission was already {change} for the selected users."
+    if len(usernames) == 1:
+        return f"Permission {change} for user: {usernames[0]}"
+    return f"Permission {change} for {len(usernames)} users."
 
 def hash_password(password):
     """Hash the password using SHA-256."""
@@ -0,0 +1,155 @@
+from PyQt5 import sip
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+import database
+import error_logger
+
+# The windows hand their database work to a QThreadPool through this module
+# instead of calling database.py on the Qt main thread, so a slow query or a
+# disk stall no longer freezes the UI. Results and errors come back as
+# signals on the thread that made the request. A request made with a key
+# cancels any earlier request with the same key that has not finished yet;
+# a superseded request never reports back, and if it had not started it is
+# taken off the queue without running at all.
+
+# More workers than pooled connections would only queue up in
+# ConnectionManager.acquire(), so match the two by default.
+WORKER_COUNT = database.POOL_SIZE
+
+
+class DatabaseRequest(QObject):
+    """One call handed to the workers. Emits finished(result) or failed(exception)."""
+
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(object)
+
+    # Emitted by the worker; queued back to the thread the request lives in
+    _done = pyqtSignal(object, object)
+
+    def __init__(self, func, args, kwargs, key=None, parent=None):
+        super().__init__(parent)
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.key = key
+        self.cancelled = False
+        self._done.connect(self._deliver)
+
+    def cancel(self):
+        self.cancelled = True
+
+    def _deliver(self, result, error):
+        if self.cancelled:
+            return
+        if error is not None:
+            self.failed.emit(error)
+        else:
+            self.finished.emit(result)
+
+
+class _RequestRunner(QRunnable):
+    def __init__(self, request):
+        super().__init__()
+        self.request = request
+        # AsyncDatabase holds on to the runner until the request is done
+        self.setAutoDelete(False)
+
+    def run(self):
+        request = self.request
+        if request.cancelled:
+            request._done.emit(None, None)
+            return
+        try:
+            result = request.func(*request.args, **request.kwargs)
+        except Exception as e:
+            error_logger.log_error(e)
+            request._done.emit(None, e)
+        else:
+            request._done.emit(result, None)
+
+
+class AsyncDatabase(QObject):
+    def __init__(self, worker_count=WORKER_COUNT, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(worker_count)
+        self._runners = {}
+        self._keyed = {}
+
+    def worker_count(self):
+        return self.pool.maxThreadCount()
+
+    def set_worker_count(self, worker_count):
+        self.pool.setMaxThreadCount(worker_count)
+
+    def submit(self, func, *args, key=None, on_result=None, on_error=None, **kwargs):
+        """Run func(*args, **kwargs) on a worker thread and return its DatabaseRequest.
+
+        on_result and on_error, if given, are connected to the request's
+        finished and failed signals.
+        """
+        if key is not None:
+            self.cancel(key)
+        request = DatabaseRequest(func, args, kwargs, key, self)
+        if on_result is not None:
+            request.finished.connect(on_result)
+        if on_error is not None:
+            request.failed.connect(on_error)
+        request._done.connect(lambda result, error: self._forget(request))
+
+        runner = _RequestRunner(request)
+        self._runners[request] = runner
+        if key is not None:
+            self._keyed[key] = request
+        self.pool.start(runner)
+        return request
+
+    def cancel(self, key_or_request):
+        """Cancel a request, or the outstanding request made with that key."""
+        if isinstance(key_or_request, DatabaseRequest):
+            request = key_or_request
+        else:
+            request = self._keyed.get(key_or_request)
+        if request is None:
+            return
+        request.cancel()
+        runner = self._runners.get(request)
+        # Models cancel their reads as they are destroyed, which at exit can
+        # be after Qt has deleted the pool
+        if runner is not None and not sip.isdeleted(self.pool) and self.pool.tryTake(runner):
+            self._forget(request)
+
+    def cancel_all(self):
+        for request in list(self._runners):
+            self.cancel(request)
+
+    def pending_count(self):
+        return len(self._runners)
+
+    def wait_for_done(self, msecs=-1):
+        return self.pool.waitForDone(msecs)
+
+    def _forget(self, request):
+        if self._runners.pop(request, None) is None:
+            return
+        if request.key is not None and self._keyed.get(request.key) is request:
+            del self._keyed[request.key]
+        request.deleteLater()
+
+
+_async_database = None
+
+def get_async_database():
+    global _async_database
+    if _async_database is None:
+        _async_database = AsyncDatabase()
+    return _async_database
+
+def set_worker_count(worker_count):
+    get_async_database().set_worker_count(worker_count)
+
+def shutdown(msecs=-1):
+    """Drop queued requests and wait for the running ones to finish."""
+    if _async_database is not None:
+        _async_database.cancel_all()
+        _async_database.wait_for_done(msecs)
@@ -0,0 +1,476 @@
+import argparse
+import asyncio
+import contextlib
+import gc
+import io
+import json
+import logging
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import urlsplit
+
+import database
+
+
+def _use_temporary_database(directory):
+    database.close_all_connections()
+    database.DATABASE_FILE = os.path.join(directory, "bench.db")
+    database.initialize_database()
+
+
+class _PerCallConnections(database.ConnectionManager):
+    """Opens a plain sqlite3 connection for every outermost call and closes it
+    afterwards, which is how database.py used to behave. Only the connection
+    handling changes: the product catalog and the activity log writer keep
+    running as they do in the pooled mode.
+    """
+
+    def _checkout(self):
+        return sqlite3.connect(self.database_file, check_same_thread=False)
+
+    def _checkin(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        conn.close()
+
+
+def _time_calls(func, iterations):
+    # Some functions print progress (add_debtor); keep that out of the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for i in range(iterations):
+            func(i)
+        return (time.perf_counter() - start) / iterations
+
+
+CRUD_CALLS = [
+    ("add_product", lambda i: database.add_product(f"Product {i}", 100, 0)),
+    ("product_exists", lambda i: database.product_exists(f"Product {i}")),
+    ("get_product_id", lambda i: database.get_product_id(f"Product {i}")),
+    ("add_purchase", lambda i: database.add_purchase(f"Product {i % 50}", "2024-01-01", 2, 10.0)),
+    ("purchase_exists", lambda i: database.purchase_exists("2024-01-01", f"Product {i % 50}", 2, 10.0)),
+    ("add_sale", lambda i: database.add_sale(f"Product {i % 50}", "2024-01-02", "Customer", 1, 12.5)),
+    ("get_sale_by_id", lambda i: database.get_sale_by_id(i + 1)),
+    ("add_debtor", lambda i: database.add_debtor(f"Debtor {i}", "Soap", "2024-01-03", 1, 5)),
+    ("log_activity", lambda i: database.log_activity("bench", f"action {i}")),
+]
+
+
+def bench_crud(iterations):
+    results = {}
+    for mode, per_call in (("per-call connect", True), ("pooled", False)):
+        with tempfile.TemporaryDirectory() as directory:
+            _use_temporary_database(directory)
+            if per_call:
+                database._connection_manager = _PerCallConnections(database.DATABASE_FILE)
+            before = database.get_product_catalog_stats()
+            for name, func in CRUD_CALLS:
+                results.setdefault(name, {})[mode] = _time_calls(func, iterations)
+            after = database.get_product_catalog_stats()
+            catalog = {key: after[key] - before[key] for key in ("hits", "misses")}
+            database.close_all_connections()
+
+    print(f"{'function':<18}{'per-call connect':>20}{'pooled':>14}{'speedup':>10}")
+    for name, timings in results.items():
+        before = timings["per-call connect"] * 1e6
+        after = timings["pooled"] * 1e6
+        print(f"{name:<18}{before:>17.1f} us{after:>11.1f} us{before / after:>9.1f}x")
+    print(f"product catalog (pooled): {catalog['hits']} hits, {catalog['misses']} misses")
+
+
+def _purchase_rows(count):
+    # Unique rows spread over a handful of products and a year of dates
+    return [(f"Product {chr(65 + i % 26)}", f"2024-{1 + i % 12:02d}-{1 + i % 28:02d}", 1 + i % 50, 10.0 + i)
+            for i in range(count)]
+
+
+def bench_bulk(rows):
+    records = _purchase_rows(rows)
+    with tempfile.TemporaryDirectory() as directory:
+        _use_temporary_database(directory)
+
+        # The old way: dedupe query plus a committed insert per row
+        sample = records[:min(rows, 2000)]
+        start = time.perf_counter()
+        for item_name, date, quantity, unit_price in sample:
+            if not database.purchase_exists(date, item_name, quantity, unit_price):
+                database.add_purchase(item_name, date, quantity, unit_price)
+        per_row = len(sample) / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        report = database.bulk_add_purchases(records)
+        bulk = len(records) / (time.perf_counter() - start)
+        database.close_all_connections()
+
+    print(f"add_purchase per row:  {per_row:>10.0f} rows/s ({len(sample)} rows)")
+    print(f"bulk_add_purchases:    {bulk:>10.0f} rows/s ({len(records)} rows, "
+          f"{report['inserted']} inserted, {report['duplicates']} duplicates)")
+
+
+def _fill_tables(rows):
+    # The four transaction tables the window shows, rows rows each
+    database.add_product("Product A", rows * 100, 0)
+    database.bulk_add_purchases([("Product A", f"2024-{1 + i % 12:02d}-{1 + i % 28:02d}", 1 + i % 50, 10.0 + i)
+                                 for i in range(rows)])
+    database.bulk_add_sales([("Product A", "2024-06-01", f"Customer {i}", 1, 12.5) for i in range(rows)])
+    database.bulk_add_debtors([(f"Debtor {i}", "Soap", "2024-06-01", 1, 5.0) for i in range(rows)])
+    database.bulk_add_debts([(f"Creditor {i}", "2024-06-01", "Soap", 1, 5.0) for i in range(rows)])
+
+
+def _wait_for(app, condition, timeout=60):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline:
+            raise TimeoutError("the window did not finish loading")
+        app.processEvents()
+        time.sleep(0.0005)
+
+
+def _measure_startup(app, paints, build_all_tabs):
+    from PyQt5.QtCore import QEvent
+    import async_database
+    from motob_app import MotobApp
+
+    # MotobApp takes over stdout/stderr and its stream puts back whatever it
+    # found when it is garbage collected, so restore the real ones afterwards
+    stdout, stderr = sys.stdout, sys.stderr
+    try:
+        paints.clear()
+        start = time.perf_counter()
+        window = MotobApp()
+        if build_all_tabs:
+            # What startup used to cost: every tab built and its table loaded
+            for index in range(window.tab_widget.count()):
+                window.ensure_tab_built(index)
+            models = [window.purchases_model, window.sales_model, window.products_model,
+                      window.debtors_model, window.debt_model]
+            _wait_for(app, lambda: not any(model.is_loading() for model in models))
+        _wait_for(app, lambda: paints)
+        first_paint = paints[0] - start
+
+        # Opening a table for the first time
+        start = time.perf_counter()
+        window.tab_widget.setCurrentWidget(window.view_sales_tab)
+        _wait_for(app, lambda: not window.sales_model.is_loading())
+        open_sales = time.perf_counter() - start
+
+        async_database.get_async_database().wait_for_done()
+        window.close()
+        window.deleteLater()
+        app.sendPostedEvents(None, QEvent.DeferredDelete)
+    finally:
+        gc.collect()
+        sys.stdout, sys.stderr = stdout, stderr
+    return first_paint, open_sales
+
+
+def bench_startup(sizes):
+    from PyQt5.QtCore import QEvent, QObject
+    from PyQt5.QtWidgets import QApplication
+
+    class PaintWatcher(QObject):
+        def __init__(self, paints):
+            super().__init__()
+            self.paints = paints
+
+        def eventFilter(self, obj, event):
+            if event.type() == QEvent.Paint and not self.paints:
+                self.paints.append(time.perf_counter())
+            return False
+
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    paints = []
+    watcher = PaintWatcher(paints)
+    app.installEventFilter(watcher)
+
+    print(f"{'rows/table':>10}{'all tabs: paint':>18}{'lazy: paint':>14}{'open View Sales':>18}")
+    for rows in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            _use_temporary_database(directory)
+            _fill_tables(rows)
+            eager_paint, _ = _measure_startup(app, paints, build_all_tabs=True)
+            lazy_paint, open_sales = _measure_startup(app, paints, build_all_tabs=False)
+            database.close_all_connections()
+        print(f"{rows:>10}{eager_paint * 1000:>15.1f} ms{lazy_paint * 1000:>11.1f} ms{open_sales * 1000:>15.1f} ms")
+
+
+def _rss_bytes():
+    # Resident set size, where the platform makes it cheap to read
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _format_mb(size):
+    return "n/a" if size is None else f"{size / 1e6:.1f} MB"
+
+
+def bench_session(cycles):
+    from PyQt5.QtCore import QEvent
+    from PyQt5.QtWidgets import QApplication
+    from admin_gui import AdminWindow
+    from gui import UserManagementWindow
+    from motob_app import MotobApp
+
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+
+    def settle():
+        app.processEvents()
+        app.sendPostedEvents(None, QEvent.DeferredDelete)
+        gc.collect()
+
+    stdout, stderr = sys.stdout, sys.stderr
+    results = {}
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            _use_temporary_database(directory)
+            _fill_tables(1000)
+
+            for mode in ("rebuild per login", "session"):
+                settle()
+                rss_before = _rss_bytes()
+                start = time.perf_counter()
+                login_window = UserManagementWindow()
+                if mode == "rebuild per login":
+                    # main() used to build an AdminWindow before showing the login screen
+                    AdminWindow(MotobApp()).hide()
+                login_window.show()
+                settle()
+                cold_start = time.perf_counter() - start
+
+                admin_window = None
+                start = time.perf_counter()
+                for cycle in range(cycles):
+                    if mode == "session":
+                        login_window.session.start_admin_session("bench", login_window.logout)
+                        settle()
+                        login_window.logout()
+                    else:
+                        # What admin_login used to do on every login
+                        admin_window = AdminWindow(MotobApp())
+                        admin_window.show()
+                        settle()
+                        admin_window.hide()
+                    settle()
+                per_login = (time.perf_counter() - start) / cycles
+                rss_after = _rss_bytes()
+                growth = None if rss_before is None or rss_after is None else rss_after - rss_before
+                results[mode] = (cold_start, per_login, growth)
+
+                login_window.close()
+                for window in app.topLevelWidgets():
+                    window.close()
+                    window.deleteLater()
+                admin_window = login_window = None
+                settle()
+            database.close_all_connections()
+    finally:
+        # See _measure_startup: collect the MotobApps before taking stdout back
+        gc.collect()
+        sys.stdout, sys.stderr = stdout, stderr
+
+    print(f"{'':<20}{'cold start':>12}{'per login':>12}{'RSS growth':>14}")
+    for mode, (cold_start, per_login, growth) in results.items():
+        print(f"{mode:<20}{cold_start * 1000:>9.1f} ms{per_login * 1000:>9.1f} ms{_format_mb(growth):>14}")
+
+
+SEARCHES = [
+    ("two days", dict(start_date="2021-03-01", end_date="2021-03-02")),
+    ("one year", dict(start_date="2021-01-01", end_date="2021-12-31")),
+    ("customer prefix", dict(customer_name="customer 4999")),
+    ("item prefix", dict(item_name="soap")),
+    ("amount range", dict(min_amount=1990, max_amount=2000)),
+    ("item + year + amount", dict(item_name="item a", start_date="2021-01-01", end_date="2021-12-31",
+                                  min_amount=1000)),
+    ("customer + date", dict(customer_name="customer 1", start_date="2024-06-01")),
+    ("no match", dict(item_name="nothing")),
+]
+
+
+SEARCH_ITEMS = ["Soap", "Rice", "Beans", "Sugar", "Salt", "Milk", "Bread", "Oil", "Tea", "Coffee"] + \
+    [f"Item {chr(65 + i)}{chr(65 + j)}" for i in range(26) for j in range(26)]
+
+
+def _sales_rows(count):
+    rng = random.Random(7)
+    for _ in range(count):
+        yield (rng.choice(SEARCH_ITEMS),
+               f"{2018 + rng.randrange(7)}-{1 + rng.randrange(12):02d}-{1 + rng.randrange(28):02d}",
+               f"Customer {rng.randrange(50000)}", 1 + rng.randrange(20), round(1 + rng.random() * 99, 2))
+
+
+def bench_search(rows):
+    columns = ["id", "item_name", "date", "customer_name", "quantity", "unit_price", "total_price"]
+    with tempfile.TemporaryDirectory() as directory:
+        _use_temporary_database(directory)
+        for item in SEARCH_ITEMS:
+            database.add_product(item, rows * 20, 0)
+        database.bulk_add_sales(_sales_rows(rows))
+
+        print(f"{rows} sales; time to the first page of results (best of 5)")
+        for name, criteria in SEARCHES:
+            timings = []
+            for _ in range(5):
+                start = time.perf_counter()
+                where, parameters, index = database.build_filter("sales", **criteria)
+                found = database.fetch_rows("sales", columns, None, 256, where=where, parameters=parameters,
+                                            index=index)
+                timings.append(time.perf_counter() - start)
+            print(f"{name:<24}{min(timings) * 1000:>8.1f} ms {len(found):>5} rows  {index or 'id order'}")
+        database.close_all_connections()
+
+
+async def _http_request(reader, writer, method, path, body=None):
+    payload = b"" if body is None else json.dumps(body).encode("utf-8")
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(payload)}\r\n\r\n".encode("latin-1") + payload)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+
+def _loadtest_operation(rng, max_id):
+    roll = rng.random()
+    if roll < 0.6:
+        return "GET", f"/purchases?page={database.encode_page_token('id', [rng.randrange(max_id)])}&limit=50", None
+    if roll < 0.8:
+        return "GET", f"/purchases/{1 + rng.randrange(max_id)}", None
+    return "POST", "/purchases", {"item_name": "Product A", "date": "2024-06-01",
+                                  "quantity": 1 + rng.randrange(50), "unit_price": 10.0}
+
+
+async def _loadtest_client(host, port, requests, batch, max_id, seed, latencies, failures):
+    rng = random.Random(seed)
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for _ in range(requests):
+            operations = [_loadtest_operation(rng, max_id) for _ in range(batch)]
+            if batch == 1:
+                request = operations[0]
+            else:
+                request = ("POST", "/batch", {"requests": [{"method": method, "path": path, "body": body}
+                                                           for method, path, body in operations]})
+            start = time.perf_counter()
+            status, response = await _http_request(reader, writer, *request)
+            latencies.append(time.perf_counter() - start)
+            statuses = [entry["status"] for entry in response["responses"]] if batch > 1 else [status]
+            failures[0] += sum(1 for status in statuses if status >= 400)
+    finally:
+        writer.close()
+
+
+async def _run_loadtest(host, port, clients, requests, batch, max_id):
+    latencies = []
+    failures = [0]
+    start = time.perf_counter()
+    await asyncio.gather(*(_loadtest_client(host, port, requests, batch, max_id, seed, latencies, failures)
+                           for seed in range(clients)))
+    return time.perf_counter() - start, latencies, failures[0]
+
+
+def _start_local_server(directory):
+    # A separate process, so the clients and the server do not share a GIL
+    database_file = os.path.join(directory, "bench.db")
+    server = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py"),
+                               "--port", "0", "--database", database_file],
+                              cwd=directory, stdout=subprocess.PIPE, text=True)
+    line = server.stdout.readline()
+    if not line:
+        server.wait()
+        raise RuntimeError("the API server did not start")
+    address = urlsplit(line.split()[-1])
+    return server, address.hostname, address.port
+
+
+def bench_loadtest(url, clients, requests, batch, rows):
+    with tempfile.TemporaryDirectory() as directory:
+        server = None
+        if url:
+            address = urlsplit(url)
+            host, port = address.hostname, address.port
+        else:
+            _use_temporary_database(directory)
+            _fill_tables(rows)
+            database.close_all_connections()
+            server, host, port = _start_local_server(directory)
+        try:
+            elapsed, latencies, failures = asyncio.run(_run_loadtest(host, port, clients, requests, batch, rows))
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+
+    latencies.sort()
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+    operations = len(latencies) * batch
+    print(f"{clients} keep-alive clients, {len(latencies)} requests of {batch} operation(s), {failures} failed")
+    print(f"throughput: {len(latencies) / elapsed:>10.0f} req/s {operations / elapsed:>10.0f} ops/s")
+    print(f"latency:    p50 {percentile(0.5):.2f} ms  p95 {percentile(0.95):.2f} ms  p99 {percentile(0.99):.2f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Motob performance benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    crud = subparsers.add_parser("crud", help="per-call latency of the database.py CRUD functions")
+    crud.add_argument("-n", "--iterations", type=int, default=500)
+
+    bulk = subparsers.add_parser("bulk", help="row-at-a-time inserts against bulk_add_purchases")
+    bulk.add_argument("-r", "--rows", type=int, default=50000)
+
+    startup = subparsers.add_parser("startup", help="time to first paint of the main window against table size")
+    startup.add_argument("-r", "--rows", default="1000,10000,100000",
+                         help="comma-separated rows per table to measure with")
+
+    session = subparsers.add_parser("session", help="login screen start-up and login/logout cycles")
+    session.add_argument("-c", "--cycles", type=int, default=20)
+
+    search = subparsers.add_parser("search", help="View Sales search filters against a large sales table")
+    search.add_argument("-r", "--rows", type=int, default=1000000)
+
+    loadtest = subparsers.add_parser("loadtest", help="concurrent clients against the JSON API (server.py)")
+    loadtest.add_argument("--url", help="running instance to test, e.g. http://127.0.0.1:8765 "
+                                        "(default: start one on a temporary database)")
+    loadtest.add_argument("-c", "--clients", type=int, default=16)
+    loadtest.add_argument("-n", "--requests", type=int, default=500, help="requests per client")
+    loadtest.add_argument("-b", "--batch", type=int, default=1, help="operations per /batch request")
+    loadtest.add_argument("-r", "--rows", type=int, default=10000, help="rows per table in the temporary database")
+
+    args = parser.parse_args(argv)
+
+    # Errors are logged by database.py; keep them from skewing the timings.
+    logging.disable(logging.CRITICAL)
+
+    if args.command == "crud":
+        bench_crud(args.iterations)
+    elif args.command == "bulk":
+        bench_bulk(args.rows)
+    elif args.command == "startup":
+        bench_startup([int(rows) for rows in args.rows.split(",")])
+    elif args.command == "session":
+        bench_session(args.cycles)
+    elif args.command == "search":
+        bench_search(args.rows)
+    elif args.command == "loadtest":
+        bench_loadtest(args.url, args.clients, args.requests, args.batch, args.rows)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,103 +1,468 @@
+import base64
+import datetime
+import json
+import os
+import re
 import sqlite3
+import threading
+import time
+import queue
 import error_logger
+import migrations
+import validation
 
 DATABASE_FILE = "motobdb.db"
 
+# Number of connections shared by worker threads. The main thread keeps its
+# own connection for the lifetime of the application.
+POOL_SIZE = 4
+POOL_TIMEOUT = 30
+
+# Pragmas applied to every connection as it is opened. "performance" runs the
+# database in WAL mode so readers no longer block the writer and a commit only
+# has to append to the log instead of fsyncing the main file.
+PERFORMANCE_PROFILES = {
+    "performance": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -16000,       # negative means KiB, so ~16 MB of page cache
+        "mmap_size": 268435456,     # 256 MB
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+        "wal_autocheckpoint": 1000,
+    },
+    "safe": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "cache_size": -8000,
+        "mmap_size": 0,
+        "temp_store": "DEFAULT",
+        "busy_timeout": 5000,
+        "wal_autocheckpoint": 1000,
+    },
+    # SQLite defaults: rollback journal and a full fsync on every commit
+    "legacy": {
+        "journal_mode": "DELETE",
+        "synchronous": "FULL",
+    },
+}
+PERFORMANCE_PROFILE = "performance"
+
+# Seconds between background WAL checkpoints
+CHECKPOINT_INTERVAL = 300
+
+
+class ConnectionManager:
+    """Hands out long-lived SQLite connections instead of opening one per call.
+
+    The main thread owns a dedicated connection, and so does any thread that
+    calls hold_connection() (e.g. the API server's writer). Other threads
+    borrow one from a bounded pool and give it back once their outermost call
+    has finished, so nested calls on the same thread (e.g. add_debtor ->
+    debtor_exists) share a single connection.
+    """
+
+    def __init__(self, database_file, pool_size=POOL_SIZE, timeout=POOL_TIMEOUT, pragmas=None):
+        self.database_file = database_file
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.pragmas = dict(pragmas or {})
+        self._local = threading.local()
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+        self._lock = threading.Lock()
+        self._created = 0
+        self._main_conn = None
+        self._all_connections = []
+        self.closed = False
+
+    def _open(self):
+        conn = sqlite3.connect(self.database_file, check_same_thread=False)
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name}={value}")
+        with self._lock:
+            self._all_connections.append(conn)
+        return conn
+
+    def _checkout(self):
+        if threading.current_thread() is threading.main_thread():
+            if self._main_conn is None:
+                self._main_conn = self._open()
+            return self._main_conn
+        held = getattr(self._local, "held", None)
+        if held is not None:
+            return held
+
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_create = self._created < self.pool_size
+            if can_create:
+                self._created += 1
+        if can_create:
+            return self._open()
+
+        try:
+            return self._pool.get(timeout=self.timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError("Timed out waiting for a pooled database connection")
+
+    def _checkin(self, conn):
+        # Never hand a connection back with a half-finished transaction on it
+        if conn.in_transaction:
+            conn.rollback()
+        if conn is not self._main_conn and conn is not getattr(self._local, "held", None):
+            self._pool.put(conn)
+
+    def hold_connection(self):
+        """Give the calling thread a connection of its own, outside the pool, until drop_connection()."""
+        if getattr(self._local, "held", None) is None:
+            self._local.held = self._open()
+
+    def drop_connection(self):
+        conn = getattr(self._local, "held", None)
+        if conn is None:
+            return
+        self._local.held = None
+        with self._lock:
+            if conn in self._all_connections:
+                self._all_connections.remove(conn)
+        conn.close()
+
+    def acquire(self):
+        if self.closed:
+            raise sqlite3.ProgrammingError("Connection manager has been closed")
+        held = getattr(self._local, "conn", None)
+        if held is not None:
+            self._local.depth += 1
+            return held
+        conn = self._checkout()
+        self._local.conn = conn
+        self._local.depth = 1
+        return conn
+
+    def is_outermost(self, conn):
+        """True if releasing conn now would hand it back, i.e. no outer call on this thread holds it."""
+        return getattr(self._local, "conn", None) is conn and self._local.depth == 1
+
+    def release(self, conn):
+        if getattr(self._local, "conn", None) is not conn:
+            return
+        self._local.depth -= 1
+        if self._local.depth == 0:
+            self._local.conn = None
+            self._checkin(conn)
+
+    def close_all(self):
+        self.closed = True
+        with self._lock:
+            connections, self._all_connections = self._all_connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error as e:
+                error_logger.log_error(e)
+        self._main_conn = None
+
+
+_connection_manager = None
+_connection_manager_lock = threading.Lock()
+
+def get_connection_manager():
+    global _connection_manager
+    with _connection_manager_lock:
+        if _connection_manager is None:
+            pragmas = PERFORMANCE_PROFILES[PERFORMANCE_PROFILE]
+            _connection_manager = ConnectionManager(DATABASE_FILE, pragmas=pragmas)
+        return _connection_manager
+
+def close_all_connections():
+    global _connection_manager
+    # Queued activity log entries belong to the database that is open now
+    stop_activity_log_writer()
+    with _connection_manager_lock:
+        manager, _connection_manager = _connection_manager, None
+    # The next connection may be to a different file
+    product_catalog.invalidate()
+    if manager is not None:
+        manager.close_all()
+
+def set_performance_profile(name):
+    global PERFORMANCE_PROFILE
+    if name not in PERFORMANCE_PROFILES:
+        raise ValueError(f"Unknown performance profile: {name}")
+    PERFORMANCE_PROFILE = name
+    # Connections pick up their pragmas when opened, so start over
+    close_all_connections()
+
+
+_last_checkpoint = None
+
+def checkpoint(mode="PASSIVE"):
+    """Run a WAL checkpoint and return how far behind the main file still is."""
+    global _last_checkpoint
+    if mode not in ("PASSIVE", "FULL", "RESTART", "TRUNCATE"):
+        raise ValueError(f"Unknown checkpoint mode: {mode}")
+    try:
+        conn, cursor = connect_to_database()
+        started = time.perf_counter()
+        busy, log_frames, checkpointed_frames = cursor.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+        # Both counts are -1 when the database is not in WAL mode
+        result = {
+            "mode": mode,
+            "busy": bool(busy),
+            "log_frames": max(log_frames, 0),
+            "checkpointed_frames": max(checkpointed_frames, 0),
+            "lag_frames": max(log_frames - checkpointed_frames, 0),
+            "duration": time.perf_counter() - started,
+            "timestamp": time.time(),
+        }
+        _last_checkpoint = result
+        return result
+    except Exception as e:
+        error_logger.log_error(e)
+    finally:
+        close_connection(conn, cursor)
+
+def get_checkpoint_lag():
+    """Report the most recent checkpoint along with the current size of the WAL file."""
+    wal_file = DATABASE_FILE + "-wal"
+    status = dict(_last_checkpoint or {})
+    status["wal_size_bytes"] = os.path.getsize(wal_file) if os.path.exists(wal_file) else 0
+    if _last_checkpoint is not None:
+        status["seconds_since_checkpoint"] = time.time() - _last_checkpoint["timestamp"]
+    return status
+
+
+class CheckpointScheduler(threading.Thread):
+    """Background thread that checkpoints the WAL every `interval` seconds."""
+
+    def __init__(self, interval=CHECKPOINT_INTERVAL):
+        super().__init__(name="wal-checkpoint", daemon=True)
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            checkpoint("PASSIVE")
+
+    def stop(self):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join()
+
+
+_checkpoint_scheduler = None
+
+def start_checkpoint_scheduler(interval=CHECKPOINT_INTERVAL):
+    global _checkpoint_scheduler
+    if _checkpoint_scheduler is None:
+        _checkpoint_scheduler = CheckpointScheduler(interval)
+        _checkpoint_scheduler.start()
+    return _checkpoint_scheduler
+
+def shutdown_database():
+    """Stop background work, fold the WAL back into the database file and close everything."""
+    global _checkpoint_scheduler
+    if _checkpoint_scheduler is not None:
+        _checkpoint_scheduler.stop()
+        _checkpoint_scheduler = None
+    stop_activity_log_writer()
+    if _connection_manager is not None:
+        checkpoint("TRUNCATE")
+    close_all_connections()
+
+
+class StockError(ValueError):
+    """Raised when a sale would take a product below zero available stock."""
+
+
+class DuplicateError(ValueError):
+    """Raised when a purchase or debtor matches one already recorded (see migrations.DEDUPE_COLUMNS)."""
+
+
+def _is_duplicate(error):
+    return isinstance(error, sqlite3.IntegrityError) and "content_hash" in str(error)
+
+
+# Listeners are told about every row the data functions add, change or remove,
+# once the change is committed, so open tables can update just that row
+# instead of reloading everything.
+_change_listeners = []
+_change_listeners_lock = threading.Lock()
+
+def add_change_listener(listener):
+    """Call listener(table, change, row_id) after each change.
+
+    change is "insert", "update" or "delete", or "reload" (with row_id 0)
+    when too many rows changed to list them one by one.
+    """
+    with _change_listeners_lock:
+        _change_listeners.append(listener)
+
+def remove_change_listener(listener):
+    with _change_listeners_lock:
+        if listener in _change_listeners:
+            _change_listeners.remove(listener)
+
+def _notify_change(table, change, row_id):
+    with _change_listeners_lock:
+        listeners = list(_change_listeners)
+    for listener in listeners:
+        try:
+            listener(table, change, row_id)
+        except Exception as e:
+            # A broken view must not turn a committed write into an error
+            error_logger.log_error(e)
+
+
 class DatabaseConnection:
     def __enter__(self):
-        self.conn = sqlite3.connect(DATABASE_FILE)
+        self.manager = get_connection_manager()
+        self.conn = self.manager.acquire()
         self.cursor = self.conn.cursor()
         return self.conn, self.cursor
 
     def __exit__(self, exc_type, exc_val, exc_tb):
+        # A nested block shares the outer caller's connection, and with it the
+        # outer transaction; only the outermost block may end that
+        outermost = self.manager.is_outermost(self.conn)
         if exc_type is not None:
             error_logger.log_error(exc_val)
+            if outermost and self.conn.in_transaction:
+                self.conn.rollback()
+        elif outermost and self.conn.in_transaction:
+            self.conn.commit()
         self.cursor.close()
-        self.conn.close()
+        self.manager.release(self.conn)
+
+def hold_connection():
+    """Keep one connection for the calling thread's lifetime instead of borrowing from the pool.
+
+    For long-lived worker threads; call drop_connection() on the same thread when it is done.
+    """
+    get_connection_manager().hold_connection()
+
+def drop_connection():
+    manager = _connection_manager
+    if manager is not None:
+        manager.drop_connection()
 
 def connect_to_database():
-    conn = sqlite3.connect(DATABASE_FILE)
+    conn = get_connection_manager().acquire()
     cursor = conn.cursor()
     return conn, cursor
 
 def close_connection(conn, cursor):
     cursor.close()
-    conn.close()
+    get_connection_manager().release(conn)
 
 
 def initialize_database():
-    conn = None
-    cursor = None
     try:
         with DatabaseConnection() as (conn, cursor):
-            # Create tables if they don't exist
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS products (
-            id INTEGER PRIMARY KEY,
-            name TEXT NOT NULL,
-            stock INT NOT NULL,
-            sold_stock INT DEFAULT 0,
-            available_stock INT NOT NULL
-                )
-            """)
-
-            cursor.execute('''CREATE TABLE IF NOT EXISTS purchases (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    date TEXT NOT NULL,
-                    item_name TEXT NOT NULL,
-                    quantity INTEGER NOT NULL,
-                    unit_price REAL NOT NULL,
-                    total_price REAL NOT NULL
-                )''')
-
-            cursor.execute('''CREATE TABLE IF NOT EXISTS sales (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    item_name TEXT NOT NULL,
-                    date TEXT NOT NULL,
-                    customer_name TEXT NOT NULL,
-                    quantity INTEGER NOT NULL,
-                    unit_price REAL NOT NULL
-                )''')
-
-            cursor.execute('''CREATE TABLE IF NOT EXISTS debtors (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL,
-                    item TEXT NOT NULL,
-                    date TEXT NOT NULL,
-                    quantity INTEGER NOT NULL,
-                    unit_price INT NOT NULL,
-                    total REAL NOT NULL
-                )''')
-
-            cursor.execute('''CREATE TABLE IF NOT EXISTS debts (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    creditor TEXT,
-                    date TEXT,
-                    goods_purchased TEXT,
-                    quantity INTEGER,
-                    unit_price REAL,
-                    total REAL
-                )''')
-
-            cursor.execute('''CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                password TEXT NOT NULL,
-                is_admin INTEGER NOT NULL,
-                has_permissions INTEGER NOT NULL DEFAULT 0
-                )''')
-
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS activity_logs (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    username TEXT NOT NULL,
-                    action TEXT NOT NULL
-                )""")
+            # Create or upgrade the schema; see migrations.py
+            migrations.migrate(conn)
 
     except Exception as e:
         error_logger.log_error(e)
 
+class ProductCatalog:
+    """Product names and ids, read from the products table once.
+
+    The product functions in this module keep it up to date. A name it does
+    not know is looked up in the database (a miss) and remembered if it
+    exists, so products added by another process are still found. Stock
+    updates check the name on the row they change, so an entry made stale
+    by another process is noticed there and looked up again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = None  # name -> lowest id with that name, None until loaded
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, cursor, name, refresh=False):
+        """Return the id of the product called name, or None, reading through cursor if needed."""
+        with self._lock:
+            if self._ids is None:
+                self.misses += 1
+                cursor.execute("SELECT name, MIN(id) FROM products GROUP BY name")
+                self._ids = dict(cursor.fetchall())
+                return self._ids.get(name)
+            if not refresh and name in self._ids:
+                self.hits += 1
+                return self._ids[name]
+            self.misses += 1
+        cursor.execute("SELECT MIN(id) FROM products WHERE name = ?", (name,))
+        product_id = cursor.fetchone()[0]
+        with self._lock:
+            if self._ids is not None:
+                if product_id is None:
+                    self._ids.pop(name, None)
+                else:
+                    self._ids[name] = product_id
+        return product_id
+
+    def get_id(self, name):
+        # A hit does not need a connection at all
+        with self._lock:
+            if self._ids is not None and name in self._ids:
+                self.hits += 1
+                return self._ids[name]
+        with DatabaseConnection() as (conn, cursor):
+            return self.lookup(cursor, name)
+
+    def names(self):
+        with self._lock:
+            if self._ids is not None:
+                self.hits += 1
+                return sorted(self._ids)
+        with DatabaseConnection() as (conn, cursor):
+            # Loads the catalog
+            self.lookup(cursor, "")
+        with self._lock:
+            return sorted(self._ids or ())
+
+    def added(self, product_id, name):
+        with self._lock:
+            if self._ids is not None:
+                self._ids.setdefault(name, product_id)
+
+    def invalidate(self):
+        # Renames and deletes can change which id a name maps to; start over
+        with self._lock:
+            self._ids = None
+
+    def stats(self):
+        with self._lock:
+            return {"products": len(self._ids or ()), "loaded": self._ids is not None,
+                    "hits": self.hits, "misses": self.misses}
+
+product_catalog = ProductCatalog()
+
+def _lookup_product_id(cursor, name, refresh=False):
+    return product_catalog.lookup(cursor, name, refresh)
+
+def _change_stock(cursor, item_name, assignments, parameters, condition="", condition_parameters=()):
+    """Run UPDATE products SET <assignments> on the product called item_name.
+
+    Returns its id, or None if there is no such product or condition
+    ruled the update out.
+    """
+    for refresh in (False, True):
+        product_id = _lookup_product_id(cursor, item_name, refresh)
+        if product_id is None:
+            return None
+        cursor.execute(f"UPDATE products SET {assignments} WHERE id = ? AND name = ?{condition}",
+                       (*parameters, product_id, item_name, *condition_parameters))
+        if cursor.rowcount:
+            return product_id
+    return None
+
 def add_product(name, stock, sold_stock):
     try:
         conn, cursor = connect_to_database()
@@ -108,7 +473,11 @@ def add_product(name, stock, sold_stock):
             INSERT INTO products (name, stock, sold_stock, available_stock)
             VALUES (?, ?, ?, ?)
         """, (name, stock, sold_stock, available_stock))
+        product_id = cursor.lastrowid
         conn.commit()
+        product_catalog.added(product_id, name)
+        _notify_change("products", "insert", product_id)
+        return product_id
 
     except Exception as e:
         error_logger.log_error(e)
@@ -118,19 +487,10 @@ def add_product(name, stock, sold_stock):
 
 def product_exists(name):
     try:
-        conn, cursor = connect_to_database()
-
-        cursor.execute("SELECT COUNT(*) FROM products WHERE name=?", (name,))
-        count = cursor.fetchone()[0]
-
+        return product_catalog.get_id(name) is not None
     except Exception as e:
         error_logger.log_error(e)
-        count = 0
-
-    finally:
-        close_connection(conn, cursor)
-
-    return count > 0
+        return False
 
 def update_product(product_id, new_name, new_stock, new_sold_stock):
     try:
@@ -138,14 +498,30 @@ def update_product(product_id, new_name, new_stock, new_sold_stock):
 
         new_available_stock = new_stock - new_sold_stock
 
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("SELECT name FROM products WHERE id=?", (product_id,))
+        old_name = cursor.fetchone()
         cursor.execute("""
             UPDATE products
             SET name=?, stock=?, sold_stock=?, available_stock=?
             WHERE id=?
         """, (new_name, new_stock, new_sold_stock, new_available_stock, product_id))
+        # The rows linked to the product carry its name with them
+        renamed = []
+        if old_name is not None and old_name[0] != new_name:
+            for table, column in migrations.PRODUCT_REFERENCES.items():
+                cursor.execute(f"UPDATE {table} SET {column}=? WHERE product_id=?", (new_name, product_id))
+                if cursor.rowcount:
+                    renamed.append(table)
         conn.commit()
+        product_catalog.invalidate()
+        _notify_change("products", "update", product_id)
+        for table in renamed:
+            _notify_change(table, "reload", 0)
+        return product_id
 
     except Exception as e:
+        conn.rollback()
         error_logger.log_error(e)
 
     finally:
@@ -155,10 +531,17 @@ def delete_product(product_id):
     try:
         conn, cursor = connect_to_database()
 
+        cursor.execute("BEGIN IMMEDIATE")
         cursor.execute("DELETE FROM products WHERE id=?", (product_id,))
+        for table in migrations.PRODUCT_REFERENCES:
+            cursor.execute(f"UPDATE {table} SET product_id=NULL WHERE product_id=?", (product_id,))
         conn.commit()
+        product_catalog.invalidate()
+        _notify_change("products", "delete", product_id)
+        return product_id
 
     except sqlite3.Error as e:
+        conn.rollback()
         error_logger.log_error(e)
 
     finally:
@@ -166,19 +549,22 @@ def delete_product(product_id):
 
 def get_product_id(name):
     try:
-        conn, cursor = connect_to_database()
-
-        cursor.execute("SELECT id FROM products WHERE name=?", (name,))
-        product_id = cursor.fetchone()
-
+        return product_catalog.get_id(name)
     except Exception as e:
         error_logger.log_error(e)
-        product_id = None
+        return None
 
-    finally:
-        close_connection(conn, cursor)
+def get_product_names():
+    """Every product name, sorted, e.g. for completing item name fields."""
+    try:
+        return product_catalog.names()
+    except Exception as e:
+        error_logger.log_error(e)
+        return []
 
-    return product_id[0] if product_id else None
+def get_product_catalog_stats():
+    """How often product lookups were answered from memory ("hits") or had to read the database ("misses")."""
+    return product_catalog.stats()
 
 def get_all_products():
     try:
@@ -197,27 +583,63 @@ def get_all_products():
     return products
 
 def add_purchase(item_name, date, quantity, unit_price):
+    try:
+        return post_purchase(item_name, date, quantity, unit_price)
+    except Exception:
+        # post_purchase has already logged the error
+        return None
+
+def post_purchase(item_name, date, quantity, unit_price):
+    """Record a purchase and add it to stock in a single transaction.
+
+    A purchase of an item that is not in the catalog yet creates the product.
+    Raises DuplicateError if the same purchase is already recorded. Returns
+    the id of the new purchase.
+    """
+    conn, cursor = connect_to_database()
     try:
         total_price = quantity * unit_price  # Calculate total price
-        conn, cursor = connect_to_database()
 
+        cursor.execute("BEGIN IMMEDIATE")
+
+        # Update available stock
+        product_id = _change_stock(cursor, item_name, "stock = stock + ?, available_stock = available_stock + ?",
+                                   (quantity, quantity))
+        if product_id is None:
+            cursor.execute("""
+                INSERT INTO products (name, stock, sold_stock, available_stock)
+                VALUES (?, ?, 0, ?)
+            """, (item_name, quantity, quantity))
+            product_id = cursor.lastrowid
+            product_change = ("insert", product_id)
+            new_product = (product_id, item_name)
+        else:
+            product_change = ("update", product_id)
+            new_product = None
+
+        # A duplicate is turned away by the unique content hash, and the
+        # stock change above is rolled back with it
         cursor.execute("""
-            INSERT INTO purchases (date, item_name, quantity, unit_price, total_price)
-            VALUES (?, ?, ?, ?, ?)
-        """, (date, item_name, quantity, unit_price, total_price))
+            INSERT INTO purchases (date, item_name, quantity, unit_price, total_price, product_id, content_hash)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (content_hash) DO NOTHING
+        """, (date, item_name, quantity, unit_price, total_price, product_id,
+              migrations.content_hash(date, item_name, quantity, unit_price)))
+        if cursor.rowcount == 0:
+            raise DuplicateError("Duplicate entry detected.")
+        purchase_id = cursor.lastrowid
 
         conn.commit()
-
-        # Update available stock
-        #cursor.execute("""
-        #    UPDATE products
-        #    SET available_stock = available_stock + ?
-        #    WHERE id = ?
-        #""", (quantity, product_id))
-        #conn.commit()
+        if new_product:
+            product_catalog.added(*new_product)
+        _notify_change("purchases", "insert", purchase_id)
+        _notify_change("products", *product_change)
+        return purchase_id
 
     except Exception as e:
+        conn.rollback()
         error_logger.log_error(e)
+        raise
 
     finally:
         close_connection(conn, cursor)
@@ -226,11 +648,8 @@ def purchase_exists(date, item_name, quantity, unit_price):
     try:
         conn, cursor = connect_to_database()
 
-        cursor.execute("""
-            SELECT COUNT(*)
-            FROM purchases
-            WHERE date = ? AND item_name = ? AND quantity = ? AND unit_price = ?
-        """, (date, item_name, quantity, unit_price))
+        cursor.execute("SELECT COUNT(*) FROM purchases WHERE content_hash = ?",
+                       (migrations.content_hash(date, item_name, quantity, unit_price),))
         count = cursor.fetchone()[0]
 
     except Exception as e:
@@ -249,14 +668,20 @@ def edit_purchase(purchase_id, date, item_name, quantity, unit_price, total_pric
 
         cursor.execute("""
             UPDATE purchases
-            SET date=?, item_name=?,  quantity=?, unit_price=?, total_price=?
+            SET date=?, item_name=?,  quantity=?, unit_price=?, total_price=?, product_id=?, content_hash=?
             WHERE id=?
-        """, (date, item_name, quantity, unit_price, total_price, purchase_id))
+        """, (date, item_name, quantity, unit_price, total_price, _lookup_product_id(cursor, item_name),
+              migrations.content_hash(date, item_name, quantity, unit_price), purchase_id))
 
         conn.commit()
+        _notify_change("purchases", "update", purchase_id)
+        return purchase_id
 
     except Exception as e:
+        conn.rollback()
         error_logger.log_error(e)
+        if _is_duplicate(e):
+            raise DuplicateError("Duplicate entry detected.") from e
 
     finally:
         close_connection(conn, cursor)
@@ -267,6 +692,8 @@ def delete_purchase(purchase_id):
 
         cursor.execute("DELETE FROM purchases WHERE id=?", (purchase_id,))
         conn.commit()
+        _notify_change("purchases", "delete", purchase_id)
+        return purchase_id
 
     except Exception as e:
         error_logger.log_error(e)
@@ -314,26 +741,51 @@ def get_all_purchases():
     return purchases
 
 def add_sale(item_name, date, customer_name, quantity, unit_price):
+    try:
+        return post_sale(item_name, date, customer_name, quantity, unit_price)
+    except Exception:
+        # post_sale has already logged the error
+        return None
+
+def post_sale(item_name, date, customer_name, quantity, unit_price):
+    """Record a sale and take it out of stock in a single transaction.
+
+    Raises StockError if the product does not exist or does not have enough
+    available stock; nothing is written in that case. Returns the id of the
+    new sale.
+    """
+    conn, cursor = connect_to_database()
     try:
         total_price = quantity * unit_price  # Calculate total price
-        conn, cursor = connect_to_database()
 
-        cursor.execute("""
-            INSERT INTO sales (item_name, date, customer_name, quantity, unit_price, total_price)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (item_name, date, customer_name, quantity, unit_price, total_price))
-        conn.commit()
+        # Take the write lock up front so the stock check and the update
+        # cannot interleave with another sale of the same item
+        cursor.execute("BEGIN IMMEDIATE")
+        product_id = _change_stock(cursor, item_name,
+                                   "available_stock = available_stock - ?, sold_stock = sold_stock + ?",
+                                   (quantity, quantity), " AND available_stock >= ?", (quantity,))
+        if product_id is None:
+            cursor.execute("SELECT available_stock FROM products WHERE name = ?", (item_name,))
+            product = cursor.fetchone()
+            if product is None:
+                raise StockError(f"Product '{item_name}' does not exist.")
+            raise StockError(f"Not enough stock for '{item_name}': {product[0]} available, {quantity} requested.")
 
-        # Update available stock
         cursor.execute("""
-            UPDATE products
-            SET available_stock = available_stock - ?
-            WHERE name = ?
-        """, (quantity, item_name))
+            INSERT INTO sales (item_name, date, customer_name, quantity, unit_price, total_price, product_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (item_name, date, customer_name, quantity, unit_price, total_price, product_id))
+        sale_id = cursor.lastrowid
+
         conn.commit()
+        _notify_change("sales", "insert", sale_id)
+        _notify_change("products", "update", product_id)
+        return sale_id
 
     except Exception as e:
+        conn.rollback()
         error_logger.log_error(e)
+        raise
 
     finally:
         close_connection(conn, cursor)
@@ -365,10 +817,13 @@ def edit_sale(sale_id, date, customer_name, item_name, quantity, unit_price):
 
         cursor.execute("""
             UPDATE sales
-            SET date=?, customer_name=?, item_name=?, quantity=?, unit_price=?, total_price=?
+            SET date=?, customer_name=?, item_name=?, quantity=?, unit_price=?, total_price=?, product_id=?
             WHERE id=?
-        """, (date, customer_name, item_name, quantity, unit_price, total_price, sale_id))
+        """, (date, customer_name, item_name, quantity, unit_price, total_price,
+              _lookup_product_id(cursor, item_name), sale_id))
         conn.commit()
+        _notify_change("sales", "update", sale_id)
+        return sale_id
 
     except Exception as e:
         error_logger.log_error(e)
@@ -382,6 +837,8 @@ def delete_sale(sale_id):
 
         cursor.execute("DELETE FROM sales WHERE id=?", (sale_id,))
         conn.commit()
+        _notify_change("sales", "delete", sale_id)
+        return sale_id
 
     except Exception as e:
         error_logger.log_error(e)
@@ -437,43 +894,439 @@ def get_all_sales():
 
     return sales
 
-def calculate_profit_loss():
+def fetch_rows(table, columns, start_id=None, limit=100, inclusive=False, end_id=None, where=None, parameters=(),
+               index=None):
+    """Fetch up to `limit` rows of `table` in id order, beginning after start_id.
+
+    With inclusive=True the row with id start_id itself is included, and
+    end_id, if given, stops before that id; limit=None fetches every row in
+    the range. `where`, `parameters` and `index`, as made by build_filter(),
+    keep only the matching rows. Used by the table views to load one page at
+    a time.
+    """
+    query = f"SELECT {', '.join(columns)} FROM {table}"
+    if index:
+        query += f" INDEXED BY {index}"
+    conditions = [f"({where})"] if where else []
+    parameters = list(parameters)
+    if start_id is not None:
+        conditions.append("id >= ?" if inclusive else "id > ?")
+        parameters.append(start_id)
+    if end_id is not None:
+        conditions.append("id < ?")
+        parameters.append(end_id)
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY id"
+    if limit is not None:
+        query += " LIMIT ?"
+        parameters.append(limit)
+
+    conn, cursor = connect_to_database()
     try:
-        conn, cursor = connect_to_database()
-
-        cursor.execute("""
-            SELECT 
-                (SELECT SUM(quantity * unit_price) FROM sales) - 
-                (SELECT SUM(quantity * unit_price) FROM purchases)
-        """)
-        result = cursor.fetchone()[0] or 0
+        cursor.execute(query, parameters)
+        return cursor.fetchall()
+    except Exception as e:
+        error_logger.log_error(e)
+        raise
+    finally:
+        close_connection(conn, cursor)
 
+# Search filters for the View Purchases / View Sales tables
+#
+# Every criterion has an index, but SQLite uses one index per table scan and
+# the tables are shown in id order, so which index (if any) should drive the
+# query depends on how many rows each criterion matches, which the planner
+# can't know for a range or a prefix. build_filter() counts the matches of
+# each criterion on its index, up to FILTER_PROBE_LIMIT, and names the index
+# of the most selective one for fetch_rows() to use; the other criteria get
+# a unary + so they are only checked against the rows that index finds. When
+# every criterion matches many rows, no index is used at all and the id-order
+# scan finds a page of matches quickly.
+
+FILTER_PROBE_LIMIT = 10000
+
+# The index behind each filterable column
+FILTERABLE_TABLES = {
+    "purchases": {
+        "date": "idx_purchases_date",
+        "item_name": "idx_purchases_item",
+        "total_price": "idx_purchases_total",
+    },
+    "sales": {
+        "date": "idx_sales_date",
+        "item_name": "idx_sales_item",
+        "customer_name": "idx_sales_customer",
+        "total_price": "idx_sales_total",
+    },
+}
+
+
+def _like_prefix(text):
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+def _range_condition(column, low, high):
+    if low is not None and high is not None:
+        return column, "{0} >= ? AND {0} <= ?", [low, high]
+    if low is not None:
+        return column, "{0} >= ?", [low]
+    return column, "{0} <= ?", [high]
+
+def build_filter(table, start_date=None, end_date=None, item_name=None, customer_name=None,
+                 min_amount=None, max_amount=None):
+    """Turn search criteria into (where, parameters, index) for fetch_rows().
+
+    Names match from the start, ignoring case; date and amount ranges
+    include both ends. Empty criteria are ignored, and with none at all the
+    result is (None, [], None).
+    """
+    if table not in FILTERABLE_TABLES:
+        raise ValueError(f"Cannot filter '{table}'. Choose one of: {', '.join(FILTERABLE_TABLES)}.")
+    indexes = FILTERABLE_TABLES[table]
+
+    conditions = []
+    if start_date or end_date:
+        conditions.append(_range_condition("date", validation.validate_date(start_date) if start_date else None,
+                                           validation.validate_date(end_date) if end_date else None))
+    for column, text in (("item_name", item_name), ("customer_name", customer_name)):
+        text = (text or "").strip()
+        if not text:
+            continue
+        if column not in indexes:
+            raise ValueError(f"{table} has no {column} column to filter on.")
+        conditions.append((column, "{0} LIKE ? ESCAPE '\\'", [_like_prefix(text)]))
+    if min_amount is not None or max_amount is not None:
+        conditions.append(_range_condition("total_price",
+                                           None if min_amount is None else validation.parse_unit_price(min_amount),
+                                           None if max_amount is None else validation.parse_unit_price(max_amount)))
+    if not conditions:
+        return None, [], None
+
+    conn, cursor = connect_to_database()
+    try:
+        counts = []
+        for column, template, condition_parameters in conditions:
+            try:
+                cursor.execute(f"SELECT count(*) FROM (SELECT 1 FROM {table} INDEXED BY {indexes[column]} "
+                               f"WHERE {template.format(column)} LIMIT ?)",
+                               [*condition_parameters, FILTER_PROBE_LIMIT])
+                counts.append(cursor.fetchone()[0])
+            except sqlite3.OperationalError:
+                # The index can't serve this pattern; leave it to the scan
+                counts.append(FILTER_PROBE_LIMIT)
     except Exception as e:
         error_logger.log_error(e)
-        result = 0
+        raise
+    finally:
+        close_connection(conn, cursor)
 
+    driving = min(range(len(conditions)), key=counts.__getitem__)
+    if counts[driving] >= FILTER_PROBE_LIMIT:
+        driving = None
+    where = []
+    parameters = []
+    for i, (column, template, condition_parameters) in enumerate(conditions):
+        where.append(template.format(column if i == driving else "+" + column))
+        parameters.extend(condition_parameters)
+    index = None if driving is None else indexes[conditions[driving][0]]
+    return " AND ".join(where), parameters, index
+
+# Full-text search
+#
+# search_index is an FTS5 table over the customer, debtor and creditor names
+# and the item names of sales, purchases, debtors and debts; triggers on
+# those tables keep it up to date (see migrations.SEARCH_SOURCES). Every word
+# typed matches as a prefix, and results are ranked by bm25 with name
+# matches counting double. rowid is id * 8 + a code for the table, so the
+# highest rowids are roughly the newest rows.
+
+SEARCH_LIMIT = 50
+SEARCH_CANDIDATES = 2000
+
+# The columns search() reports for each source table: (date, quantity, total)
+SEARCH_DETAILS = {
+    "sales": ("date", "quantity", "total_price"),
+    "purchases": ("date", "quantity", "total_price"),
+    "debtors": ("date", "quantity", "total"),
+    "debts": ("date", "quantity", "total"),
+}
+
+
+def _match_expression(text):
+    # Quoting each word keeps FTS5 query syntax (AND, NEAR, "-", ...) out of it
+    return " ".join(f'"{word}"*' for word in re.findall(r"\w+", text))
+
+def search(text, limit=SEARCH_LIMIT):
+    """Search every table's names and items, best matches first.
+
+    Returns (table, id, name, item, date, quantity, total) tuples.
+    """
+    expression = _match_expression(text)
+    if not expression:
+        return []
+    sources = {code: table for table, (code, _, _) in migrations.SEARCH_SOURCES.items()}
+
+    conn, cursor = connect_to_database()
+    try:
+        # Only the most recent SEARCH_CANDIDATES matches are ranked; scoring
+        # every row that "c" matches in a large table takes about a second
+        cursor.execute("""
+            SELECT rowid, name, item FROM (
+                SELECT rowid, name, item, bm25(search_index, 2.0, 1.0) AS score FROM search_index
+                WHERE search_index MATCH ?
+                ORDER BY rowid DESC
+                LIMIT ?
+            )
+            ORDER BY score
+            LIMIT ?""", (expression, SEARCH_CANDIDATES, limit))
+        matches = [(sources[rowid % 8], rowid // 8, name, item) for rowid, name, item in cursor.fetchall()]
+
+        details = {}
+        for table in {match[0] for match in matches}:
+            ids = [match[1] for match in matches if match[0] == table]
+            columns = ", ".join(SEARCH_DETAILS[table])
+            cursor.execute(f"SELECT id, {columns} FROM {table} WHERE id IN ({', '.join('?' * len(ids))})", ids)
+            details.update(((table, row[0]), row[1:]) for row in cursor.fetchall())
+    except Exception as e:
+        error_logger.log_error(e)
+        raise
     finally:
         close_connection(conn, cursor)
 
-    return result
+    return [match + details[match[:2]] for match in matches if match[:2] in details]
+
+def rebuild_search_index():
+    """Re-create search_index from the tables, e.g. after editing the database by hand."""
+    with DatabaseConnection() as (conn, cursor):
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("DELETE FROM search_index")
+        for table, (code, name_column, item_column) in migrations.SEARCH_SOURCES.items():
+            cursor.execute(f"""
+                INSERT INTO search_index (rowid, name, item)
+                SELECT id * 8 + {code}, {name_column or "NULL"}, {item_column} FROM {table}""")
+        cursor.execute("INSERT INTO search_index (search_index) VALUES ('optimize')")
+        conn.commit()
 
-def add_debtor(name, item, date, quantity, unit_price):
+# Summaries
+#
+# daily_summary, monthly_summary and product_summary hold the revenue, cost,
+# margin and quantities of sales and purchases per day, per month (YYYY-MM)
+# and per item. Triggers on sales and purchases keep them up to date (see
+# migrations.SUMMARY_TABLES), so a report over a date range reads one row per
+# day or month instead of every transaction in it.
+
+SUMMARY_FIELDS = "revenue, cost, margin, quantity_sold, quantity_bought"
+
+
+def _date_range(column, start, end):
+    conditions = []
+    parameters = []
+    if start:
+        conditions.append(f"{column} >= ?")
+        parameters.append(start)
+    if end:
+        conditions.append(f"{column} <= ?")
+        parameters.append(end)
+    return (" WHERE " + " AND ".join(conditions) if conditions else ""), parameters
+
+def _whole_months(start_date, end_date):
+    # The whole months inside [start_date, end_date] as (first, last) YYYY-MM, None for an open end
+    first = last = None
+    if start_date:
+        first = start_date[:7] if start_date.endswith("-01") else _next_month(start_date[:7])
+    if end_date:
+        last = end_date[:7] if end_date == _last_day(end_date[:7]) else _previous_month(end_date[:7])
+    if first and last and first > last:
+        return None
+    return first, last
+
+def _next_month(month):
+    year, number = int(month[:4]), int(month[5:7])
+    return f"{year + number // 12:04d}-{number % 12 + 1:02d}"
+
+def _previous_month(month):
+    year, number = int(month[:4]), int(month[5:7])
+    return f"{year - (number == 1):04d}-{(number - 2) % 12 + 1:02d}"
+
+def _last_day(month):
+    return (datetime.date.fromisoformat(_next_month(month) + "-01") - datetime.timedelta(days=1)).isoformat()
+
+def _next_day(date):
+    return (datetime.date.fromisoformat(date) + datetime.timedelta(days=1)).isoformat()
+
+def calculate_profit_loss(start_date=None, end_date=None):
+    """Revenue minus cost of everything sold and bought between two dates, inclusive.
+
+    Whole months come from monthly_summary and the days on either side of
+    them from daily_summary, so the cost depends on the length of the range,
+    not on the number of transactions in it.
+    """
     try:
+        start_date = validation.validate_date(start_date) if start_date else None
+        end_date = validation.validate_date(end_date) if end_date else None
         conn, cursor = connect_to_database()
+        try:
+            months = _whole_months(start_date, end_date)
+            if months is None:
+                where, parameters = _date_range("date", start_date, end_date)
+                cursor.execute(f"SELECT SUM(margin) FROM daily_summary{where}", parameters)
+                result = cursor.fetchone()[0] or 0
+            else:
+                first, last = months
+                where, parameters = _date_range("month", first, last)
+                cursor.execute(f"SELECT SUM(margin) FROM monthly_summary{where}", parameters)
+                result = cursor.fetchone()[0] or 0
+                # The part-months before and after
+                conditions = []
+                parameters = []
+                if first:
+                    conditions.append("date < ?")
+                    parameters.append(first + "-01")
+                if last:
+                    conditions.append("date > ?")
+                    parameters.append(_last_day(last))
+                if conditions:
+                    where, range_parameters = _date_range("date", start_date, end_date)
+                    where = (where + " AND " if where else " WHERE ") + "(" + " OR ".join(conditions) + ")"
+                    cursor.execute(f"SELECT SUM(margin) FROM daily_summary{where}", range_parameters + parameters)
+                    result += cursor.fetchone()[0] or 0
+        finally:
+            close_connection(conn, cursor)
 
-        # Check if debtor already exists
-        if debtor_exists(name, item, date, quantity, unit_price):
-            print("Debtor already exists.")  # You can log this message or handle it as needed
-            return
+    except Exception as e:
+        error_logger.log_error(e)
+        result = 0
 
-        total = quantity * unit_price  # Calculate the total
-        cursor.execute('''INSERT INTO debtors (name, item, date, quantity, unit_price, total) VALUES (?, ?, ?, ?, ?, ?)''', (name, item, date, quantity, unit_price, total))
+    return result
+
+def get_daily_summary(start_date=None, end_date=None):
+    """(date, revenue, cost, margin, quantity sold, quantity bought) for each day with any activity."""
+    where, parameters = _date_range("date", start_date, end_date)
+    with DatabaseConnection() as (conn, cursor):
+        cursor.execute(f"SELECT date, {SUMMARY_FIELDS} FROM daily_summary{where} ORDER BY date", parameters)
+        return cursor.fetchall()
+
+def get_monthly_summary(start_month=None, end_month=None):
+    """(month, revenue, cost, margin, quantity sold, quantity bought) per YYYY-MM month."""
+    where, parameters = _date_range("month", start_month, end_month)
+    with DatabaseConnection() as (conn, cursor):
+        cursor.execute(f"SELECT month, {SUMMARY_FIELDS} FROM monthly_summary{where} ORDER BY month", parameters)
+        return cursor.fetchall()
+
+def get_product_summary(limit=None):
+    """(item name, revenue, cost, margin, quantity sold, quantity bought), highest revenue first."""
+    query = f"SELECT item_name, {SUMMARY_FIELDS} FROM product_summary ORDER BY revenue DESC, item_name"
+    parameters = []
+    if limit is not None:
+        query += " LIMIT ?"
+        parameters.append(limit)
+    with DatabaseConnection() as (conn, cursor):
+        cursor.execute(query, parameters)
+        return cursor.fetchall()
+
+def rebuild_summaries():
+    """Recompute the summary and balance tables, e.g. after editing the database by hand."""
+    with DatabaseConnection() as (conn, cursor):
+        cursor.execute("BEGIN IMMEDIATE")
+        migrations.fill_summaries(cursor)
+        migrations.fill_balances(cursor)
         conn.commit()
+
+# Reports
+#
+# Everything the Reports tab shows, read from the summary and balance tables
+# (and products, which has one row per item) so it costs the same on a
+# multi-year database as on a new one.
+
+REPORT_DAYS = 30
+REPORT_ROWS = 10
+
+def _report_sales_by_day(cursor, days, limit):
+    # The last `days` days up to the most recent one with any activity
+    cursor.execute("""
+        SELECT date, revenue, cost FROM daily_summary
+        WHERE date > date((SELECT MAX(date) FROM daily_summary), ?)
+        ORDER BY date""", (f"-{int(days)} days",))
+    return cursor.fetchall()
+
+def _report_top_items(cursor, days, limit):
+    cursor.execute("""
+        SELECT item_name, revenue, margin, quantity_sold FROM product_summary
+        WHERE sales_count > 0 ORDER BY revenue DESC, item_name LIMIT ?""", (limit,))
+    return cursor.fetchall()
+
+def _report_stock_turnover(cursor, days, limit):
+    # Units sold over units still in stock; NULL when nothing is left
+    cursor.execute("""
+        SELECT products.name, products.available_stock, COALESCE(summary.quantity_sold, 0),
+               COALESCE(summary.quantity_sold, 0) * 1.0 / NULLIF(products.available_stock, 0) AS turnover
+        FROM products LEFT JOIN product_summary AS summary ON summary.item_name = products.name
+        ORDER BY turnover IS NULL, turnover DESC, products.name LIMIT ?""", (limit,))
+    return cursor.fetchall()
+
+def _report_balances(table):
+    def read(cursor, days, limit):
+        cursor.execute(f"""
+            SELECT name, balance, entries FROM {table}
+            WHERE balance != 0 ORDER BY balance DESC, name LIMIT ?""", (limit,))
+        return cursor.fetchall()
+    return read
+
+REPORT_SECTIONS = {
+    "sales_by_day": _report_sales_by_day,
+    "top_items": _report_top_items,
+    "stock_turnover": _report_stock_turnover,
+    "debtor_balances": _report_balances("debtor_balances"),
+    "creditor_exposure": _report_balances("creditor_balances"),
+}
+
+# Which sections a change to each table can affect
+REPORT_DEPENDENCIES = {
+    "sales": ("sales_by_day", "top_items", "stock_turnover"),
+    "purchases": ("sales_by_day", "top_items", "stock_turnover"),
+    "products": ("stock_turnover",),
+    "debtors": ("debtor_balances",),
+    "debts": ("creditor_exposure",),
+}
+
+def get_report(sections=None, days=REPORT_DAYS, limit=REPORT_ROWS):
+    """Return {section: rows} for the given REPORT_SECTIONS names (all of them by default)."""
+    with DatabaseConnection() as (conn, cursor):
+        return {section: REPORT_SECTIONS[section](cursor, days, limit)
+                for section in (sections or REPORT_SECTIONS)}
+
+def add_debtor(name, item, date, quantity, unit_price):
+    try:
+        debtor_id = post_debtor(name, item, date, quantity, unit_price)
         print("Debtor added successfully.")
+        return debtor_id
+
+    except DuplicateError:
+        print("Debtor already exists.")  # You can log this message or handle it as needed
 
     except Exception as e:
         print("Error adding debtor:", e)
+
+def post_debtor(name, item, date, quantity, unit_price):
+    """Record a debtor; raises DuplicateError if the same entry is already recorded."""
+    conn, cursor = connect_to_database()
+    try:
+        total = quantity * unit_price  # Calculate the total
+        cursor.execute('''INSERT INTO debtors (name, item, date, quantity, unit_price, total, product_id, content_hash)
+                          VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (content_hash) DO NOTHING''',
+                       (name, item, date, quantity, unit_price, total, _lookup_product_id(cursor, item),
+                        migrations.content_hash(name, item, date, quantity, unit_price)))
+        if cursor.rowcount == 0:
+            raise DuplicateError("Debtor already exists.")
+        debtor_id = cursor.lastrowid
+        conn.commit()
+        _notify_change("debtors", "insert", debtor_id)
+        return debtor_id
+
+    except Exception as e:
+        conn.rollback()
         error_logger.log_error(e)
+        raise
 
     finally:
         close_connection(conn, cursor)
@@ -482,7 +1335,8 @@ def add_debtor(name, item, date, quantity, unit_price):
 def debtor_exists(name, item, date, quantity, unit_price):
     try:
         conn, cursor = connect_to_database()
-        cursor.execute("SELECT COUNT(*) FROM debtors WHERE name=? AND item=? AND date=? AND quantity=? AND unit_price=?", (name, item, date, quantity, unit_price))
+        cursor.execute("SELECT COUNT(*) FROM debtors WHERE content_hash=?",
+                       (migrations.content_hash(name, item, date, quantity, unit_price),))
         count = cursor.fetchone()[0]
         return count > 0
     except Exception as e:
@@ -496,11 +1350,18 @@ def update_debtor(debtor_id, name, item, date, quantity, unit_price):
         total = quantity * unit_price  # Calculate the total
         conn, cursor = connect_to_database()
 
-        cursor.execute('''UPDATE debtors SET name=?, item=?, date=?, quantity=?, unit_price=?, total=? WHERE id=?''', (name, item, date, quantity, unit_price, total, debtor_id))
+        cursor.execute('''UPDATE debtors SET name=?, item=?, date=?, quantity=?, unit_price=?, total=?, product_id=?, content_hash=? WHERE id=?''',
+                       (name, item, date, quantity, unit_price, total, _lookup_product_id(cursor, item),
+                        migrations.content_hash(name, item, date, quantity, unit_price), debtor_id))
         conn.commit()
+        _notify_change("debtors", "update", debtor_id)
+        return debtor_id
 
     except Exception as e:
+        conn.rollback()
         error_logger.log_error(e)
+        if _is_duplicate(e):
+            raise DuplicateError("Debtor already exists.") from e
 
     finally:
         close_connection(conn, cursor)
@@ -510,6 +1371,8 @@ def delete_debtor(debtor_id):
         conn, cursor = connect_to_database()
         cursor.execute('''DELETE FROM debtors WHERE id=?''', (debtor_id,))
         conn.commit()
+        _notify_change("debtors", "delete", debtor_id)
+        return debtor_id
     except Exception as e:
         error_logger.log_error(e)
 
@@ -532,8 +1395,11 @@ def add_debt(creditor, date, goods_purchased, quantity, unit_price):
         total = quantity * unit_price  # Calculate the total
         conn, cursor = connect_to_database()
 
-        cursor.execute('''INSERT INTO debts (creditor, date, goods_purchased, quantity, unit_price, total) VALUES (?, ?, ?, ?, ?, ?)''', (creditor, date, goods_purchased, quantity, unit_price, total))
+        cursor.execute('''INSERT INTO debts (creditor, date, goods_purchased, quantity, unit_price, total, product_id) VALUES (?, ?, ?, ?, ?, ?, ?)''', (creditor, date, goods_purchased, quantity, unit_price, total, _lookup_product_id(cursor, goods_purchased)))
+        debt_id = cursor.lastrowid
         conn.commit()
+        _notify_change("debts", "insert", debt_id)
+        return debt_id
 
     except Exception as e:
         error_logger.log_error(e)
@@ -544,8 +1410,10 @@ def add_debt(creditor, date, goods_purchased, quantity, unit_price):
 def update_debt(debt_id, creditor, date, goods_purchased, quantity, unit_price, total):
     try:
         conn, cursor = connect_to_database()
-        cursor.execute('''UPDATE debts SET creditor=?, date=?, goods_purchased=?, quantity=?, unit_price=?, total=? WHERE id=?''', (creditor, date, goods_purchased, quantity, unit_price, total, debt_id))
+        cursor.execute('''UPDATE debts SET creditor=?, date=?, goods_purchased=?, quantity=?, unit_price=?, total=?, product_id=? WHERE id=?''', (creditor, date, goods_purchased, quantity, unit_price, total, _lookup_product_id(cursor, goods_purchased), debt_id))
         conn.commit()
+        _notify_change("debts", "update", debt_id)
+        return debt_id
     except Exception as e:
         error_logger.log_error(e)
 
@@ -557,6 +1425,8 @@ def delete_debt(debt_id):
         conn, cursor = connect_to_database()
         cursor.execute('''DELETE FROM debts WHERE id=?''', (debt_id,))
         conn.commit()
+        _notify_change("debts", "delete", debt_id)
+        return debt_id
     except Exception as e:
         error_logger.log_error(e)
 
@@ -605,15 +1475,176 @@ def get_user(username):
     finally:
         close_connection(conn, cursor)
 
+# Activity log
+#
+# log_activity() only queues the entry; ActivityLogWriter writes the queue out
+# in batches, so auditing an action costs no commit of its own.
+
+ACTIVITY_QUEUE_SIZE = 10000
+ACTIVITY_BATCH_SIZE = 500
+ACTIVITY_FLUSH_INTERVAL = 1.0  # seconds from the first queued entry to its write
+ACTIVITY_PUT_TIMEOUT = 5.0
+ACTIVITY_WRITE_ATTEMPTS = 3
+ACTIVITY_LOG_RETENTION_DAYS = 365
+ACTIVITY_ROTATE_INTERVAL = 24 * 60 * 60
+
+_STOP = object()
+
+def _utc_timestamp(seconds=None):
+    # The format and time zone of SQLite's CURRENT_TIMESTAMP
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(seconds))
+
+def _write_activity_entries(entries):
+    for attempt in range(ACTIVITY_WRITE_ATTEMPTS):
+        try:
+            with DatabaseConnection() as (conn, cursor):
+                cursor.execute("BEGIN IMMEDIATE")
+                cursor.executemany("INSERT INTO activity_logs (timestamp, username, action) VALUES (?, ?, ?)",
+                                   entries)
+                conn.commit()
+            return
+        except Exception as e:
+            error_logger.log_error(e)
+            time.sleep(0.1 * (attempt + 1))
+
+
+class ActivityLogWriter(threading.Thread):
+    """Background thread that writes queued activity log entries in batches.
+
+    Whatever has queued up is written in one transaction once batch_size
+    entries are waiting or flush_interval seconds after the first of them.
+    When the queue is full, log_activity() waits for room: the log slows its
+    callers down rather than dropping entries or growing without bound.
+    Every rotate_interval seconds old entries are moved to the archive (see
+    rotate_activity_logs).
+    """
+
+    def __init__(self, max_queued=ACTIVITY_QUEUE_SIZE, batch_size=ACTIVITY_BATCH_SIZE,
+                 flush_interval=ACTIVITY_FLUSH_INTERVAL, rotate_interval=ACTIVITY_ROTATE_INTERVAL):
+        super().__init__(name="activity-log", daemon=True)
+        self.queue = queue.Queue(max_queued)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rotate_interval = rotate_interval
+        self.next_rotation = time.monotonic()
+
+    def submit(self, entry, timeout=ACTIVITY_PUT_TIMEOUT):
+        """Queue (timestamp, username, action); raises queue.Full if there is no room within timeout."""
+        self.queue.put(entry, timeout=timeout)
+
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while batch[-1] is not _STOP and len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            entries = [entry for entry in batch if entry is not _STOP]
+            if entries:
+                _write_activity_entries(entries)
+            for _ in batch:
+                self.queue.task_done()
+            if batch[-1] is _STOP:
+                return
+
+            if time.monotonic() >= self.next_rotation:
+                self.next_rotation = time.monotonic() + self.rotate_interval
+                try:
+                    rotate_activity_logs()
+                except Exception as e:
+                    error_logger.log_error(e)
+
+    def flush(self):
+        """Wait until everything queued so far has been written."""
+        if self.is_alive():
+            self.queue.join()
+
+    def stop(self):
+        if self.is_alive():
+            self.queue.put(_STOP)
+            self.join()
+
+
+_activity_log_writer = None
+_activity_log_writer_lock = threading.Lock()
+
+def get_activity_log_writer():
+    global _activity_log_writer
+    with _activity_log_writer_lock:
+        if _activity_log_writer is None or not _activity_log_writer.is_alive():
+            _activity_log_writer = ActivityLogWriter()
+            _activity_log_writer.start()
+        return _activity_log_writer
+
+def stop_activity_log_writer():
+    """Write out everything still queued and stop the writer thread; the next log_activity() starts a new one."""
+    global _activity_log_writer
+    with _activity_log_writer_lock:
+        writer, _activity_log_writer = _activity_log_writer, None
+    if writer is not None:
+        writer.stop()
+
+def flush_activity_log():
+    writer = _activity_log_writer
+    if writer is not None:
+        writer.flush()
+
 def log_activity(username, action):
+    entry = (_utc_timestamp(), username, action)
     try:
-        conn, cursor = connect_to_database()
-        cursor.execute("INSERT INTO activity_logs (username, action) VALUES (?, ?)", (username, action))
-        conn.commit()
+        get_activity_log_writer().submit(entry)
+    except queue.Full as e:
+        # The writer has fallen far behind; write this one directly rather than lose it
+        error_logger.log_error(e)
+        _write_activity_entries([entry])
     except Exception as e:
         error_logger.log_error(e)
-    finally:
-        close_connection(conn, cursor)
+
+def activity_archive_file():
+    return os.path.splitext(DATABASE_FILE)[0] + "-activity-archive.db"
+
+def rotate_activity_logs(keep_days=ACTIVITY_LOG_RETENTION_DAYS, archive_file=None):
+    """Move activity log entries older than keep_days into an archive database.
+
+    The archive is an SQLite file next to the database (activity_archive_file())
+    with its own activity_logs table. Returns the number of entries moved.
+    """
+    cutoff = _utc_timestamp(time.time() - keep_days * 24 * 60 * 60)
+    with DatabaseConnection() as (conn, cursor):
+        cursor.execute("SELECT 1 FROM activity_logs WHERE timestamp < ? LIMIT 1", (cutoff,))
+        if cursor.fetchone() is None:
+            return 0
+        cursor.execute("ATTACH DATABASE ? AS archive", (archive_file or activity_archive_file(),))
+        try:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS archive.activity_logs (
+                    id INTEGER PRIMARY KEY,
+                    timestamp TIMESTAMP,
+                    username TEXT NOT NULL,
+                    action TEXT NOT NULL
+                )""")
+            cursor.execute("BEGIN IMMEDIATE")
+            # The copy and the delete are not atomic across two files in WAL
+            # mode; entries keep their ids, so a rotation interrupted between
+            # them is simply repeated next time
+            cursor.execute("""
+                INSERT OR IGNORE INTO archive.activity_logs (id, timestamp, username, action)
+                SELECT id, timestamp, username, action FROM main.activity_logs WHERE timestamp < ?""", (cutoff,))
+            cursor.execute("DELETE FROM main.activity_logs WHERE timestamp < ?", (cutoff,))
+            moved = cursor.rowcount
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.execute("DETACH DATABASE archive")
+    return moved
 
 def get_all_users():
     try:
@@ -657,3 +1688,515 @@ def revoke_permissions(username):
         error_logger.log_error(e)
     finally:
         close_connection(conn, cursor)
+
+# The users columns that hold a permission flag
+USER_PERMISSIONS = ("has_permissions",)
+
+USER_UPDATE_CHUNK_SIZE = 500
+
+def set_user_permissions(usernames, **permissions):
+    """Set permission flags, e.g. has_permissions=True, for several users in one transaction.
+
+    Returns the usernames whose flags actually changed; users that already
+    had the requested values, or do not exist, are left out.
+    """
+    unknown = set(permissions) - set(USER_PERMISSIONS)
+    if unknown:
+        raise ValueError(f"Unknown permission: {', '.join(sorted(unknown))}.")
+    if not permissions:
+        return []
+    usernames = list(usernames)
+    assignments = ", ".join(f"{column} = ?" for column in permissions)
+    differs = " OR ".join(f"{column} IS NOT ?" for column in permissions)
+    values = [int(bool(granted)) for granted in permissions.values()]
+    updated = []
+    with DatabaseConnection() as (conn, cursor):
+        cursor.execute("BEGIN IMMEDIATE")
+        for start in range(0, len(usernames), USER_UPDATE_CHUNK_SIZE):
+            chunk = usernames[start:start + USER_UPDATE_CHUNK_SIZE]
+            cursor.execute(f"UPDATE users SET {assignments} WHERE username IN ({', '.join('?' * len(chunk))}) "
+                           f"AND ({differs}) RETURNING username", values + chunk + values)
+            updated.extend(row[0] for row in cursor.fetchall())
+        conn.commit()
+    return updated
+
+# Keyset pagination
+#
+# The get_*_page functions return (rows, token): one page of a table and a
+# continuation token for the page after it, or None once the last page has
+# been returned. Pass the token back to carry on where the page ended. Pages
+# are found with WHERE (key) > (last key seen) on an index rather than with
+# OFFSET, so page 1000 costs the same as page 1 and rows added or deleted
+# meanwhile never shift later pages. order="date" pages by (date, id)
+# instead of by id; a token only resumes the order it was made for.
+
+DEFAULT_PAGE_SIZE = 100
+
+PAGE_ORDERS = {
+    "id": ("id",),
+    "date": ("date", "id"),
+}
+
+
+def encode_page_token(order, key):
+    return base64.urlsafe_b64encode(json.dumps([order, list(key)]).encode("utf-8")).decode("ascii")
+
+def decode_page_token(token, order, key_columns=None):
+    try:
+        token_order, key = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+    except (ValueError, TypeError, AttributeError):
+        raise ValueError("Invalid page token.")
+    if token_order != order or not isinstance(key, list) or len(key) != len(key_columns or PAGE_ORDERS[order]):
+        raise ValueError(f"This page token does not continue a page ordered by {order}.")
+    return key
+
+def _fetch_page(table, columns, page_size, token, order):
+    if order not in PAGE_ORDERS:
+        raise ValueError(f"Cannot page {table} by '{order}'. Choose one of: {', '.join(PAGE_ORDERS)}.")
+    if page_size < 1:
+        raise ValueError("Page size must be at least 1.")
+    key_columns = PAGE_ORDERS[order]
+    if any(column not in columns for column in key_columns):
+        raise ValueError(f"{table} cannot be paged by {order}.")
+
+    query = f"SELECT {', '.join(columns)} FROM {table}"
+    parameters = []
+    if token is not None:
+        query += f" WHERE ({', '.join(key_columns)}) > ({', '.join('?' * len(key_columns))})"
+        parameters.extend(decode_page_token(token, order))
+    # One row more than asked for tells us whether there is a next page
+    query += f" ORDER BY {', '.join(key_columns)} LIMIT ?"
+    parameters.append(page_size + 1)
+
+    conn, cursor = connect_to_database()
+    try:
+        cursor.execute(query, parameters)
+        rows = cursor.fetchall()
+    except Exception as e:
+        error_logger.log_error(e)
+        raise
+    finally:
+        close_connection(conn, cursor)
+
+    if len(rows) <= page_size:
+        return rows, None
+    rows = rows[:page_size]
+    positions = [columns.index(column) for column in key_columns]
+    return rows, encode_page_token(order, [rows[-1][position] for position in positions])
+
+def get_products_page(page_size=DEFAULT_PAGE_SIZE, token=None):
+    return _fetch_page("products", ["id", "name", "stock", "sold_stock", "available_stock"], page_size, token, "id")
+
+def get_purchases_page(page_size=DEFAULT_PAGE_SIZE, token=None, order="id"):
+    # Same row shape as get_all_purchases()
+    return _fetch_page("purchases", ["id", "date", "item_name", "quantity", "unit_price", "quantity * unit_price"],
+                       page_size, token, order)
+
+def get_sales_page(page_size=DEFAULT_PAGE_SIZE, token=None, order="id"):
+    return _fetch_page("sales", ["id", "item_name", "date", "customer_name", "quantity", "unit_price", "total_price"],
+                       page_size, token, order)
+
+def get_debtors_page(page_size=DEFAULT_PAGE_SIZE, token=None, order="id"):
+    return _fetch_page("debtors", ["id", "name", "item", "date", "quantity", "unit_price", "total"],
+                       page_size, token, order)
+
+def get_debts_page(page_size=DEFAULT_PAGE_SIZE, token=None, order="id"):
+    return _fetch_page("debts", ["id", "creditor", "date", "goods_purchased", "quantity", "unit_price", "total"],
+                       page_size, token, order)
+
+def get_users_page(page_size=DEFAULT_PAGE_SIZE, token=None):
+    # Unlike get_all_users(), leaves out the password hashes
+    return _fetch_page("users", ["id", "username", "is_admin", "has_permissions"], page_size, token, "id")
+
+# Newest first. username is part of the key so that idx_activity_logs_time_user
+# hands the rows over already in page order
+ACTIVITY_LOG_KEY = ("timestamp", "username", "id")
+
+def get_activity_log(page_size=DEFAULT_PAGE_SIZE, token=None, username=None, action=None,
+                     start_date=None, end_date=None):
+    """Return one page of (id, timestamp, username, action) rows, newest first, and the token for the next.
+
+    username must match exactly and action anywhere in the text, ignoring
+    case. start_date and end_date (YYYY-MM-DD, UTC like the timestamps)
+    include both days.
+    """
+    if page_size < 1:
+        raise ValueError("Page size must be at least 1.")
+    conditions, parameters = [], []
+    if username:
+        conditions.append("username = ?")
+        parameters.append(username)
+    if action and action.strip():
+        conditions.append("action LIKE ? ESCAPE '\\'")
+        parameters.append("%" + _like_prefix(action.strip()))
+    if start_date:
+        conditions.append("timestamp >= ?")
+        parameters.append(validation.validate_date(start_date))
+    if end_date:
+        conditions.append("timestamp < ?")
+        parameters.append(_next_day(validation.validate_date(end_date)))
+    if token is not None:
+        conditions.append(f"({', '.join(ACTIVITY_LOG_KEY)}) < (?, ?, ?)")
+        parameters.extend(decode_page_token(token, "activity", ACTIVITY_LOG_KEY))
+
+    query = "SELECT id, timestamp, username, action FROM activity_logs"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += f" ORDER BY {' DESC, '.join(ACTIVITY_LOG_KEY)} DESC LIMIT ?"
+    parameters.append(page_size + 1)
+
+    conn, cursor = connect_to_database()
+    try:
+        cursor.execute(query, parameters)
+        rows = cursor.fetchall()
+    except Exception as e:
+        error_logger.log_error(e)
+        raise
+    finally:
+        close_connection(conn, cursor)
+
+    if len(rows) <= page_size:
+        return rows, None
+    rows = rows[:page_size]
+    last_id, timestamp, last_user, _ = rows[-1]
+    return rows, encode_page_token("activity", [timestamp, last_user, last_id])
+
+def iter_pages(get_page, page_size=DEFAULT_PAGE_SIZE, **kwargs):
+    """Yield successive pages from one of the get_*_page functions until the last."""
+    token = None
+    while True:
+        rows, token = get_page(page_size, token, **kwargs)
+        if rows:
+            yield rows
+        if token is None:
+            return
+
+# Bulk ingestion
+#
+# Each bulk_add_* function takes an iterable of records, either dicts keyed by
+# column name or sequences in the same order as the matching add_* function.
+# Rows are validated in one pass and written in chunks of BULK_CHUNK_SIZE
+# rows, one transaction per chunk. Purchases and debtors are deduplicated by
+# the unique content_hash column: each row is inserted with ON CONFLICT DO
+# NOTHING and a row that comes back from RETURNING was new. Sales and debts
+# may legitimately repeat (the same customer buying the same item twice in a
+# day), so they are not deduplicated unless the caller asks for it. The
+# return value is a report with per-row outcomes:
+#
+#     {"inserted": 2, "duplicates": 1, "invalid": 0,
+#      "rows": [(0, "inserted", 17), (1, "duplicate", None), (2, "inserted", 18)]}
+#
+# where the third element is the new row id, or the error message for
+# invalid rows.
+#
+# To skip sales or debts that are already in the table, load their keys with
+# get_bulk_keys() and pass the set as known_keys: rows whose key is in it
+# count as duplicates, and the key of every row inserted is added to it, so
+# one set can follow an import through several calls. before_commit, if
+# given, is called with the cursor inside each chunk's transaction so the
+# caller can record its own bookkeeping atomically with the rows.
+
+BULK_CHUNK_SIZE = 5000
+# Rows per INSERT statement; well inside SQLite's limit on bound parameters
+BULK_STATEMENT_ROWS = 500
+
+
+def _validate_purchase(record):
+    return (
+        validation.validate_item_name(record["item_name"]),
+        validation.validate_date(record["date"]),
+        validation.parse_quantity(record["quantity"]),
+        validation.parse_unit_price(record["unit_price"]),
+    )
+
+def _validate_sale(record):
+    return (
+        validation.validate_item_name(record["item_name"]),
+        validation.validate_date(record["date"]),
+        validation.validate_required(record["customer_name"], "customer name"),
+        validation.parse_quantity(record["quantity"]),
+        validation.parse_unit_price(record["unit_price"]),
+    )
+
+def _validate_debtor(record):
+    return (
+        validation.validate_required(record["name"], "debtor name"),
+        validation.validate_required(record["item"], "item"),
+        validation.validate_date(record["date"]),
+        validation.parse_quantity(record["quantity"]),
+        validation.parse_unit_price(record["unit_price"]),
+    )
+
+def _validate_debt(record):
+    return (
+        validation.validate_required(record["creditor"], "creditor"),
+        validation.validate_date(record["date"]),
+        validation.validate_required(record["goods_purchased"], "goods purchased"),
+        validation.parse_quantity(record["quantity"]),
+        validation.parse_unit_price(record["unit_price"]),
+    )
+
+
+class _BulkSpec:
+    def __init__(self, table, fields, validate, insert_sql, key_sql, key_fields, item_field):
+        self.table = table
+        self.fields = fields
+        self.validate = validate
+        self.insert_sql = insert_sql
+        # Selects existing rows in the same shape as key_fields picks from a
+        # validated row, so both land in one key set. For tables with a
+        # content hash, key_fields are the DEDUPE_COLUMNS and key_sql is None.
+        self.key_sql = key_sql
+        self.key_fields = key_fields
+        self.hashed = table in migrations.DEDUPE_COLUMNS
+        # Position of the product name in a validated row
+        self.item_field = item_field
+
+    def key(self, row):
+        return tuple(row[i] for i in self.key_fields)
+
+
+PURCHASE_BULK = _BulkSpec(
+    "purchases",
+    ("item_name", "date", "quantity", "unit_price"),
+    _validate_purchase,
+    "INSERT INTO purchases (item_name, date, quantity, unit_price, total_price, product_id, content_hash) VALUES (?, ?, ?, ?, ?, ?, ?)",
+    None,
+    (1, 0, 2, 3),
+    0,
+)
+
+SALE_BULK = _BulkSpec(
+    "sales",
+    ("item_name", "date", "customer_name", "quantity", "unit_price"),
+    _validate_sale,
+    "INSERT INTO sales (item_name, date, customer_name, quantity, unit_price, total_price, product_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
+    "SELECT item_name, date, customer_name, quantity, unit_price FROM sales",
+    (0, 1, 2, 3, 4),
+    0,
+)
+
+DEBTOR_BULK = _BulkSpec(
+    "debtors",
+    ("name", "item", "date", "quantity", "unit_price"),
+    _validate_debtor,
+    "INSERT INTO debtors (name, item, date, quantity, unit_price, total, product_id, content_hash) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+    None,
+    (0, 1, 2, 3, 4),
+    1,
+)
+
+DEBT_BULK = _BulkSpec(
+    "debts",
+    ("creditor", "date", "goods_purchased", "quantity", "unit_price"),
+    _validate_debt,
+    "INSERT INTO debts (creditor, date, goods_purchased, quantity, unit_price, total, product_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
+    "SELECT creditor, date, goods_purchased, quantity, unit_price FROM debts",
+    (0, 1, 2, 3, 4),
+    2,
+)
+
+
+def _as_record(spec, record):
+    if isinstance(record, dict):
+        return record
+    return dict(zip(spec.fields, record))
+
+def _product_id_map(cursor):
+    # Names -> ids of the whole catalog; where two products share a name the lowest id wins
+    return dict(cursor.execute("SELECT name, id FROM products ORDER BY id DESC"))
+
+def _check_stock(cursor, chunk, report):
+    """Drop the sales in a chunk that would oversell or refer to an unknown product, matching post_sale().
+
+    They are marked invalid in the report. Returns the accepted rows.
+    """
+    available = {name: stock for name, stock in
+                 cursor.execute("SELECT name, available_stock FROM products ORDER BY id DESC")}
+    accepted = []
+    for index, row in chunk:
+        item_name, quantity = row[0], row[3]
+        if item_name not in available:
+            report["rows"][index] = (index, "invalid", f"Product '{item_name}' does not exist.")
+            report["invalid"] += 1
+            continue
+        if available[item_name] < quantity:
+            report["rows"][index] = (index, "invalid", f"Not enough stock for '{item_name}': {available[item_name]} available, {quantity} requested.")
+            report["invalid"] += 1
+            continue
+        available[item_name] -= quantity
+        accepted.append((index, row))
+    return accepted
+
+def _insert_rows(cursor, spec, chunk, product_ids):
+    """Insert a chunk and return (index, row, new id) for each row that was written."""
+    # Every table stores quantity * unit_price, then the product id, then
+    # the content hash if it has one
+    hashed = spec.hashed
+    values = []
+    for index, row in chunk:
+        value = row + (row[-2] * row[-1], product_ids.get(row[spec.item_field]))
+        if hashed:
+            value += (migrations.content_hash(*spec.key(row)),)
+        values.append(value)
+
+    # Several rows per INSERT rather than executemany(): the search index
+    # triggers make FTS5 write out its pending terms at the end of every
+    # statement, which costs far more than the insert itself
+    placeholders = spec.insert_sql[spec.insert_sql.index("VALUES") + len("VALUES "):]
+    written = []
+    for start in range(0, len(values), BULK_STATEMENT_ROWS):
+        batch = values[start:start + BULK_STATEMENT_ROWS]
+        statement = spec.insert_sql + f", {placeholders}" * (len(batch) - 1)
+        parameters = [value for row in batch for value in row]
+        if hashed:
+            cursor.execute(statement + " ON CONFLICT (content_hash) DO NOTHING RETURNING content_hash, id", parameters)
+            new_ids = dict(cursor.fetchall())
+            for (index, row), value in zip(chunk[start:start + BULK_STATEMENT_ROWS], batch):
+                # Pop, so a second copy within the batch counts as a duplicate
+                row_id = new_ids.pop(value[-1], None)
+                if row_id is not None:
+                    written.append((index, row, row_id))
+        else:
+            cursor.execute(statement, parameters)
+            # Rows inserted by one statement get consecutive AUTOINCREMENT ids
+            last_id = cursor.execute("SELECT last_insert_rowid()").fetchone()[0]
+            for offset, (index, row) in enumerate(chunk[start:start + len(batch)]):
+                written.append((index, row, last_id - len(batch) + 1 + offset))
+    return written
+
+def _skip_known(spec, chunk, report, known_keys):
+    # Only rows that get written join known_keys (see _write_bulk_chunk), so a
+    # row turned away as invalid does not make a later copy a duplicate
+    fresh = []
+    keys = set()
+    for index, row in chunk:
+        key = spec.key(row)
+        if key in known_keys or key in keys:
+            report["rows"][index] = (index, "duplicate", None)
+            report["duplicates"] += 1
+            continue
+        keys.add(key)
+        fresh.append((index, row))
+    return fresh
+
+def _write_bulk_chunk(conn, cursor, spec, chunk, report, known_keys=None, before_commit=None):
+    if known_keys is not None:
+        chunk = _skip_known(spec, chunk, report, known_keys)
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        if spec is SALE_BULK:
+            chunk = _check_stock(cursor, chunk, report)
+        product_ids = _product_id_map(cursor)
+        new_names = set()
+        if spec is PURCHASE_BULK:
+            # Purchases of items not in the catalog yet create the product
+            new_names = {row[0] for index, row in chunk if row[0] not in product_ids}
+            cursor.executemany("INSERT INTO products (name, stock, sold_stock, available_stock) VALUES (?, 0, 0, 0)",
+                               [(name,) for name in sorted(new_names)])
+            if new_names:
+                product_ids = _product_id_map(cursor)
+
+        written = _insert_rows(cursor, spec, chunk, product_ids) if chunk else []
+        for index, row, row_id in written:
+            report["rows"][index] = (index, "inserted", row_id)
+        report["inserted"] += len(written)
+        # What ON CONFLICT turned away
+        inserted = {index for index, row, row_id in written}
+        for index, row in chunk:
+            if index not in inserted:
+                report["rows"][index] = (index, "duplicate", None)
+                report["duplicates"] += 1
+
+        # Stock moves only for the rows that were written
+        changes = {}
+        for index, row, row_id in written:
+            if spec is PURCHASE_BULK or spec is SALE_BULK:
+                product_id = product_ids[row[0]]
+                changes[product_id] = changes.get(product_id, 0) + row[-2]
+        if spec is PURCHASE_BULK:
+            cursor.executemany(
+                "UPDATE products SET stock = stock + ?, available_stock = available_stock + ? WHERE id = ?",
+                [(quantity, quantity, product_id) for product_id, quantity in changes.items()])
+        elif spec is SALE_BULK:
+            cursor.executemany(
+                "UPDATE products SET available_stock = available_stock - ?, sold_stock = sold_stock + ? WHERE id = ?",
+                [(quantity, quantity, product_id) for product_id, quantity in changes.items()])
+        if before_commit is not None:
+            before_commit(cursor)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    if known_keys is not None:
+        known_keys.update(spec.key(row) for index, row, row_id in written)
+    for name in new_names:
+        product_catalog.added(product_ids[name], name)
+    # Too many rows to report one by one; open views read the tables again
+    if written:
+        _notify_change(spec.table, "reload", 0)
+        if spec is PURCHASE_BULK or spec is SALE_BULK:
+            _notify_change("products", "reload", 0)
+
+BULK_SPECS = {
+    "purchases": PURCHASE_BULK,
+    "sales": SALE_BULK,
+    "debtors": DEBTOR_BULK,
+    "debts": DEBT_BULK,
+}
+
+def get_bulk_keys(table):
+    spec = BULK_SPECS[table]
+    if spec.hashed:
+        # The unique content hash does the deduplication
+        return set()
+    with DatabaseConnection() as (conn, cursor):
+        return {spec.key(row) for row in cursor.execute(spec.key_sql)}
+
+def _bulk_insert(spec, records, chunk_size, known_keys, before_commit):
+    report = {"inserted": 0, "duplicates": 0, "invalid": 0, "rows": []}
+    conn, cursor = connect_to_database()
+    try:
+        # The unique content hash does the deduplication for hashed tables
+        if spec.hashed:
+            known_keys = None
+        chunk = []
+        for index, record in enumerate(records):
+            try:
+                row = spec.validate(_as_record(spec, record))
+            except (KeyError, ValueError) as e:
+                message = f"Missing field: {e}" if isinstance(e, KeyError) else str(e)
+                report["rows"].append((index, "invalid", message))
+                report["invalid"] += 1
+                continue
+
+            # Filled in with the outcome once the chunk is written
+            report["rows"].append(None)
+            chunk.append((index, row))
+            if len(chunk) >= chunk_size:
+                _write_bulk_chunk(conn, cursor, spec, chunk, report, known_keys, before_commit)
+                chunk = []
+
+        if chunk:
+            _write_bulk_chunk(conn, cursor, spec, chunk, report, known_keys, before_commit)
+        return report
+
+    except Exception as e:
+        error_logger.log_error(e)
+        raise
+
+    finally:
+        close_connection(conn, cursor)
+
+def bulk_add_purchases(records, chunk_size=BULK_CHUNK_SIZE, known_keys=None, before_commit=None):
+    return _bulk_insert(PURCHASE_BULK, records, chunk_size, known_keys, before_commit)
+
+def bulk_add_sales(records, chunk_size=BULK_CHUNK_SIZE, known_keys=None, before_commit=None):
+    return _bulk_insert(SALE_BULK, records, chunk_size, known_keys, before_commit)
+
+def bulk_add_debtors(records, chunk_size=BULK_CHUNK_SIZE, known_keys=None, before_commit=None):
+    return _bulk_insert(DEBTOR_BULK, records, chunk_size, known_keys, before_commit)
+
+def bulk_add_debts(records, chunk_size=BULK_CHUNK_SIZE, known_keys=None, before_commit=None):
+    return _bulk_insert(DEBT_BULK, records, chunk_size, known_keys, before_commit)
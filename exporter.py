@@ -0,0 +1,234 @@
+import argparse
+import csv
+import json
+import sys
+
+import database
+import error_logger
+import validation
+
+# Streaming export of whole tables. Rows are read EXPORT_BATCH_SIZE at a time,
+# paged by id, and written out straight away, so memory use does not depend
+# on how many years of transactions are being exported.
+
+EXPORT_BATCH_SIZE = 5000
+
+# Exportable tables and the column their date-range filter applies to. users
+# is left out on purpose: nobody outside the business needs password hashes.
+EXPORTABLE_TABLES = {
+    "products": None,
+    "purchases": "date",
+    "sales": "date",
+    "debtors": "date",
+    "debts": "date",
+    "activity_logs": "timestamp",
+}
+
+FORMATS = ("csv", "jsonl", "parquet")
+
+# Bookkeeping columns that mean nothing outside the database (content_hash is
+# the raw digest behind duplicate detection) and are never exported
+INTERNAL_COLUMNS = {"content_hash"}
+
+
+def _table_columns(cursor, table):
+    return [(row[1], (row[2] or "").upper()) for row in cursor.execute(f"PRAGMA table_info({table})")
+            if row[1] not in INTERNAL_COLUMNS]
+
+
+def _build_query(cursor, table, columns, start_date, end_date):
+    if table not in EXPORTABLE_TABLES:
+        raise ValueError(f"Cannot export '{table}'. Choose one of: {', '.join(EXPORTABLE_TABLES)}.")
+
+    table_columns = _table_columns(cursor, table)
+    declared_types = dict(table_columns)
+    if columns:
+        unknown = [column for column in columns if column not in declared_types]
+        if unknown:
+            raise ValueError(f"Unknown column(s) for {table}: {', '.join(unknown)}")
+    else:
+        columns = [name for name, _ in table_columns]
+
+    conditions = []
+    parameters = []
+    date_column = EXPORTABLE_TABLES[table]
+    if (start_date or end_date) and date_column is None:
+        raise ValueError(f"{table} has no date column to filter on.")
+    if start_date:
+        start_date = validation.validate_date(start_date)
+        conditions.append(f"{date_column} >= ?")
+        parameters.append(start_date)
+    if end_date:
+        end_date = validation.validate_date(end_date)
+        # Timestamps carry a time of day, so compare against the next day
+        conditions.append(f"{date_column} < date(?, '+1 day')")
+        parameters.append(end_date)
+
+    # id comes first so each batch can resume after the last one; see iter_batches
+    query = f"SELECT id, {', '.join(columns)} FROM {table} WHERE id > ?"
+    if conditions:
+        query += " AND " + " AND ".join(conditions)
+    query += " ORDER BY id LIMIT ?"
+    return query, parameters, columns, [declared_types[column] for column in columns]
+
+
+def _stored_types(cursor, table, columns, types):
+    """Swap INT for REAL on integer columns that hold fractional values.
+
+    Integer affinity keeps 2.5 as a REAL (debtors.unit_price is declared INT
+    but stores prices like that), and typed writers would truncate it.
+    """
+    integer_columns = [column for column, declared in zip(columns, types) if "INT" in declared]
+    if not integer_columns:
+        return types
+    checks = ", ".join(f"MAX(typeof({column}) = 'real')" for column in integer_columns)
+    fractional = dict(zip(integer_columns, cursor.execute(f"SELECT {checks} FROM {table}").fetchone()))
+    return ["REAL" if fractional.get(column) else declared for column, declared in zip(columns, types)]
+
+
+def iter_batches(table, columns=None, start_date=None, end_date=None, batch_size=EXPORT_BATCH_SIZE):
+    """Yield (column names, column types) first, then lists of up to batch_size rows."""
+    conn, cursor = database.connect_to_database()
+    try:
+        query, parameters, columns, types = _build_query(cursor, table, columns, start_date, end_date)
+        types = _stored_types(cursor, table, columns, types)
+    finally:
+        database.close_connection(conn, cursor)
+    yield columns, types
+
+    # Each batch is its own keyset query, so a long export neither holds a
+    # read transaction open (which would stall WAL checkpoints) nor a
+    # connection while the file is written.
+    last_id = -1
+    while True:
+        conn, cursor = database.connect_to_database()
+        try:
+            rows = cursor.execute(query, [last_id, *parameters, batch_size]).fetchall()
+        finally:
+            database.close_connection(conn, cursor)
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        yield [row[1:] for row in rows]
+        if len(rows) < batch_size:
+            break
+
+
+def _write_csv(path, columns, types, batches, progress):
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(columns)
+        for rows in batches:
+            writer.writerows(rows)
+            count += len(rows)
+            if progress is not None:
+                progress(count)
+    return count
+
+
+def _write_jsonl(path, columns, types, batches, progress):
+    count = 0
+    with open(path, "w", encoding="utf-8") as file:
+        for rows in batches:
+            file.writelines(json.dumps(dict(zip(columns, row))) + "\n" for row in rows)
+            count += len(rows)
+            if progress is not None:
+                progress(count)
+    return count
+
+
+def _arrow_type(pa, declared_type):
+    if "INT" in declared_type:
+        return pa.int64()
+    if any(name in declared_type for name in ("REAL", "FLOA", "DOUB")):
+        return pa.float64()
+    return pa.string()
+
+
+def _write_parquet(path, columns, types, batches, progress):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ValueError("Exporting to Parquet needs pyarrow (pip install pyarrow).")
+
+    schema = pa.schema([(column, _arrow_type(pa, declared)) for column, declared in zip(columns, types)])
+    count = 0
+    # One row group per batch keeps only a single batch in memory
+    with pq.ParquetWriter(path, schema) as writer:
+        for rows in batches:
+            arrays = [pa.array([row[i] for row in rows], type=field.type) for i, field in enumerate(schema)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            count += len(rows)
+            if progress is not None:
+                progress(count)
+    return count
+
+
+WRITERS = {
+    "csv": _write_csv,
+    "jsonl": _write_jsonl,
+    "parquet": _write_parquet,
+}
+
+
+def format_for_path(path):
+    extension = path.rsplit(".", 1)[-1].lower() if "." in path else ""
+    if extension == "json":
+        return "jsonl"
+    if extension in FORMATS:
+        return extension
+    raise ValueError(f"Cannot tell the export format from '{path}'. Use one of: {', '.join(FORMATS)}.")
+
+
+def export_table(table, path, fmt=None, columns=None, start_date=None, end_date=None,
+                 batch_size=EXPORT_BATCH_SIZE, progress=None):
+    """Write `table` to `path` as CSV, JSON Lines or Parquet and return the number of rows.
+
+    `columns` limits the export to those columns, `start_date`/`end_date`
+    (YYYY-MM-DD, both inclusive) filter on the table's date column, and
+    `progress`, if given, is called with the running row count.
+    """
+    fmt = fmt or format_for_path(path)
+    if fmt not in WRITERS:
+        raise ValueError(f"Unknown export format '{fmt}'. Use one of: {', '.join(FORMATS)}.")
+
+    batches = iter_batches(table, columns, start_date, end_date, batch_size)
+    try:
+        columns, types = next(batches)
+        return WRITERS[fmt](path, columns, types, batches, progress)
+    except Exception as e:
+        error_logger.log_error(e)
+        raise
+    finally:
+        batches.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export a Motob table without loading it into memory")
+    parser.add_argument("table", choices=sorted(EXPORTABLE_TABLES))
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=FORMATS, help="defaults to the file extension")
+    parser.add_argument("--columns", help="comma-separated list of columns to export")
+    parser.add_argument("--start", help="first date to include (YYYY-MM-DD)")
+    parser.add_argument("--end", help="last date to include (YYYY-MM-DD)")
+    args = parser.parse_args(argv)
+
+    error_logger.init_error_log()
+    database.initialize_database()
+    columns = [column.strip() for column in args.columns.split(",")] if args.columns else None
+    try:
+        count = export_table(args.table, args.path, args.format, columns, args.start, args.end)
+    except (OSError, ValueError) as e:
+        print(f"Export failed: {e}", file=sys.stderr)
+        return 1
+    finally:
+        database.shutdown_database()
+
+    print(f"Exported {count} rows from {args.table} to {args.path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,13 +5,15 @@ from PyQt5.QtWidgets import (
 )
 from PyQt5.QtCore import pyqtSlot
 import hashlib
+import sys
 import database
-from admin_gui import AdminWindow  # Import AdminWindow
-from user_gui import MainUserWindow
+from session import SessionManager
 
 class UserManagementWindow(QMainWindow):
-    def __init__(self):
+    def __init__(self, session=None):
         super().__init__()
+        # Builds the admin/user windows and the MotobApp only once someone logs in
+        self.session = session if session is not None else SessionManager()
 
         self.setWindowTitle("User Management")
 
@@ -30,7 +32,6 @@ class UserManagementWindow(QMainWindow):
         self.setup_user_login_tab()   # Setup user login tab
 
         self.setCentralWidget(self.tab_widget)
-        self.user_window = None
         self.admin_logged_in = False  # Track if admin is logged in
         self.create_account_tab.hide()  # Hide create account tab initially
 
@@ -157,8 +158,7 @@ class UserManagementWindow(QMainWindow):
             return
 
         if user[3] == 0 or (user[3] == 1 and self.admin_logged_in):  # Check if the user is a regular user or if admin is logged in
-            self.user_window = MainUserWindow(username, self.logout)
-            self.user_window.show()
+            self.session.start_user_session(username, self.logout)
             QMessageBox.information(self, "Success", f"Welcome, {username}!")
             self.hide()
         else:
@@ -171,10 +171,13 @@ class UserManagementWindow(QMainWindow):
     # Define a slot to handle logout action
     @pyqtSlot()
     def logout(self):
-        if self.user_window:
-            self.user_window.hide()
+        # The session's windows are hidden, not destroyed, so the next login reuses them
+        self.session.end_session()
+        self.admin_logged_in = False
+        self.create_account_tab.hide()
 
         self.tab_widget.setCurrentWidget(self.user_login_tab)
+        self.show()
 
     def admin_login(self):
         username = self.admin_login_username_input.text()
@@ -197,9 +200,8 @@ class UserManagementWindow(QMainWindow):
         if user[3] == 1:  # Check if the user is an admin
             self.admin_logged_in = True  # Set admin logged in
             self.create_account_tab.show()  # Show create account tab
-            # Instantiate and show the AdminWindow
-            self.admin_window = AdminWindow()
-            self.admin_window.show()
+            # Show the AdminWindow, building it on the first admin login
+            self.session.start_admin_session(username, self.logout)
             QMessageBox.information(self, "Success", f"Welcome, {username}!")
             self.hide()
         else:
@@ -0,0 +1,263 @@
+import argparse
+import csv
+import os
+import sys
+
+import database
+import error_logger
+
+# Streaming import of historical ledgers. Files are read one row at a time and
+# handed to the bulk_add_* functions in batches, so memory stays flat however
+# large the file is. After every batch the number of rows consumed is saved in
+# import_progress in the same transaction as the rows themselves, so an
+# interrupted import picks up exactly where the last batch ended. That
+# matters for sales and debts, which are not deduplicated.
+
+IMPORT_BATCH_SIZE = 2000
+
+IMPORTERS = {
+    "purchases": database.bulk_add_purchases,
+    "sales": database.bulk_add_sales,
+    "debtors": database.bulk_add_debtors,
+    "debts": database.bulk_add_debts,
+}
+
+# Alternative headers seen in the paper-receipt spreadsheets
+HEADER_ALIASES = {
+    "item": "item_name",
+    "product": "item_name",
+    "customer": "customer_name",
+    "debtor": "name",
+    "debtor_name": "name",
+    "goods": "goods_purchased",
+    "qty": "quantity",
+    "price": "unit_price",
+}
+
+
+class ImportCancelled(Exception):
+    pass
+
+
+def _header_for(table, raw_header):
+    header = []
+    for name in raw_header:
+        name = str(name or "").strip().lower().replace(" ", "_")
+        # debtors has its own "item" column, so leave that one alone
+        if not (table == "debtors" and name == "item"):
+            name = HEADER_ALIASES.get(name, name)
+        header.append(name)
+    return header
+
+
+class _CountingLines:
+    """Iterates over the lines of a text file while counting the bytes consumed."""
+
+    def __init__(self, file):
+        self.file = file
+        self.bytes_read = 0
+
+    def __iter__(self):
+        for line in self.file:
+            self.bytes_read += len(line.encode("utf-8"))
+            yield line
+
+
+def _read_csv(path):
+    with open(path, newline="", encoding="utf-8-sig") as file:
+        lines = _CountingLines(file)
+        reader = csv.reader(lines)
+        header = next(reader, None)
+        if header is None:
+            return
+        yield header, 0
+        for row in reader:
+            if any(cell.strip() for cell in row):
+                yield row, lines.bytes_read
+
+
+def _read_xlsx(path):
+    try:
+        import openpyxl
+    except ImportError:
+        raise ValueError("Importing Excel files needs openpyxl (pip install openpyxl).")
+
+    # read_only mode streams rows instead of loading the whole workbook
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.active
+        total_rows = sheet.max_row or 1
+        size = os.path.getsize(path)
+        for number, row in enumerate(sheet.iter_rows(values_only=True)):
+            if number and not any(cell is not None and str(cell).strip() for cell in row):
+                continue
+            cells = ["" if cell is None else _cell_text(cell) for cell in row]
+            # openpyxl cannot tell us how many bytes were read, so estimate
+            yield cells, size * number // total_rows
+    finally:
+        workbook.close()
+
+
+def _cell_text(cell):
+    # Spreadsheets hand dates back as datetime objects
+    if hasattr(cell, "strftime"):
+        return cell.strftime("%Y-%m-%d")
+    return str(cell)
+
+
+def _read_rows(path):
+    if path.lower().endswith((".xlsx", ".xlsm")):
+        return _read_xlsx(path)
+    return _read_csv(path)
+
+
+def _load_progress(source, table, size, mtime):
+    with database.DatabaseConnection() as (conn, cursor):
+        cursor.execute("""
+            SELECT rows_done, source_size, source_mtime FROM import_progress
+            WHERE source = ? AND target_table = ?
+        """, (source, table))
+        progress = cursor.fetchone()
+    if progress is None:
+        return 0
+    rows_done, recorded_size, recorded_mtime = progress
+    # The file has been replaced since the last attempt, start over
+    if recorded_size != size or recorded_mtime != mtime:
+        return 0
+    return rows_done
+
+
+def _save_progress(source, table, size, mtime, rows_done):
+    with database.DatabaseConnection() as (conn, cursor):
+        _record_progress(cursor, source, table, size, mtime, rows_done)
+
+
+def _record_progress(cursor, source, table, size, mtime, rows_done):
+    cursor.execute("""
+        INSERT INTO import_progress (source, target_table, source_size, source_mtime, rows_done, updated_at)
+        VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT (source, target_table) DO UPDATE SET
+            source_size = excluded.source_size,
+            source_mtime = excluded.source_mtime,
+            rows_done = excluded.rows_done,
+            updated_at = excluded.updated_at
+    """, (source, table, size, mtime, rows_done))
+
+
+def clear_progress(path, table):
+    with database.DatabaseConnection() as (conn, cursor):
+        cursor.execute("DELETE FROM import_progress WHERE source = ? AND target_table = ?",
+                       (os.path.abspath(path), table))
+
+
+def import_file(path, table, batch_size=IMPORT_BATCH_SIZE, progress=None, resume=True):
+    """Stream a CSV or Excel file into `table`.
+
+    `progress`, if given, is called after every batch as
+    progress(rows_done, bytes_read, total_bytes, totals) and may raise
+    ImportCancelled to stop; the import can be resumed later. Returns the
+    totals dict with inserted/duplicates/invalid counts, the number of rows
+    skipped because an earlier run already handled them, the first few
+    errors as (row number, message) pairs and whether it was cancelled.
+    """
+    if table not in IMPORTERS:
+        raise ValueError(f"Cannot import into '{table}'. Choose one of: {', '.join(IMPORTERS)}.")
+    bulk_add = IMPORTERS[table]
+
+    source = os.path.abspath(path)
+    size = os.path.getsize(source)
+    mtime = os.path.getmtime(source)
+    start_row = _load_progress(source, table, size, mtime) if resume else 0
+
+    totals = {"inserted": 0, "duplicates": 0, "invalid": 0, "resumed_from": start_row, "errors": [],
+              "cancelled": False}
+    rows = _read_rows(source)
+    header_row = next(rows, None)
+    if header_row is None:
+        return totals
+    header = _header_for(table, header_row[0])
+
+    rows_done = 0
+    bytes_read = 0
+    batch = []
+    def flush():
+        recorded = []
+
+        def record(cursor):
+            _record_progress(cursor, source, table, size, mtime, rows_done)
+            recorded.append(True)
+
+        # One chunk per batch, committed together with the progress. Purchases
+        # and debtors already in the database count as duplicates; repeated
+        # sales and debts are real transactions and are all inserted
+        report = bulk_add(batch, chunk_size=len(batch), before_commit=record)
+        for key in ("inserted", "duplicates", "invalid"):
+            totals[key] += report[key]
+        for index, status, detail in report["rows"]:
+            if status == "invalid" and len(totals["errors"]) < 100:
+                # +2: one for the header, one because spreadsheets count from 1
+                totals["errors"].append((rows_done - len(batch) + index + 2, detail))
+        if not recorded:
+            # Nothing valid in the batch, so no transaction was opened
+            _save_progress(source, table, size, mtime, rows_done)
+        batch.clear()
+        if progress is not None:
+            progress(rows_done, bytes_read, size, totals)
+
+    try:
+        for row, bytes_read in rows:
+            rows_done += 1
+            if rows_done <= start_row:
+                continue
+            batch.append(dict(zip(header, row)))
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+    except ImportCancelled:
+        totals["cancelled"] = True
+        return totals
+    except Exception as e:
+        error_logger.log_error(e)
+        raise
+
+    # Finished; a later import of the same file should start from the top
+    clear_progress(source, table)
+    return totals
+
+
+def _print_progress(rows_done, bytes_read, total_bytes, totals):
+    percent = 100 * bytes_read / total_bytes if total_bytes else 100
+    print(f"\r{percent:5.1f}%  {rows_done} rows  {totals['inserted']} inserted  "
+          f"{totals['duplicates']} duplicates  {totals['invalid']} invalid", end="", flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import a CSV or Excel ledger into the Motob database")
+    parser.add_argument("table", choices=sorted(IMPORTERS))
+    parser.add_argument("path")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    parser.add_argument("--restart", action="store_true", help="ignore saved progress and start from the first row")
+    args = parser.parse_args(argv)
+
+    error_logger.init_error_log()
+    database.initialize_database()
+    try:
+        totals = import_file(args.path, args.table, args.batch_size, _print_progress, resume=not args.restart)
+    except (OSError, ValueError) as e:
+        print(f"Import failed: {e}", file=sys.stderr)
+        return 1
+    finally:
+        database.shutdown_database()
+
+    print()
+    if totals["resumed_from"]:
+        print(f"Resumed after row {totals['resumed_from']}")
+    print(f"{totals['inserted']} inserted, {totals['duplicates']} duplicates, {totals['invalid']} invalid")
+    for row_number, message in totals["errors"]:
+        print(f"  row {row_number}: {message}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,10 @@
 import sys
 from PyQt5.QtWidgets import QApplication
+import async_database
 import error_logger
 from database import initialize_database, get_user
 import database
-from admin_gui import AdminWindow
+import server
 from gui import UserManagementWindow
 
 def initialize_application():
@@ -13,19 +14,34 @@ def initialize_application():
     # Initialize the database
     initialize_database()
 
+    # Keep the WAL from growing between the automatic checkpoints
+    database.start_checkpoint_scheduler()
+
 def main():
+    # Headless mode: python main.py --serve [--host H] [--port P] [--database FILE]
+    if "--serve" in sys.argv[1:]:
+        argv = [arg for arg in sys.argv[1:] if arg != "--serve"]
+        sys.exit(server.main(argv))
+
     try:
         initialize_application()
 
         app = QApplication(sys.argv)
-        user_management_window = UserManagementWindow()  # Create UserManagementWindow instance first
-        admin_window = AdminWindow()  # Don't pass any argument
-        user_management_window.admin_window = admin_window  # Set AdminWindow instance in UserManagementWindow
+        # The admin/user windows and MotobApp are built on demand after login
+        user_management_window = UserManagementWindow()
         user_management_window.show()
-        sys.exit(app.exec_())
+        exit_code = app.exec_()
 
     except Exception as e:
         error_logger.log_error(e)
+        exit_code = 1
+
+    finally:
+        # Let background database calls finish before their connections go away
+        async_database.shutdown()
+        database.shutdown_database()
+
+    sys.exit(exit_code)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,42 @@
+import argparse
+import sys
+import error_logger
+import database
+
+# Repairs for the tables the database keeps up to date with triggers. Normal
+# use never needs these; they are for databases edited by hand or restored
+# from a copy made with the triggers dropped. rotate-activity-log runs the
+# archival the activity log writer otherwise does once a day.
+COMMANDS = {
+    "rebuild-summaries": (database.rebuild_summaries, "Rebuilt the summaries and balances"),
+    "rebuild-search-index": (database.rebuild_search_index, "Rebuilt the search index"),
+    "rotate-activity-log": (database.rotate_activity_logs, "Moved {} activity log entries to the archive"),
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Repair the Motob summary tables and search index")
+    parser.add_argument("command", choices=sorted(COMMANDS))
+    parser.add_argument("--database", help=f"database file (default {database.DATABASE_FILE})")
+    args = parser.parse_args(argv)
+    if args.database:
+        database.DATABASE_FILE = args.database
+
+    error_logger.init_error_log()
+    database.initialize_database()
+    rebuild, message = COMMANDS[args.command]
+    try:
+        result = rebuild()
+    except database.sqlite3.Error as e:
+        error_logger.log_error(e)
+        print(f"{args.command} failed: {e}", file=sys.stderr)
+        return 1
+    finally:
+        database.shutdown_database()
+
+    print(message.format(result))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
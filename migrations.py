@@ -0,0 +1,453 @@
+import hashlib
+import sqlite3
+import sys
+
+# Schema changes are applied in order and recorded in PRAGMA user_version, so
+# each database knows exactly which migrations it has already seen. Add new
+# entries to the end of MIGRATIONS; never edit one that has shipped.
+
+
+def _column_names(cursor, table):
+    return [row[1] for row in cursor.execute(f"PRAGMA table_info({table})")]
+
+
+def _baseline_schema(cursor):
+    # The tables as initialize_database() used to create them. Existing
+    # databases already have them, so everything here must be idempotent.
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS products (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            stock INT NOT NULL,
+            sold_stock INT DEFAULT 0,
+            available_stock INT NOT NULL
+        )""")
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS purchases (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT NOT NULL,
+            item_name TEXT NOT NULL,
+            quantity INTEGER NOT NULL,
+            unit_price REAL NOT NULL,
+            total_price REAL NOT NULL
+        )""")
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sales (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            item_name TEXT NOT NULL,
+            date TEXT NOT NULL,
+            customer_name TEXT NOT NULL,
+            quantity INTEGER NOT NULL,
+            unit_price REAL NOT NULL
+        )""")
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS debtors (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            item TEXT NOT NULL,
+            date TEXT NOT NULL,
+            quantity INTEGER NOT NULL,
+            unit_price INT NOT NULL,
+            total REAL NOT NULL
+        )""")
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS debts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            creditor TEXT,
+            date TEXT,
+            goods_purchased TEXT,
+            quantity INTEGER,
+            unit_price REAL,
+            total REAL
+        )""")
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            is_admin INTEGER NOT NULL,
+            has_permissions INTEGER NOT NULL DEFAULT 0
+        )""")
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS activity_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            username TEXT NOT NULL,
+            action TEXT NOT NULL
+        )""")
+
+
+def _add_sales_total_price(cursor):
+    # add_sale and edit_sale write sales.total_price, but the column was only
+    # ever added by hand to the live database
+    if "total_price" not in _column_names(cursor, "sales"):
+        cursor.execute("ALTER TABLE sales ADD COLUMN total_price REAL")
+    cursor.execute("UPDATE sales SET total_price = quantity * unit_price WHERE total_price IS NULL")
+
+
+def _repair_swapped_purchases(cursor):
+    # The Add Purchase form used to pass its arguments to add_purchase() in
+    # the wrong order, so those rows have the item name in `date` and the
+    # date in `item_name`. Only touch rows where that is unambiguous.
+    cursor.execute("""
+        UPDATE purchases
+        SET date = item_name, item_name = date
+        WHERE item_name GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'
+          AND date NOT GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'
+    """)
+
+
+# Tables in the full-text search index: (code, name column, item column).
+# An entry's rowid is id * 8 + code, so a trigger can find it directly.
+SEARCH_SOURCES = {
+    "sales": (1, "customer_name", "item_name"),
+    "purchases": (2, None, "item_name"),
+    "debtors": (3, "name", "item"),
+    "debts": (4, "creditor", "goods_purchased"),
+}
+
+
+def _search_index(cursor):
+    cursor.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+            name, item, prefix = '2 3', tokenize = 'unicode61 remove_diacritics 2'
+        )""")
+    for table, (code, name_column, item_column) in SEARCH_SOURCES.items():
+        new_name = f"new.{name_column}" if name_column else "NULL"
+        watched = ", ".join(column for column in ("id", name_column, item_column) if column)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_search_insert AFTER INSERT ON {table} BEGIN
+                INSERT INTO search_index (rowid, name, item) VALUES (new.id * 8 + {code}, {new_name}, new.{item_column});
+            END""")
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_search_update AFTER UPDATE OF {watched} ON {table} BEGIN
+                DELETE FROM search_index WHERE rowid = old.id * 8 + {code};
+                INSERT INTO search_index (rowid, name, item) VALUES (new.id * 8 + {code}, {new_name}, new.{item_column});
+            END""")
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_search_delete AFTER DELETE ON {table} BEGIN
+                DELETE FROM search_index WHERE rowid = old.id * 8 + {code};
+            END""")
+        cursor.execute(f"""
+            INSERT INTO search_index (rowid, name, item)
+            SELECT id * 8 + {code}, {name_column or "NULL"}, {item_column} FROM {table}""")
+
+
+# Summary tables kept up to date by triggers on sales and purchases:
+# table -> (key column, expression giving the key from a sales/purchases row)
+SUMMARY_TABLES = {
+    "daily_summary": ("date", "{row}.date"),
+    "monthly_summary": ("month", "substr({row}.date, 1, 7)"),
+    "product_summary": ("item_name", "{row}.item_name"),
+}
+
+# What a sale or a purchase adds to its summary rows: (amount, quantity, count) columns
+SUMMARY_SOURCES = {
+    "sales": ("revenue", "quantity_sold", "sales_count"),
+    "purchases": ("cost", "quantity_bought", "purchases_count"),
+}
+
+SUMMARY_COLUMNS = ("revenue", "cost", "quantity_sold", "quantity_bought", "sales_count", "purchases_count")
+
+
+def fill_summaries(cursor):
+    """Recompute every summary row from sales and purchases. Also used by database.rebuild_summaries()."""
+    selects = []
+    for source, (amount, quantity, count) in SUMMARY_SOURCES.items():
+        values = {amount: "quantity * unit_price", quantity: "quantity", count: "1"}
+        selects.append("SELECT date, item_name, " + ", ".join(
+            f"{values.get(column, '0')} AS {column}" for column in SUMMARY_COLUMNS) + f" FROM {source}")
+    rows = " UNION ALL ".join(selects)
+    for table, (key, expression) in SUMMARY_TABLES.items():
+        cursor.execute(f"DELETE FROM {table}")
+        cursor.execute(f"""
+            INSERT INTO {table} ({key}, {", ".join(SUMMARY_COLUMNS)})
+            SELECT {expression.format(row="source")}, {", ".join(f"SUM({column})" for column in SUMMARY_COLUMNS)}
+            FROM ({rows}) AS source
+            GROUP BY 1""")
+
+
+def _summary_changes(source, row, sign):
+    # Statements adding (sign "+") or taking away (sign "-") one row's share
+    amount, quantity, count = SUMMARY_SOURCES[source]
+    statements = []
+    for table, (key, expression) in SUMMARY_TABLES.items():
+        key_value = expression.format(row=row)
+        statements.append(f"""
+                INSERT INTO {table} ({key}, {amount}, {quantity}, {count})
+                VALUES ({key_value}, {sign}{row}.quantity * {row}.unit_price, {sign}{row}.quantity, {sign}1)
+                ON CONFLICT ({key}) DO UPDATE SET
+                    {amount} = {amount} + excluded.{amount},
+                    {quantity} = {quantity} + excluded.{quantity},
+                    {count} = {count} + excluded.{count};""")
+        if sign == "-":
+            statements.append(f"""
+                DELETE FROM {table} WHERE {key} = {key_value} AND sales_count = 0 AND purchases_count = 0;""")
+    return "".join(statements)
+
+
+def _summaries(cursor):
+    for table, (key, _) in SUMMARY_TABLES.items():
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                {key} TEXT PRIMARY KEY,
+                revenue REAL NOT NULL DEFAULT 0,
+                cost REAL NOT NULL DEFAULT 0,
+                margin REAL GENERATED ALWAYS AS (revenue - cost) VIRTUAL,
+                quantity_sold INTEGER NOT NULL DEFAULT 0,
+                quantity_bought INTEGER NOT NULL DEFAULT 0,
+                sales_count INTEGER NOT NULL DEFAULT 0,
+                purchases_count INTEGER NOT NULL DEFAULT 0
+            )""")
+    for source in SUMMARY_SOURCES:
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {source}_summary_insert AFTER INSERT ON {source} BEGIN
+                {_summary_changes(source, "new", "+")}
+            END""")
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {source}_summary_update
+            AFTER UPDATE OF date, item_name, quantity, unit_price ON {source} BEGIN
+                {_summary_changes(source, "old", "-")}
+                {_summary_changes(source, "new", "+")}
+            END""")
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {source}_summary_delete AFTER DELETE ON {source} BEGIN
+                {_summary_changes(source, "old", "-")}
+            END""")
+    fill_summaries(cursor)
+
+
+
+# Outstanding balances per debtor and per creditor, kept up to date by triggers:
+# table -> (source table, name column, amount column)
+BALANCE_TABLES = {
+    "debtor_balances": ("debtors", "name", "total"),
+    "creditor_balances": ("debts", "creditor", "total"),
+}
+
+
+def fill_balances(cursor):
+    """Recompute debtor_balances and creditor_balances. Also used by database.rebuild_summaries()."""
+    for table, (source, name_column, amount_column) in BALANCE_TABLES.items():
+        cursor.execute(f"DELETE FROM {table}")
+        cursor.execute(f"""
+            INSERT INTO {table} (name, balance, entries)
+            SELECT COALESCE({name_column}, ''), SUM(COALESCE({amount_column}, 0)), COUNT(*)
+            FROM {source}
+            GROUP BY 1""")
+
+
+def _balance_change(table, name_column, amount_column, row, sign):
+    statement = f"""
+                INSERT INTO {table} (name, balance, entries)
+                VALUES (COALESCE({row}.{name_column}, ''), {sign}COALESCE({row}.{amount_column}, 0), {sign}1)
+                ON CONFLICT (name) DO UPDATE SET
+                    balance = balance + excluded.balance,
+                    entries = entries + excluded.entries;"""
+    if sign == "-":
+        statement += f"""
+                DELETE FROM {table} WHERE name = COALESCE({row}.{name_column}, '') AND entries = 0;"""
+    return statement
+
+
+def _balances(cursor):
+    for table, (source, name_column, amount_column) in BALANCE_TABLES.items():
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                name TEXT PRIMARY KEY,
+                balance REAL NOT NULL DEFAULT 0,
+                entries INTEGER NOT NULL DEFAULT 0
+            )""")
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {source}_balance_insert AFTER INSERT ON {source} BEGIN
+                {_balance_change(table, name_column, amount_column, "new", "+")}
+            END""")
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {source}_balance_update
+            AFTER UPDATE OF {name_column}, {amount_column} ON {source} BEGIN
+                {_balance_change(table, name_column, amount_column, "old", "-")}
+                {_balance_change(table, name_column, amount_column, "new", "+")}
+            END""")
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {source}_balance_delete AFTER DELETE ON {source} BEGIN
+                {_balance_change(table, name_column, amount_column, "old", "-")}
+            END""")
+    fill_balances(cursor)
+
+
+# Columns holding a copy of products.name, which product_id now points at
+PRODUCT_REFERENCES = {
+    "sales": "item_name",
+    "purchases": "item_name",
+    "debtors": "item",
+    "debts": "goods_purchased",
+}
+
+
+def _product_ids(cursor):
+    # Names are matched exactly first (the lowest id wins, as in
+    # get_product_id), then ignoring case and surrounding spaces where that
+    # picks out a single product; those rows take the product's spelling.
+    cursor.execute("CREATE TEMP TABLE product_keys (key TEXT PRIMARY KEY, id INTEGER NOT NULL)")
+    cursor.execute("""
+        INSERT INTO temp.product_keys (key, id)
+        SELECT lower(trim(name)), MIN(id) FROM products GROUP BY 1 HAVING COUNT(*) = 1""")
+    for table, column in PRODUCT_REFERENCES.items():
+        if "product_id" not in _column_names(cursor, table):
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN product_id INTEGER REFERENCES products (id) ON DELETE SET NULL")
+        cursor.execute(f"""
+            UPDATE {table} SET product_id = (SELECT MIN(id) FROM products WHERE name = {table}.{column})""")
+        cursor.execute(f"""
+            UPDATE {table} SET product_id = (SELECT id FROM temp.product_keys WHERE key = lower(trim({table}.{column})))
+            WHERE product_id IS NULL""")
+        cursor.execute(f"""
+            UPDATE {table} SET {column} = (SELECT name FROM products WHERE id = {table}.product_id)
+            WHERE product_id IS NOT NULL AND {column} != (SELECT name FROM products WHERE id = {table}.product_id)""")
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_product ON {table} (product_id)")
+    cursor.execute("DROP TABLE temp.product_keys")
+
+
+# The columns that make a row a duplicate, in the order content_hash() takes them.
+# Sales and debts may legitimately repeat, so only the bulk importer dedupes those.
+DEDUPE_COLUMNS = {
+    "purchases": ("date", "item_name", "quantity", "unit_price"),
+    "debtors": ("name", "item", "date", "quantity", "unit_price"),
+}
+
+
+def content_hash(*values):
+    """16-byte digest of a row's DEDUPE_COLUMNS values, stored in its content_hash column."""
+    # Numbers hash the same whether they were read back as 5 or passed in as 5.0
+    text = "\x1f".join(repr(float(value)) if isinstance(value, (int, float)) else str(value) for value in values)
+    return hashlib.blake2b(text.encode(), digest_size=16).digest()
+
+
+def _content_hashes(cursor):
+    cursor.connection.create_function("content_hash", -1, content_hash, deterministic=True)
+    for table, columns in DEDUPE_COLUMNS.items():
+        if "content_hash" not in _column_names(cursor, table):
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN content_hash BLOB")
+        cursor.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS idx_{table}_content_hash ON {table} (content_hash)")
+        # Where duplicates got in before, the first copy gets the hash and the
+        # others keep NULL, which the unique index ignores
+        cursor.execute(f"UPDATE OR IGNORE {table} SET content_hash = content_hash({', '.join(columns)})")
+    # Only served the COUNT(*) duplicate checks
+    cursor.execute("DROP INDEX IF EXISTS idx_purchases_date_item")
+    cursor.execute("DROP INDEX IF EXISTS idx_debtors_dedupe")
+
+MIGRATIONS = [
+    (1, "Baseline schema", _baseline_schema),
+    (2, "Add sales.total_price", _add_sales_total_price),
+    (3, "Indexes for name lookups, date/item queries and duplicate checks", [
+        # product_exists, get_product_id and the stock updates in add_sale
+        "CREATE INDEX IF NOT EXISTS idx_products_name ON products (name)",
+        "CREATE INDEX IF NOT EXISTS idx_sales_date_item ON sales (date, item_name)",
+        # Also serves purchase_exists
+        "CREATE INDEX IF NOT EXISTS idx_purchases_date_item ON purchases (date, item_name, quantity, unit_price)",
+        # debtor_exists
+        "CREATE INDEX IF NOT EXISTS idx_debtors_dedupe ON debtors (name, item, date, quantity, unit_price)",
+    ]),
+    (4, "Repair purchases stored with date and item name swapped", _repair_swapped_purchases),
+    (5, "Track progress of resumable imports", [
+        """CREATE TABLE IF NOT EXISTS import_progress (
+            source TEXT NOT NULL,
+            target_table TEXT NOT NULL,
+            source_size INTEGER NOT NULL,
+            source_mtime REAL NOT NULL,
+            rows_done INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (source, target_table)
+        )""",
+    ]),
+    (6, "Date indexes for paging by (date, id)", [
+        # The rowid is the last column of every index, so these also order by id
+        "CREATE INDEX IF NOT EXISTS idx_purchases_date ON purchases (date)",
+        "CREATE INDEX IF NOT EXISTS idx_sales_date ON sales (date)",
+        "CREATE INDEX IF NOT EXISTS idx_debtors_date ON debtors (date)",
+        "CREATE INDEX IF NOT EXISTS idx_debts_date ON debts (date)",
+    ]),
+    (7, "Indexes for the View Purchases / View Sales search filters", [
+        # NOCASE so that the case-insensitive prefix LIKE can use them
+        "CREATE INDEX IF NOT EXISTS idx_purchases_item ON purchases (item_name COLLATE NOCASE)",
+        "CREATE INDEX IF NOT EXISTS idx_purchases_total ON purchases (total_price)",
+        "CREATE INDEX IF NOT EXISTS idx_sales_item ON sales (item_name COLLATE NOCASE)",
+        "CREATE INDEX IF NOT EXISTS idx_sales_customer ON sales (customer_name COLLATE NOCASE)",
+        "CREATE INDEX IF NOT EXISTS idx_sales_total ON sales (total_price)",
+    ]),
+    (8, "Full-text search index over names and items, kept in sync by triggers", _search_index),
+    (9, "Daily, monthly and per-product summaries of sales and purchases", _summaries),
+    (10, "Outstanding balances per debtor and per creditor", _balances),
+    (11, "Link sales, purchases, debtors and debts to products by id", _product_ids),
+    (12, "Unique content hashes for duplicate detection on purchases and debtors", _content_hashes),
+    (13, "Indexes for paging and rotating the activity log by time and by user", [
+        # get_activity_log pages by (timestamp, username, id); rotation uses the timestamp prefix
+        "CREATE INDEX IF NOT EXISTS idx_activity_logs_time_user ON activity_logs (timestamp, username)",
+        # One user's entries without walking everyone else's
+        "CREATE INDEX IF NOT EXISTS idx_activity_logs_user_time ON activity_logs (username, timestamp)",
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn, target_version=LATEST_VERSION):
+    """Apply every pending migration up to target_version, each in its own transaction.
+
+    Returns the list of versions that were applied.
+    """
+    applied = []
+    current_version = get_schema_version(conn)
+    for version, description, steps in MIGRATIONS:
+        if version <= current_version or version > target_version:
+            continue
+
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            if callable(steps):
+                steps(cursor)
+            else:
+                for statement in steps:
+                    cursor.execute(statement)
+            cursor.execute(f"PRAGMA user_version = {int(version)}")
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            raise sqlite3.DatabaseError(f"Migration {version} ({description}) failed: {e}") from e
+        finally:
+            cursor.close()
+        applied.append(version)
+
+    if applied:
+        # Let the query planner pick up statistics for the new indexes
+        conn.execute("PRAGMA optimize")
+    return applied
+
+
+def main():
+    import database
+
+    database_file = sys.argv[1] if len(sys.argv) > 1 else database.DATABASE_FILE
+    conn = sqlite3.connect(database_file)
+    try:
+        print(f"{database_file}: schema version {get_schema_version(conn)}")
+        for version in migrate(conn):
+            description = next(d for v, d, _ in MIGRATIONS if v == version)
+            print(f"Applied migration {version}: {description}")
+        print(f"{database_file}: schema version {get_schema_version(conn)}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,17 +2,22 @@ import sys
 from PyQt5 import QtWidgets, QtGui, QtCore
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QTabWidget, QWidget, QVBoxLayout, QLabel,
-    QLineEdit, QPushButton, QMessageBox, QTableWidget, QTableWidgetItem,
+    QLineEdit, QPushButton, QMessageBox, QTableView,
     QHBoxLayout, QDialog, QDialogButtonBox, QGridLayout, QTextEdit, QFormLayout, QHeaderView, QMenu, QAbstractItemView,
-    QDateEdit
+    QDateEdit, QFileDialog, QInputDialog, QProgressDialog, QTableWidget, QTableWidgetItem, QGroupBox, QCompleter
 )
-from PyQt5.QtGui import QFont, QIntValidator, QDoubleValidator, QValidator, QRegExpValidator
-from PyQt5.QtCore import Qt, QRegExp
+from PyQt5.QtGui import QFont, QIntValidator, QDoubleValidator, QPainter, QColor
+from PyQt5.QtCore import Qt, QTimer, QStringListModel
 from database import get_all_debts
+import async_database
 import database
 import error_logger
+import exporter
+import importer
+import validation
 from error_logger import log_error
 from database import get_product_id
+from table_models import SqlTableModel, RowActionDelegate
 import logging
 
 
@@ -32,8 +37,26 @@ class MyStream(QtCore.QObject):
         sys.stderr = self.original_stderr
 
 
+class TaskProgress(QtCore.QObject):
+    """Carries the progress of an import or export on the workers back to its dialog."""
+
+    progress = QtCore.pyqtSignal(object)
+
+    def __init__(self, dialog):
+        super().__init__(dialog)
+        self.cancelled = False
+        dialog.canceled.connect(self.cancel)
+
+    def cancel(self):
+        self.cancelled = True
+
+
 class MotobApp(QMainWindow):
     logging.basicConfig(filename='debug.log', level=logging.DEBUG)
+
+    # Carries the table of each database change from the workers to the UI thread
+    data_changed = QtCore.pyqtSignal(str)
+
     def __init__(self):
         super().__init__()
 
@@ -48,6 +71,18 @@ class MotobApp(QMainWindow):
         self.setWindowTitle("Motob Transactions")
         self.setStyleSheet("background-color: #f0f0f0; color: #333;")
 
+        listener = lambda table, change, row_id: self.data_changed.emit(table)
+        database.add_change_listener(listener)
+        self.destroyed.connect(lambda: database.remove_change_listener(listener))
+
+        # Item name fields complete from the product catalog
+        self.product_names = QStringListModel(self)
+        self.product_completer = QCompleter(self.product_names, self)
+        self.product_completer.setCaseSensitivity(Qt.CaseInsensitive)
+        self.product_completer.setFilterMode(Qt.MatchContains)
+        self.data_changed.connect(lambda table: table == "products" and self.load_product_names())
+        self.load_product_names()
+
         self.tab_widget = QTabWidget()
         self.setCentralWidget(self.tab_widget)
 
@@ -58,6 +93,7 @@ class MotobApp(QMainWindow):
         self.products_tab = QWidget()
         self.debtors_tab = QWidget()
         self.debt_tab = QWidget()
+        self.reports_tab = QWidget()
         self.calculator_tab = QWidget()
 
         self.tab_widget.addTab(self.purchases_tab, "Add Purchase")
@@ -67,20 +103,124 @@ class MotobApp(QMainWindow):
         self.tab_widget.addTab(self.products_tab, "Manage Products")
         self.tab_widget.addTab(self.debtors_tab, "Manage Debtors")
         self.tab_widget.addTab(self.debt_tab, "Manage Debts")
+        self.tab_widget.addTab(self.reports_tab, "Reports")
         self.tab_widget.addTab(self.calculator_tab, "Calculator")
 
-        self.setup_purchases_tab()
-        self.setup_sales_tab()
-        self.setup_view_purchases_tab()
-        self.setup_view_sales_tab()
-        self.setup_products_tab()
-        self.setup_debtors_tab()
-        self.setup_debt_tab()
-        self.setup_calculator_tab()
+        # Tabs are built, and their tables loaded, the first time they are shown
+        self.tab_setups = {
+            self.purchases_tab: self.setup_purchases_tab,
+            self.sales_tab: self.setup_sales_tab,
+            self.view_purchases_tab: self.setup_view_purchases_tab,
+            self.view_sales_tab: self.setup_view_sales_tab,
+            self.products_tab: self.setup_products_tab,
+            self.debtors_tab: self.setup_debtors_tab,
+            self.debt_tab: self.setup_debt_tab,
+            self.reports_tab: self.setup_reports_tab,
+            self.calculator_tab: self.setup_calculator_tab,
+        }
+        self.built_tabs = set()
+        self.tab_widget.currentChanged.connect(self.ensure_tab_built)
+        self.ensure_tab_built(self.tab_widget.currentIndex())
+
+        # One search box over every table, in the corner of the tab bar
+        self.search_box = QLineEdit()
+        self.search_box.setPlaceholderText("Search customers, items, debtors, creditors...")
+        self.search_box.setClearButtonEnabled(True)
+        self.search_box.setMinimumWidth(260)
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(FilterBar.DEBOUNCE_MS)
+        self.search_timer.timeout.connect(self.run_search)
+        self.search_box.textChanged.connect(lambda text: self.search_timer.start())
+        self.search_box.returnPressed.connect(self.run_search)
+        self.tab_widget.setCornerWidget(self.search_box, Qt.TopRightCorner)
+        self.search_tab = None
+
+        file_menu = self.menuBar().addMenu("File")
+        import_action = file_menu.addAction("Import...")
+        import_action.triggered.connect(self.import_ledger)
+        export_action = file_menu.addAction("Export...")
+        export_action.triggered.connect(self.export_table)
 
         self.show()
 
+    def ensure_tab_built(self, index):
+        tab = self.tab_widget.widget(index)
+        if tab is None or tab in self.built_tabs:
+            return
+        self.built_tabs.add(tab)
+        self.tab_setups[tab]()
+
+    def load_product_names(self):
+        async_database.get_async_database().submit(
+            database.get_product_names, key=(self, "product names"), on_result=self.product_names.setStringList)
+
+    def run_database_call(self, func, *args, on_result=None, key=None):
+        """Run func(*args) on the database workers, off the UI thread.
+
+        on_result gets the return value back on the UI thread; errors are
+        reported the same way the handlers report their own.
+        """
+        return async_database.get_async_database().submit(
+            func, *args, key=key, on_result=on_result, on_error=self.show_database_error)
+
+    def show_database_error(self, error):
+        if isinstance(error, ValueError):
+            QMessageBox.warning(self, "Warning", str(error))
+        else:
+            QMessageBox.critical(self, "Error", str(error))
+
+    def run_search(self):
+        self.search_timer.stop()
+        text = self.search_box.text().strip()
+        if not text:
+            return
+        async_database.get_async_database().submit(
+            database.search, text, key=(self, "search"), on_result=self.show_search_results)
+
+    def setup_search_tab(self):
+        self.search_tab = QWidget()
+        layout = QVBoxLayout(self.search_tab)
+        self.search_results = QTableWidget(0, 6)
+        self.search_results.setHorizontalHeaderLabels(["Table", "Name", "Item", "Date", "Quantity", "Total"])
+        self.search_results.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.search_results.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.search_results.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.search_results.cellDoubleClicked.connect(self.open_search_result)
+        layout.addWidget(QLabel("Double-click a result to edit it."))
+        layout.addWidget(self.search_results)
+        self.tab_widget.addTab(self.search_tab, "Search Results")
+        self.built_tabs.add(self.search_tab)
+
+    def show_search_results(self, results):
+        if self.search_tab is None:
+            self.setup_search_tab()
+        self.search_results.setRowCount(len(results))
+        for row, (table, record_id, name, item, date, quantity, total) in enumerate(results):
+            for column, value in enumerate((table.capitalize(), name, item, date, quantity, total)):
+                cell = QTableWidgetItem("" if value is None else str(value))
+                cell.setTextAlignment(Qt.AlignCenter)
+                self.search_results.setItem(row, column, cell)
+            self.search_results.item(row, 0).setData(Qt.UserRole, (table, record_id))
+        self.tab_widget.setCurrentWidget(self.search_tab)
+
+    def open_search_result(self, row, column):
+        table, record_id = self.search_results.item(row, 0).data(Qt.UserRole)
+        tab, edit = {
+            "sales": (self.view_sales_tab, self.edit_sale),
+            "purchases": (self.view_purchases_tab, self.edit_purchase),
+            "debtors": (self.debtors_tab, self.edit_debtor),
+            "debts": (self.debt_tab, self.edit_debt),
+        }[table]
+        # The edit handlers read the row through that tab's model
+        self.ensure_tab_built(self.tab_widget.indexOf(tab))
+        edit(record_id)
+
     def on_text_written(self, text):
+        # There is no output widget to show it in; pass it on to the real stdout
+        if not hasattr(self, "text_edit"):
+            self.stream.original_stdout.write(text)
+            return
         # Handle the emitted text here by appending it to a QTextEdit widget
         cursor = self.text_edit.textCursor()
         cursor.movePosition(QtGui.QTextCursor.End)
@@ -89,6 +229,96 @@ class MotobApp(QMainWindow):
         self.text_edit.ensureCursorVisible()
 
 
+    def import_ledger(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Import Ledger", "", "Ledgers (*.csv *.xlsx);;All Files (*)")
+        if not path:
+            return
+
+        tables = list(importer.IMPORTERS)
+        table, ok = QInputDialog.getItem(self, "Import Ledger", "Import rows into:", tables, 0, False)
+        if not ok:
+            return
+
+        progress_dialog = QProgressDialog("Importing...", "Cancel", 0, 1000, self)
+        progress_dialog.setWindowTitle("Import Ledger")
+        progress_dialog.setWindowModality(Qt.WindowModal)
+        progress_dialog.setMinimumDuration(0)
+        progress_dialog.setAutoClose(False)
+        progress_dialog.setAutoReset(False)
+        relay = TaskProgress(progress_dialog)
+
+        def show_progress(rows_done, bytes_read, total_bytes, totals):
+            progress_dialog.setValue(1000 * bytes_read // total_bytes if total_bytes else 1000)
+            progress_dialog.setLabelText(f"{rows_done} rows read, {totals['inserted']} imported")
+
+        def report_progress(*args):
+            relay.progress.emit(args)
+            # Checked on the worker between batches
+            if relay.cancelled:
+                raise importer.ImportCancelled()
+
+        def import_failed(error):
+            progress_dialog.close()
+            QMessageBox.warning(self, "Warning", f"Import failed: {error}")
+
+        relay.progress.connect(lambda args: show_progress(*args))
+        async_database.get_async_database().submit(
+            importer.import_file, path, table, progress=report_progress,
+            on_result=lambda totals: self.finish_import(progress_dialog, table, totals),
+            on_error=import_failed)
+
+    def finish_import(self, progress_dialog, table, totals):
+        progress_dialog.close()
+        reloaders = {
+            "purchases": self.load_purchases,
+            "sales": self.load_sales,
+            "debtors": self.load_debtors,
+            "debts": self.load_debts,
+        }
+        reloaders[table]()
+        if table in ("purchases", "sales"):
+            self.load_products()
+
+        message = f"{totals['inserted']} rows imported, {totals['duplicates']} duplicates and {totals['invalid']} invalid rows skipped."
+        if totals["resumed_from"]:
+            message = f"Resumed after row {totals['resumed_from']}. " + message
+        if totals["cancelled"]:
+            message = "Import cancelled; run it again to continue where it stopped. " + message
+        for row_number, error in totals["errors"][:10]:
+            message += f"\nRow {row_number}: {error}"
+        QMessageBox.information(self, "Import Ledger", message)
+
+    def export_table(self):
+        tables = list(exporter.EXPORTABLE_TABLES)
+        table, ok = QInputDialog.getItem(self, "Export Table", "Table to export:", tables, 0, False)
+        if not ok:
+            return
+
+        path, _ = QFileDialog.getSaveFileName(self, "Export Table", f"{table}.csv",
+                                              "CSV (*.csv);;JSON Lines (*.jsonl);;Parquet (*.parquet)")
+        if not path:
+            return
+
+        # A half-written export is no use, so there is nothing to cancel
+        progress_dialog = QProgressDialog("Exporting...", None, 0, 0, self)
+        progress_dialog.setWindowTitle("Export Table")
+        progress_dialog.setWindowModality(Qt.WindowModal)
+        progress_dialog.setMinimumDuration(0)
+        relay = TaskProgress(progress_dialog)
+        relay.progress.connect(lambda args: progress_dialog.setLabelText(f"{args[0]} rows exported"))
+
+        def export_done(count):
+            progress_dialog.close()
+            QMessageBox.information(self, "Export Table", f"Exported {count} rows to {path}.")
+
+        def export_failed(error):
+            progress_dialog.close()
+            QMessageBox.warning(self, "Warning", f"Export failed: {error}")
+
+        async_database.get_async_database().submit(
+            exporter.export_table, table, path, progress=lambda count: relay.progress.emit((count,)),
+            on_result=export_done, on_error=export_failed)
+
     def setup_debt_tab(self):
         layout = QVBoxLayout(self.debt_tab)
 
@@ -103,23 +333,24 @@ class MotobApp(QMainWindow):
         self.creditor = QLineEdit()
         form_layout.addRow(self.creditor_label, self.creditor)
 
-        self.date_label = QLabel("Date:")
-        self.date = QLineEdit()
-        form_layout.addRow(self.date_label, self.date)
+        self.debt_date_label = QLabel("Date:")
+        self.debt_date = QLineEdit()
+        form_layout.addRow(self.debt_date_label, self.debt_date)
 
         self.goods_purchased_label = QLabel("Goods Purchased:")
         self.goods_purchased = QLineEdit()
+        self.goods_purchased.setCompleter(self.product_completer)
         form_layout.addRow(self.goods_purchased_label, self.goods_purchased)
 
-        self.quantity_label = QLabel("Quantity:")
-        self.quantity = QLineEdit()
-        self.quantity.setValidator(QIntValidator())
-        form_layout.addRow(self.quantity_label, self.quantity)
+        self.debt_quantity_label = QLabel("Quantity:")
+        self.debt_quantity = QLineEdit()
+        self.debt_quantity.setValidator(QIntValidator())
+        form_layout.addRow(self.debt_quantity_label, self.debt_quantity)
 
-        self.unit_price_label = QLabel("Unit Price:")
-        self.unit_price = QLineEdit()
-        self.unit_price.setValidator(QDoubleValidator())
-        form_layout.addRow(self.unit_price_label, self.unit_price)
+        self.debt_unit_price_label = QLabel("Unit Price:")
+        self.debt_unit_price = QLineEdit()
+        self.debt_unit_price.setValidator(QDoubleValidator())
+        form_layout.addRow(self.debt_unit_price_label, self.debt_unit_price)
 
         layout.addLayout(form_layout)
 
@@ -128,20 +359,21 @@ class MotobApp(QMainWindow):
         layout.addWidget(button_add_debt)
 
         # Debt Table
-        self.debt_table = QTableWidget()
-        self.debt_table.setColumnCount(8)  # Corrected column count
-        self.debt_table.setHorizontalHeaderLabels(["ID", "Creditor", "Date", "Goods Purchased", "Quantity", "Unit Price", "Total", "Actions"])
+        self.debt_model = SqlTableModel(
+            "debts",
+            ["id", "creditor", "date", "goods_purchased", "quantity", "unit_price", "total"],
+            ["ID", "Creditor", "Date", "Goods Purchased", "Quantity", "Unit Price", "Total", "Actions"],
+            parent=self)
+        self.debt_table = self.create_table_view(self.debt_model, self.edit_debt, self.delete_debt)
         layout.addWidget(self.debt_table)
 
-        # Load existing debts
-        self.load_debts()
 
     def add_debt(self):
         creditor = self.creditor.text()
-        date = self.date.text()
+        date = self.debt_date.text()
         goods_purchased = self.goods_purchased.text()
-        quantity_text = self.quantity.text()
-        unit_price_text = self.unit_price.text()
+        quantity_text = self.debt_quantity.text()
+        unit_price_text = self.debt_unit_price.text()
 
         if not creditor or not date or not goods_purchased or not quantity_text or not unit_price_text:
             QMessageBox.warning(self, "Warning", "Please fill in all fields.")
@@ -160,70 +392,139 @@ class MotobApp(QMainWindow):
             return
 
         # Add debt to database
-        database.add_debt(creditor, date, goods_purchased, quantity, unit_price)
-        self.load_debts()  # Reload debts to update the table with the new data
+        # The debts table picks the new row up from the database change notification
+        self.run_database_call(database.add_debt, creditor, date, goods_purchased, quantity, unit_price,
+                               on_result=self.debt_added)
 
+    def debt_added(self, debt_id):
         # Clear input fields after adding debt
         self.creditor.clear()
-        self.date.clear()
+        self.debt_date.clear()
         self.goods_purchased.clear()
-        self.quantity.clear()
-        self.unit_price.clear()
-        self.total.clear()
+        self.debt_quantity.clear()
+        self.debt_unit_price.clear()
+
+    def create_table_view(self, model, on_edit, on_delete):
+        view = QTableView()
+        view.setModel(model)
+        view.setMouseTracking(True)  # Lets the delegate highlight the button under the cursor
+        view.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        view.horizontalHeader().setDefaultAlignment(Qt.AlignCenter)
+
+        # One delegate paints the Edit/Delete buttons for every row and reports
+        # clicks by record id, so no widgets are created per row
+        delegate = RowActionDelegate(view)
+        delegate.edit_requested.connect(on_edit)
+        delegate.delete_requested.connect(on_delete)
+        view.setItemDelegateForColumn(model.action_column, delegate)
+
+        # Read the first page off the UI thread; the rows appear when it is done
+        model.refresh(background=True)
+        return view
 
     def load_debts(self):
-        # Clear existing data
-        self.debt_table.setRowCount(0)
-
-        # Fetch all debts from the database
-        debts = database.get_all_debts()
-
-        # Populate the table with debts
-        for row, debt in enumerate(debts):
-            self.debt_table.insertRow(row)
-            for col, data in enumerate(debt):
-                item = QTableWidgetItem(str(data))
-                self.debt_table.setItem(row, col, item)
-
-            # Add edit and delete buttons to each row under the "Actions" column
-            edit_button = QPushButton("Edit")
-            edit_button.clicked.connect(lambda _, r=row: self.edit_debt(r))
-            delete_button = QPushButton("Delete")
-            delete_button.clicked.connect(lambda _, r=row: self.delete_debt(r))
-            buttons_layout = QHBoxLayout()
-            buttons_layout.addWidget(edit_button)
-            buttons_layout.addWidget(delete_button)
-            cell_widget = QWidget()
-            cell_widget.setLayout(buttons_layout)
-            self.debt_table.setCellWidget(row, 7, cell_widget)
-
-        self.debt_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
-
-    def edit_debt(self, row):
-        debt_id = int(self.debt_table.item(row, 0).text())  # Assuming ID is in the first column
-        creditor = self.debt_table.item(row, 1).text()
-        date = self.debt_table.item(row, 2).text()
-        goods_purchased = self.debt_table.item(row, 3).text()
-        quantity = int(self.debt_table.item(row, 4).text())
-        unit_price = float(self.debt_table.item(row, 5).text())
+        # Start over from the first page of debts (unopened tabs load when first shown)
+        if self.debt_tab in self.built_tabs:
+            self.debt_model.refresh(background=True)
+
+    def edit_debt(self, debt_id):
+        # Read the row off the UI thread, then open the dialog with it
+        self.run_database_call(self.debt_model.record_by_id, debt_id, on_result=self.edit_debt_record, key="edit")
+
+    def edit_debt_record(self, debt):
+        if debt is None:
+            return
+        debt_id, creditor, date, goods_purchased, quantity, unit_price, total = debt
 
         # Open a dialog to edit debt details
+        # Saving the dialog updates the debt's row in the table by itself
         dialog = EditDebtDialog(debt_id, creditor, date, goods_purchased, quantity, unit_price, parent=self)
-        if dialog.exec_():
-            # If the dialog is accepted (e.g., user clicked OK), reload debts
-            self.load_debts()
+        dialog.exec_()
 
-    def delete_debt(self, row):
-        debt_id = int(self.debt_table.item(row, 0).text())  # Assuming ID is in the first column
+    def delete_debt(self, debt_id):
 
         # Confirm deletion with a message box
         reply = QMessageBox.question(self, 'Delete Debt', 'Are you sure you want to delete this debt?', QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
 
         if reply == QMessageBox.Yes:
             # If user confirms deletion, delete the debt from the database
-            database.delete_debt(debt_id)
-            # Reload debts after deletion
-            self.load_debts()
+            self.run_database_call(database.delete_debt, debt_id)
+
+    REPORT_TITLES = {
+        "sales_by_day": f"Sales by day (last {database.REPORT_DAYS} days)",
+        "top_items": "Top items by revenue",
+        "stock_turnover": "Stock turnover (units sold per unit in stock)",
+        "debtor_balances": "Outstanding debtor balances",
+        "creditor_exposure": "Creditor exposure",
+    }
+
+    def setup_reports_tab(self):
+        layout = QVBoxLayout(self.reports_tab)
+        self.report_summary = QLabel()
+        self.report_summary.setFont(QFont("Arial", 12, weight=QFont.Bold))
+        layout.addWidget(self.report_summary)
+
+        grid = QGridLayout()
+        layout.addLayout(grid)
+        self.report_charts = {}
+        for position, (section, title) in enumerate(self.REPORT_TITLES.items()):
+            box = QGroupBox(title)
+            box_layout = QVBoxLayout(box)
+            chart = BarChart(horizontal=section != "sales_by_day",
+                             color="#c0504d" if section == "creditor_exposure" else "#4a7ebb")
+            box_layout.addWidget(chart)
+            self.report_charts[section] = chart
+            # Sales by day gets the whole first row
+            if position == 0:
+                grid.addWidget(box, 0, 0, 1, 2)
+            else:
+                grid.addWidget(box, 1 + (position - 1) // 2, (position - 1) % 2)
+
+        # Only the sections a change can affect are read again, a moment after
+        # the last change, and only while the tab is on screen
+        self.stale_report_sections = set(database.REPORT_SECTIONS)
+        self.requested_report_sections = set()
+        self.report_timer = QTimer(self)
+        self.report_timer.setSingleShot(True)
+        self.report_timer.setInterval(500)
+        self.report_timer.timeout.connect(self.refresh_report)
+        self.data_changed.connect(self.mark_report_stale)
+        self.tab_widget.currentChanged.connect(lambda index: self.refresh_report())
+        self.refresh_report()
+
+    def mark_report_stale(self, table):
+        self.stale_report_sections.update(database.REPORT_DEPENDENCIES.get(table, ()))
+        if self.tab_widget.currentWidget() is self.reports_tab:
+            self.report_timer.start()
+
+    def refresh_report(self):
+        if self.tab_widget.currentWidget() is not self.reports_tab or not self.stale_report_sections:
+            return
+        # A newer request cancels the one in flight, so it asks for that one's sections too
+        sections = self.stale_report_sections | self.requested_report_sections
+        self.stale_report_sections = set()
+        self.requested_report_sections = sections
+        async_database.get_async_database().submit(
+            database.get_report, sorted(sections), key=(self, "report"),
+            on_result=self.show_report, on_error=self.show_database_error)
+
+    def show_report(self, report):
+        self.requested_report_sections = set()
+        for section, rows in report.items():
+            if section == "sales_by_day":
+                revenue = sum(row[1] for row in rows)
+                cost = sum(row[2] for row in rows)
+                self.report_summary.setText(
+                    f"Last {database.REPORT_DAYS} days: revenue {revenue:,.2f}, cost {cost:,.2f}, "
+                    f"profit {revenue - cost:,.2f}")
+                points = [(date[5:], revenue) for date, revenue, cost in rows]
+            elif section == "stock_turnover":
+                points = [(name, turnover) for name, stock, sold, turnover in rows if turnover is not None]
+            elif section == "top_items":
+                points = [(item, revenue) for item, revenue, margin, quantity in rows]
+            else:
+                points = [(name or "(no name)", balance) for name, balance, entries in rows]
+            self.report_charts[section].set_data(points)
 
     def setup_calculator_tab(self):  # Function to setup calculator tab
         layout = QVBoxLayout()
@@ -287,6 +588,7 @@ class MotobApp(QMainWindow):
         self.purchase_item_name_label = QLabel("Item Name:")
         self.purchase_item_name = QLineEdit()
         self.purchase_item_name.setFont(QFont("Arial", 12))
+        self.purchase_item_name.setCompleter(self.product_completer)
         layout.addWidget(self.purchase_item_name_label)
         layout.addWidget(self.purchase_item_name)
 
@@ -324,37 +626,23 @@ class MotobApp(QMainWindow):
             quantity = int(self.purchase_quantity.text())
             unit_price = float(self.purchase_unit_price.text())
 
-            # Validate date format
-            date_validator = QRegExpValidator(QRegExp("[0-9]{4}-[0-9]{2}-[0-9]{2}"))  # YYYY-MM-DD format
-            if not date_validator.validate(date, 0)[0] == QValidator.Acceptable:
-                raise ValueError("Invalid date format. Please use YYYY-MM-DD.")
+            # Validate date format (YYYY-MM-DD)
+            validation.validate_date(date)
 
             if not date or not item_name:
                 raise ValueError("Please fill in all fields.")
 
             # Validate item name format
-            item_name_validator = QRegExpValidator(QRegExp("[A-Za-z]+( [A-Za-z]+)*"))
-            if not item_name_validator.validate(item_name, 0)[0] == QValidator.Acceptable:
-                raise ValueError("Invalid item name format. Please use alphabetic characters and spaces, but not at the beginning or end.")
+            validation.validate_item_name(item_name)
 
             # Calculate total price
             total_price = quantity * unit_price
             self.purchase_total_price.setText(str(total_price))  # Update total price field
 
-            # Check for duplicate entry
-            if database.purchase_exists(date, item_name, quantity, unit_price):
-                raise ValueError("Duplicate entry detected.")
-
-            # Add purchase to database
-            database.add_purchase(date, item_name, quantity, unit_price)
-            self.load_purchases()  # Reload purchases to update the table with the new data
-
-            # Clear input fields after successful submission
-            self.purchase_date.clear()
-            self.purchase_item_name.clear()
-            self.purchase_quantity.clear()
-            self.purchase_unit_price.clear()
-            self.purchase_total_price.clear()
+            # Add purchase to database and stock in one transaction; a duplicate
+            # entry is rejected with a warning
+            self.run_database_call(database.post_purchase, item_name, date, quantity, unit_price,
+                                   on_result=self.purchase_added)
 
         except ValueError as e:
             error_logger.log_error(e)
@@ -365,70 +653,32 @@ class MotobApp(QMainWindow):
 
     def load_purchases(self):
         try:
-            purchases = database.get_all_purchases()
-            self.purchases_table.setRowCount(len(purchases))
-            for row, purchase in enumerate(purchases):
-                for col, data in enumerate(purchase):
-                    item = QTableWidgetItem(str(data))
-                    self.purchases_table.setItem(row, col, item)
-
-                # Calculate total price and display it in the "Total Price" column
-                quantity = int(purchase[4])
-                unit_price = float(purchase[5])
-                total_price = quantity * unit_price
-                total_item = QTableWidgetItem(str(total_price))
-                self.purchases_table.setItem(row, 6, total_item)  # Place total price in the correct column
-
-                # Add edit and delete buttons to each row under the "Actions" column
-                edit_button = QPushButton("Edit")
-                edit_button.clicked.connect(lambda state, row=row: self.edit_purchase(row))
-                delete_button = QPushButton("Delete")
-                delete_button.clicked.connect(lambda state, row=row: self.delete_purchase(row))
-                buttons_layout = QHBoxLayout()
-                buttons_layout.addWidget(edit_button)
-                buttons_layout.addWidget(delete_button)
-                cell_widget = QWidget()
-                cell_widget.setLayout(buttons_layout)
-                self.purchases_table.setCellWidget(row, 6, cell_widget)  # Place buttons in the correct column
+            # Start over from the first page of purchases (unopened tabs load when first shown)
+            if self.view_purchases_tab in self.built_tabs:
+                self.purchases_model.refresh(background=True)
 
         except Exception as e:
             error_logger.log_error(e)
             QMessageBox.critical(self, "Error", str(e))
 
-    def edit_purchase(self, row):
+    def purchase_added(self, purchase_id):
+        # Clear input fields after successful submission
+        self.purchase_date.clear()
+        self.purchase_item_name.clear()
+        self.purchase_quantity.clear()
+        self.purchase_unit_price.clear()
+        self.purchase_total_price.clear()
+
+    def edit_purchase(self, purchase_id):
+        # Read the row off the UI thread, then open the dialog with it
+        self.run_database_call(self.purchases_model.record_by_id, purchase_id,
+                               on_result=self.edit_purchase_record, key="edit")
+
+    def edit_purchase_record(self, purchase):
         try:
-            # Get purchase ID
-            purchase_id_item = self.purchases_table.item(row, 0)
-            if purchase_id_item is None:
-                raise ValueError("Purchase ID is not available.")
-            purchase_id = int(purchase_id_item.text())
-
-            # Get data from the table
-            date_item = self.purchases_table.item(row, 2)
-            if date_item is None:
-                raise ValueError("Date is not available.")
-            date = date_item.text()
-
-            item_name_item = self.purchases_table.item(row, 1)  # Corrected index for item name
-            if item_name_item is None:
-                raise ValueError("Item name is not available.")
-            item_name = item_name_item.text()
-
-            quantity_item = self.purchases_table.item(row, 3)  # Corrected index for quantity
-            if quantity_item is None:
-                raise ValueError("Quantity is not available.")
-            quantity = round(float(quantity_item.text()))
-
-            unit_price_item = self.purchases_table.item(row, 4)  # Corrected index for unit price
-            if unit_price_item is None:
-                raise ValueError("Unit price is not available.")
-            unit_price = float(unit_price_item.text())
-
-            total_price_item = self.purchases_table.item(row, 5)  # Corrected index for total price
-            if total_price_item is None:
-                print("Total price item is None at row:", row)  # Debugging statement
-                raise ValueError("Total price is not available.")
-            total_price = float(total_price_item.text())  # Fetch total price from the table
+            if purchase is None:
+                raise ValueError("Purchase is not available.")
+            purchase_id, date, item_name, quantity, unit_price, total_price = purchase
 
             # Open a dialog for editing
             dialog = EditPurchaseDialog(date, item_name, quantity, unit_price, total_price)
@@ -443,10 +693,8 @@ class MotobApp(QMainWindow):
                 updated_total_price = updated_quantity * updated_unit_price
 
                 # Update the database
-                database.edit_purchase(purchase_id, updated_date, updated_item_name, updated_quantity, updated_unit_price, updated_total_price)
-
-                # Reload the purchases
-                self.load_purchases()
+                self.run_database_call(database.edit_purchase, purchase_id, updated_date, updated_item_name,
+                                       updated_quantity, updated_unit_price, updated_total_price)
 
         except ValueError as e:
             error_logger.log_error(e)
@@ -455,21 +703,15 @@ class MotobApp(QMainWindow):
             error_logger.log_error(e)
             QMessageBox.critical(self, "Error", str(e))
 
-    def delete_purchase(self, row):
+    def delete_purchase(self, purchase_id):
         try:
-            # Get purchase ID
-            purchase_id = int(self.purchases_table.item(row, 0).text())
-
             # Confirmation dialog
             reply = QMessageBox.question(self, 'Delete Purchase', 'Are you sure you want to delete this purchase?',
                                      QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
 
             if reply == QMessageBox.Yes:
                 # Delete the purchase from the database
-                database.delete_purchase(purchase_id)
-
-                # Reload the purchases
-                self.load_purchases()
+                self.run_database_call(database.delete_purchase, purchase_id)
 
         except Exception as e:
             error_logger.log_error(e)
@@ -485,24 +727,16 @@ class MotobApp(QMainWindow):
         layout.addWidget(label)
 
         try:
-            self.purchases_table = QTableWidget()
-            self.purchases_table.setColumnCount(7)  # Updated to include "Product ID" and "Total Price" columns
-            self.purchases_table.setHorizontalHeaderLabels(["ID","Item Name", "Date", "Quantity", "Unit Price", "Total Price", "Actions"])
-            # Updated header labels
+            self.purchases_model = SqlTableModel(
+                "purchases",
+                ["id", "date", "item_name", "quantity", "unit_price", "total_price"],
+                ["ID", "Date", "Item Name", "Quantity", "Unit Price", "Total Price", "Actions"],
+                parent=self)
+            self.purchases_table = self.create_table_view(self.purchases_model, self.edit_purchase, self.delete_purchase)
+            self.purchases_filter = FilterBar(self.purchases_model)
+            layout.addWidget(self.purchases_filter)
             layout.addWidget(self.purchases_table)
 
-            # Print column headers and their indices
-            header_labels = [self.purchases_table.horizontalHeaderItem(i).text() for i in range(self.purchases_table.columnCount())]
-            print("Column Headers: {}".format(header_labels))
-
-            self.load_purchases()
-
-            # Set column alignment
-            header = self.purchases_table.horizontalHeader()
-            for col in range(self.purchases_table.columnCount()):
-                header.setSectionResizeMode(col, QHeaderView.Stretch)  # Adjust column width to content
-                header.setDefaultAlignment(Qt.AlignCenter)  # Align header text to center
-
         except Exception as e:
             error_logger.log_error(e)
 
@@ -526,6 +760,7 @@ class MotobApp(QMainWindow):
             self.sale_item_name_label = QLabel("Item Name:")
             self.sale_item_name = QLineEdit()
             self.sale_item_name.setFont(QFont("Arial", 12))
+            self.sale_item_name.setCompleter(self.product_completer)
             layout.addWidget(self.sale_item_name_label)
             layout.addWidget(self.sale_item_name)
 
@@ -569,28 +804,19 @@ class MotobApp(QMainWindow):
             if not date or not item_name or not customer_name:
                 raise ValueError("Please fill in all fields.")
 
-            # Validate date format
-            date_validator = QRegExpValidator(QRegExp("[0-9]{4}-[0-9]{2}-[0-9]{2}"))  # YYYY-MM-DD format
-            if not date_validator.validate(date, 0)[0] == QValidator.Acceptable:
-                raise ValueError("Invalid date format. Please use YYYY-MM-DD.")
+            # Validate date format (YYYY-MM-DD)
+            validation.validate_date(date)
 
             # Validate item name format
-            item_name_validator = QRegExpValidator(QRegExp("[A-Za-z]+( [A-Za-z]+)*"))  # Allows alphabetic characters and spaces but not at the beginning or end
-            if not item_name_validator.validate(item_name, 0)[0] == QValidator.Acceptable:
-                raise ValueError("Invalid item name format. Please use alphabetic characters and spaces, but not at the beginning or end.")
+            validation.validate_item_name(item_name)
 
             # Calculate total price
             total_price = quantity * unit_price
 
-            database.add_sale(item_name, date, customer_name, quantity, unit_price)
-            self.load_sales()
-
-            # Clear input fields after successful submission
-            self.sale_date.clear()
-            self.sale_item_name.clear()
-            self.sale_customer_name.clear()
-            self.sale_quantity.clear()
-            self.sale_unit_price.clear()
+            # Record the sale and take it out of stock in one transaction;
+            # raises StockError (a ValueError) if there is not enough stock
+            self.run_database_call(database.post_sale, item_name, date, customer_name, quantity, unit_price,
+                                   on_result=self.sale_added)
 
         except ValueError as e:
             error_logger.log_error(e)
@@ -601,49 +827,33 @@ class MotobApp(QMainWindow):
 
     def load_sales(self):
         try:
-            sales = database.get_all_sales()
-            self.sales_table.setRowCount(len(sales))
-            for row, sale in enumerate(sales):
-                for col, data in enumerate(sale):
-                    item = QTableWidgetItem(str(data))
-                    self.sales_table.setItem(row, col, item)
-
-                # Calculate total price and display it in the "Total" column
-                quantity = int(sale[4])
-                unit_price = float(sale[5])
-                total_price = quantity * unit_price
-                total_item = QTableWidgetItem(str(total_price))
-                self.sales_table.setItem(row, 6, total_item)
-
-                # Add edit and delete buttons to each row under the "Actions" column
-                edit_button = QPushButton("Edit")
-                edit_button.clicked.connect(lambda state, row=row: self.edit_sale(row))
-                delete_button = QPushButton("Delete")
-                delete_button.clicked.connect(lambda state, row=row: self.delete_sale(row))
-                buttons_layout = QHBoxLayout()
-                buttons_layout.addWidget(edit_button)
-                buttons_layout.addWidget(delete_button)
-                cell_widget = QWidget()
-                cell_widget.setLayout(buttons_layout)
-                self.sales_table.setCellWidget(row, 7, cell_widget)
+            # Start over from the first page of sales (unopened tabs load when first shown)
+            if self.view_sales_tab in self.built_tabs:
+                self.sales_model.refresh(background=True)
         except Exception as e:
             error_logger.log_error(e)
             QMessageBox.critical(self, "Error", str(e))
 
-    def edit_sale(self, row):
-        try:
-            # Get sale ID
-            sale_id = int(self.sales_table.item(row, 0).text())
+    def sale_added(self, sale_id):
+        # Clear input fields after successful submission
+        self.sale_date.clear()
+        self.sale_item_name.clear()
+        self.sale_customer_name.clear()
+        self.sale_quantity.clear()
+        self.sale_unit_price.clear()
+
+    def edit_sale(self, sale_id):
+        # Read the row off the UI thread, then open the dialog with it
+        self.run_database_call(self.sales_model.record_by_id, sale_id, on_result=self.edit_sale_record, key="edit")
 
-            # Get data from the table
-            date = self.sales_table.item(row, 1).text()
-            customer_name = self.sales_table.item(row, 2).text().strip()  # Remove leading and trailing spaces
-            item_name = self.sales_table.item(row, 3).text().strip()  # Remove leading and trailing spaces
-            quantity = round(float(self.sales_table.item(row, 4).text()))
-            unit_price = float(self.sales_table.item(row, 5).text())
+    def edit_sale_record(self, sale):
+        try:
+            if sale is None:
+                raise ValueError("Sale is not available.")
+            sale_id, item_name, date, customer_name, quantity, unit_price, total_price = sale
 
             # Open a dialog for editing
-            dialog = EditSaleDialog(date, customer_name, item_name, quantity, unit_price)
+            dialog = EditSaleDialog(item_name, date, customer_name, quantity, unit_price)
             if dialog.exec_():
                 # Get updated data from the dialog
                 updated_date = dialog.date.text()
@@ -655,21 +865,15 @@ class MotobApp(QMainWindow):
                 if not updated_date or not updated_item_name or not updated_customer_name:
                     raise ValueError("Please fill in all fields.")
 
-                # Validate date format
-                date_validator = QRegExpValidator(QRegExp("[0-9]{4}-[0-9]{2}-[0-9]{2}"))  # YYYY-MM-DD format
-                if not date_validator.validate(updated_date, 0)[0] == QValidator.Acceptable:
-                    raise ValueError("Invalid date format. Please use YYYY-MM-DD.")
+                # Validate date format (YYYY-MM-DD)
+                validation.validate_date(updated_date)
 
                 # Validate item name format
-                item_name_validator = QRegExpValidator(QRegExp("[A-Za-z]+( [A-Za-z]+)*"))  # Allows alphabetic characters and spaces but not at the beginning or end
-                if not item_name_validator.validate(updated_item_name, 0)[0] == QValidator.Acceptable:
-                    raise ValueError("Invalid item name format. Please use alphabetic characters and spaces, but not at the beginning or end.")
+                validation.validate_item_name(updated_item_name)
 
                 # Update the database
-                database.edit_sale(sale_id, updated_date, updated_customer_name, updated_item_name, updated_quantity, updated_unit_price)
-
-                # Reload the sales
-                self.load_sales()
+                self.run_database_call(database.edit_sale, sale_id, updated_date, updated_customer_name,
+                                       updated_item_name, updated_quantity, updated_unit_price)
 
         except ValueError as e:
             error_logger.log_error(e)
@@ -678,21 +882,16 @@ class MotobApp(QMainWindow):
             error_logger.log_error(e)
             QMessageBox.critical(self, "Error", str(e))
 
-    def delete_sale(self, row):
+    def delete_sale(self, sale_id):
         try:
-            # Get sale ID
-            sale_id = int(self.sales_table.item(row, 0).text())
-
             # Confirmation dialog
             reply = QMessageBox.question(self, 'Delete Sale', 'Are you sure you want to delete this sale?',
                                      QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
 
             if reply == QMessageBox.Yes:
                 # Delete the sale from the database
-                database.delete_sale(sale_id)
+                self.run_database_call(database.delete_sale, sale_id)
 
-                # Reload the sales
-                self.load_sales()
         except Exception as e:
             error_logger.log_error(e)
             QMessageBox.critical(self, "Error", str(e))
@@ -707,16 +906,15 @@ class MotobApp(QMainWindow):
             label.setAlignment(Qt.AlignCenter)
             layout.addWidget(label)
 
-            self.sales_table = QTableWidget()
-            self.sales_table.setColumnCount(8)  # Updated to include "Total" column
-            self.sales_table.setHorizontalHeaderLabels(["ID", "Item Name", "Date", "Customer Name", "Quantity", "Unit Price", "Total", "Actions"])  # Updated header labels
+            self.sales_model = SqlTableModel(
+                "sales",
+                ["id", "item_name", "date", "customer_name", "quantity", "unit_price", "total_price"],
+                ["ID", "Item Name", "Date", "Customer Name", "Quantity", "Unit Price", "Total", "Actions"],
+                parent=self)
+            self.sales_table = self.create_table_view(self.sales_model, self.edit_sale, self.delete_sale)
+            self.sales_filter = FilterBar(self.sales_model, customer_field=True)
+            layout.addWidget(self.sales_filter)
             layout.addWidget(self.sales_table)
-
-            self.load_sales()
-
-            # Set column alignment
-            for col in range(self.sales_table.columnCount()):
-                self.sales_table.horizontalHeaderItem(col).setTextAlignment(Qt.AlignCenter)
         except Exception as e:
             error_logger.log_error(e)
             QMessageBox.critical(self, "Error", str(e))
@@ -756,12 +954,13 @@ class MotobApp(QMainWindow):
             button_add_product.clicked.connect(self.add_product)
             layout.addWidget(button_add_product)
 
-            self.products_table = QTableWidget()
-            self.products_table.setColumnCount(6)
-            self.products_table.setHorizontalHeaderLabels(["ID", "Product Name", "Stock", "Sold Stock", "Available Stock", "Actions"])
+            self.products_model = SqlTableModel(
+                "products",
+                ["id", "name", "stock", "sold_stock", "available_stock"],
+                ["ID", "Product Name", "Stock", "Sold Stock", "Available Stock", "Actions"],
+                parent=self)
+            self.products_table = self.create_table_view(self.products_model, self.edit_product, self.delete_product)
             layout.addWidget(self.products_table)
-
-            self.load_products()
         except Exception as e:
             error_logger.log_error(e)
             QMessageBox.critical(self, "Error", str(e))
@@ -781,17 +980,18 @@ class MotobApp(QMainWindow):
             if available_stock < 0 or sold_stock < 0:
                 raise ValueError("Stock values cannot be negative.")
 
-            if database.product_exists(name):
-                raise ValueError("Product already exists.")
-
             # Calculate available stock by subtracting sold stock
             available_stock -= sold_stock
 
             if available_stock < 0:
                 raise ValueError("Available stock cannot be negative after deducting sold stock.")
 
-            database.add_product(name, available_stock, sold_stock)
-            self.load_products()
+            def add():
+                if database.product_exists(name):
+                    raise ValueError("Product already exists.")
+                return database.add_product(name, available_stock, sold_stock)
+
+            self.run_database_call(add)
         except ValueError as e:
             error_logger.log_error(e)
             QMessageBox.warning(self, "Warning", str(e))
@@ -801,45 +1001,23 @@ class MotobApp(QMainWindow):
 
     def load_products(self):
         try:
-            products = database.get_all_products()
-            self.products_table.setRowCount(len(products))
-
-            if not products:
-                print("No products found.")
-                return
-
-            for row, product in enumerate(products):
-                for col, data in enumerate(product):
-                    item = QTableWidgetItem(str(data))
-                    self.products_table.setItem(row, col, item)
-
-                # Calculate available stock by subtracting sold stock
-                available_stock = product[2] - product[3]
-                total_item = QTableWidgetItem(str(available_stock))
-                self.products_table.setItem(row, 4, total_item)
-
-                edit_button = QPushButton("Edit")
-                edit_button.clicked.connect(lambda state, row=row: self.edit_product(row))
-                delete_button = QPushButton("Delete")
-                delete_button.clicked.connect(lambda state, row=row: self.delete_product(row))
-
-                buttons_widget = QWidget()
-                buttons_layout = QHBoxLayout()
-                buttons_layout.addWidget(edit_button)
-                buttons_layout.addWidget(delete_button)
-                buttons_widget.setLayout(buttons_layout)
-
-                self.products_table.setCellWidget(row, 5, buttons_widget)
+            # Start over from the first page of products (unopened tabs load when first shown)
+            if self.products_tab in self.built_tabs:
+                self.products_model.refresh(background=True)
         except Exception as e:
             error_logger.log_error(e)
             QMessageBox.critical(self, "Error", str(e))
 
-    def edit_product(self, row):
+    def edit_product(self, product_id):
+        # Read the row off the UI thread, then open the dialog with it
+        self.run_database_call(self.products_model.record_by_id, product_id,
+                               on_result=self.edit_product_record, key="edit")
+
+    def edit_product_record(self, product):
         try:
-            product_id = self.products_table.item(row, 0).text()
-            name = self.products_table.item(row, 1).text()
-            available_stock = int(float(self.products_table.item(row, 2).text()))
-            sold_stock = int(float(self.products_table.item(row, 3).text()))
+            if product is None:
+                raise ValueError("Product is not available.")
+            product_id, name, available_stock, sold_stock = product[:4]
 
             dialog = QDialog(self)
             dialog.setWindowTitle("Edit Product")
@@ -876,8 +1054,7 @@ class MotobApp(QMainWindow):
                 new_sold_stock = int(sold_stock_input.text())
                 if new_available_stock < 0:
                     raise ValueError("Available stock cannot be negative after deducting sold stock.")
-                database.update_product(product_id, new_name, new_available_stock, new_sold_stock)
-                self.load_products()
+                self.run_database_call(database.update_product, product_id, new_name, new_available_stock, new_sold_stock)
         except ValueError as e:
             error_logger.log_error(e)
             QMessageBox.warning(self, "Warning", str(e))
@@ -885,13 +1062,11 @@ class MotobApp(QMainWindow):
             error_logger.log_error(e)
             QMessageBox.critical(self, "Error", str(e))
 
-    def delete_product(self, row):
+    def delete_product(self, product_id):
         try:
-            product_id = int(self.products_table.item(row, 0).text())
             reply = QMessageBox.question(self, 'Delete Product', 'Are you sure you want to delete this product?', QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
             if reply == QMessageBox.Yes:
-                database.delete_product(product_id)
-                self.load_products()
+                self.run_database_call(database.delete_product, product_id)
         except Exception as e:
             error_logger.log_error(e)
             QMessageBox.critical(self, "Error", str(e))
@@ -915,6 +1090,7 @@ class MotobApp(QMainWindow):
         self.item_label = QLabel("Item:")
         self.item = QLineEdit()
         self.item.setFont(QFont("Arial", 12))
+        self.item.setCompleter(self.product_completer)
         layout.addWidget(self.item_label)
         layout.addWidget(self.item)
 
@@ -944,13 +1120,14 @@ class MotobApp(QMainWindow):
         button_add_debtor.clicked.connect(self.add_debtor)
         layout.addWidget(button_add_debtor)
 
-        self.debtors_table = QTableWidget()
-        self.debtors_table.setColumnCount(8)
-        self.debtors_table.setHorizontalHeaderLabels(["ID", "Debtor Name", "Item", "Date", "Quantity", "Unit Price", "Total", "Actions"])
+        self.debtors_model = SqlTableModel(
+            "debtors",
+            ["id", "name", "item", "date", "quantity", "unit_price", "total"],
+            ["ID", "Debtor Name", "Item", "Date", "Quantity", "Unit Price", "Total", "Actions"],
+            parent=self)
+        self.debtors_table = self.create_table_view(self.debtors_model, self.edit_debtor, self.delete_debtor)
         layout.addWidget(self.debtors_table)
 
-        self.load_debtors()
-
     def add_debtor(self):
         name = self.debtor_name.text()
         item = self.item.text()
@@ -981,41 +1158,22 @@ class MotobApp(QMainWindow):
             QMessageBox.warning(self, "Warning", "Values cannot be negative.")
             return
 
-        try:
-            database.add_debtor(name, item, date, quantity, unit_price)
-            self.load_debtors()
-        except Exception as e:
-            QMessageBox.warning(self, "Error", f"An error occurred while adding debtor: {str(e)}")
+        self.run_database_call(database.post_debtor, name, item, date, quantity, unit_price)
 
     def load_debtors(self):
-        debtors = database.get_all_debtors()
-        self.debtors_table.setRowCount(len(debtors))
-
-        for row, debtor in enumerate(debtors):
-            for col, data in enumerate(debtor):
-                item = QTableWidgetItem(str(data))
-                self.debtors_table.setItem(row, col, item)
-
-            # Add edit and delete buttons to each row under the "Actions" column
-            edit_button = QPushButton("Edit")
-            edit_button.clicked.connect(lambda state, row=row: self.edit_debtor(row))
-            delete_button = QPushButton("Delete")
-            delete_button.clicked.connect(lambda state, row=row: self.delete_debtor(row))
-            buttons_layout = QHBoxLayout()
-            buttons_layout.addWidget(edit_button)
-            buttons_layout.addWidget(delete_button)
-            cell_widget = QWidget()
-            cell_widget.setLayout(buttons_layout)
-            self.debtors_table.setCellWidget(row, 7, cell_widget)
-
-    def edit_debtor(self, row):
-        debtor_id = int(self.debtors_table.item(row, 0).text())
-        name = self.debtors_table.item(row, 1).text()
-        item = self.debtors_table.item(row, 2).text()
-        date = self.debtors_table.item(row, 3).text()
-        quantity = int(self.debtors_table.item(row, 4).text())
-        unit_price = float(self.debtors_table.item(row, 5).text())
-        total = float(self.debtors_table.item(row, 6).text())
+        # Start over from the first page of debtors (unopened tabs load when first shown)
+        if self.debtors_tab in self.built_tabs:
+            self.debtors_model.refresh(background=True)
+
+    def edit_debtor(self, debtor_id):
+        # Read the row off the UI thread, then open the dialog with it
+        self.run_database_call(self.debtors_model.record_by_id, debtor_id,
+                               on_result=self.edit_debtor_record, key="edit")
+
+    def edit_debtor_record(self, debtor):
+        if debtor is None:
+            return
+        debtor_id, name, item, date, quantity, unit_price, total = debtor
 
         dialog = EditDebtorDialog(name, item, date, quantity, unit_price, total)
         if dialog.exec_():
@@ -1026,21 +1184,168 @@ class MotobApp(QMainWindow):
             updated_unit_price = float(dialog.unit_price.text())
             updated_total = updated_quantity * updated_unit_price  # Recalculate total
 
-            try:
-                database.update_debtor(debtor_id, updated_name, updated_item, updated_date, updated_quantity, updated_unit_price)
-                self.load_debtors()
-            except Exception as e:
-                QMessageBox.warning(self, "Error", f"An error occurred while updating debtor: {str(e)}")
+            self.run_database_call(database.update_debtor, debtor_id, updated_name, updated_item, updated_date,
+                                   updated_quantity, updated_unit_price)
 
-    def delete_debtor(self, row):
-        debtor_id = int(self.debtors_table.item(row, 0).text())
+    def delete_debtor(self, debtor_id):
         reply = QMessageBox.question(self, 'Delete Debtor', 'Are you sure you want to delete this debtor?', QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
         if reply == QMessageBox.Yes:
-            database.delete_debtor(debtor_id)
-            self.load_debtors()
+            self.run_database_call(database.delete_debtor, debtor_id)
+
+class FilterBar(QWidget):
+    """Search fields for a view tab. The filtering is done by SQLite, not the view.
+
+    Typing restarts a short timer and the search runs once it stops, on the
+    database workers; a newer search cancels one that is still running.
+    """
+
+    DEBOUNCE_MS = 250
+
+    def __init__(self, model, customer_field=False, parent=None):
+        super().__init__(parent)
+        self.model = model
+        self.applied = {}
+
+        layout = QHBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        self.start_date = self.add_field(layout, "From:", "YYYY-MM-DD")
+        self.end_date = self.add_field(layout, "To:", "YYYY-MM-DD")
+        self.item_name = self.add_field(layout, "Item:", "Item name")
+        self.customer_name = self.add_field(layout, "Customer:", "Customer name") if customer_field else None
+        self.min_amount = self.add_field(layout, "Total from:", "0.00")
+        self.max_amount = self.add_field(layout, "to:", "0.00")
+        for field in (self.min_amount, self.max_amount):
+            field.setValidator(QDoubleValidator(0, 1e12, 2))
+
+        clear_button = QPushButton("Clear")
+        clear_button.clicked.connect(self.clear)
+        layout.addWidget(clear_button)
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(self.DEBOUNCE_MS)
+        self.timer.timeout.connect(self.apply_filter)
+
+    def add_field(self, layout, label, placeholder):
+        field = QLineEdit()
+        field.setPlaceholderText(placeholder)
+        field.textChanged.connect(lambda text: self.timer.start())
+        layout.addWidget(QLabel(label))
+        layout.addWidget(field)
+        return field
+
+    def criteria(self):
+        criteria = {}
+        # Half-typed dates and amounts are left out until they are complete
+        for name, field in (("start_date", self.start_date), ("end_date", self.end_date)):
+            if validation.DATE_PATTERN.fullmatch(field.text().strip()):
+                criteria[name] = field.text().strip()
+        for name, field in (("item_name", self.item_name), ("customer_name", self.customer_name)):
+            if field is not None and field.text().strip():
+                criteria[name] = field.text().strip()
+        for name, field in (("min_amount", self.min_amount), ("max_amount", self.max_amount)):
+            try:
+                criteria[name] = float(field.text())
+            except ValueError:
+                pass
+        return criteria
+
+    def apply_filter(self):
+        criteria = self.criteria()
+        if criteria == self.applied:
+            return
+        self.applied = criteria
+        async_database.get_async_database().submit(
+            database.build_filter, self.model.table, key=(self, "filter"),
+            on_result=lambda result: self.model.set_filter(*result), **criteria)
+
+    def clear(self):
+        for field in (self.start_date, self.end_date, self.item_name, self.customer_name,
+                      self.min_amount, self.max_amount):
+            if field is not None:
+                field.blockSignals(True)
+                field.clear()
+                field.blockSignals(False)
+        self.timer.stop()
+        self.apply_filter()
+
+
+class BarChart(QWidget):
+    """Bars for a list of (label, value) pairs, drawn with QPainter.
+
+    Vertical bars suit a series over time, horizontal ones a ranking.
+    Negative values are drawn in grey, their length from their size.
+    """
+
+    def __init__(self, horizontal=False, color="#4a7ebb", parent=None):
+        super().__init__(parent)
+        self.horizontal = horizontal
+        self.color = QColor(color)
+        self.points = []
+        self.setMinimumHeight(160)
+
+    def set_data(self, points):
+        self.points = list(points)
+        self.update()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.Antialiasing)
+        area = self.rect().adjusted(6, 6, -6, -6)
+        if not self.points:
+            painter.setPen(QColor("#888"))
+            painter.drawText(area, Qt.AlignCenter, "No data yet")
+            return
+        largest = max(abs(value) for label, value in self.points) or 1
+        if self.horizontal:
+            self.paint_horizontal(painter, area, largest)
+        else:
+            self.paint_vertical(painter, area, largest)
+
+    def bar_color(self, value):
+        return self.color if value >= 0 else QColor("#999")
+
+    def paint_horizontal(self, painter, area, largest):
+        metrics = painter.fontMetrics()
+        label_width = min(max(metrics.width(str(label)) for label, value in self.points) + 10, area.width() // 3)
+        value_width = max(metrics.width(f"{value:,.2f}") for label, value in self.points) + 6
+        bar_space = max(area.width() - label_width - value_width, 1)
+        row_height = area.height() / len(self.points)
+        for index, (label, value) in enumerate(self.points):
+            top = area.top() + index * row_height
+            text = metrics.elidedText(str(label), Qt.ElideRight, label_width - 4)
+            painter.setPen(QColor("#333"))
+            painter.drawText(QtCore.QRectF(area.left(), top, label_width - 6, row_height),
+                             Qt.AlignRight | Qt.AlignVCenter, text)
+            length = bar_space * abs(value) / largest
+            bar = QtCore.QRectF(area.left() + label_width, top + row_height * 0.15, length, row_height * 0.7)
+            painter.fillRect(bar, self.bar_color(value))
+            painter.drawText(QtCore.QRectF(bar.right() + 4, top, value_width, row_height),
+                             Qt.AlignLeft | Qt.AlignVCenter, f"{value:,.2f}")
+
+    def paint_vertical(self, painter, area, largest):
+        metrics = painter.fontMetrics()
+        label_height = metrics.height() + 4
+        bar_space = max(area.height() - label_height, 1)
+        column_width = area.width() / len(self.points)
+        # Label only as many bars as there is room for
+        label_every = max(1, int((metrics.width("00-00") + 8) // max(column_width, 1)) + 1)
+        painter.setPen(QColor("#333"))
+        for index, (label, value) in enumerate(self.points):
+            left = area.left() + index * column_width
+            length = bar_space * abs(value) / largest
+            bar = QtCore.QRectF(left + column_width * 0.1, area.top() + bar_space - length,
+                                column_width * 0.8, length)
+            painter.fillRect(bar, self.bar_color(value))
+            if index % label_every == 0:
+                painter.drawText(QtCore.QRectF(left - column_width, area.bottom() - label_height,
+                                               column_width * 3, label_height),
+                                 Qt.AlignCenter, str(label))
+        painter.drawText(area, Qt.AlignTop | Qt.AlignLeft, f"{largest:,.2f}")
+
 
 class EditPurchaseDialog(QDialog):
-    def __init__(self, item_name, date, quantity, unit_price, total_price):
+    def __init__(self, date, item_name, quantity, unit_price, total_price):
         try:
             super().__init__()
 
@@ -1049,16 +1354,16 @@ class EditPurchaseDialog(QDialog):
             layout = QVBoxLayout()
             self.setLayout(layout)
 
-            self.item_name_label = QLabel("Date:")
-            self.item_name = QLineEdit(item_name)
-            layout.addWidget(self.item_name_label)
-            layout.addWidget(self.item_name)
-
-            self.date_label = QLabel("Item Name:")
+            self.date_label = QLabel("Date:")
             self.date = QLineEdit(date)
             layout.addWidget(self.date_label)
             layout.addWidget(self.date)
 
+            self.item_name_label = QLabel("Item Name:")
+            self.item_name = QLineEdit(item_name)
+            layout.addWidget(self.item_name_label)
+            layout.addWidget(self.item_name)
+
             self.quantity_label = QLabel("Quantity:")
             self.quantity = QLineEdit(str(quantity))
             layout.addWidget(self.quantity_label)
@@ -1229,11 +1534,12 @@ class EditDebtDialog(QDialog):
             # Calculate total
             total = quantity * unit_price
 
-            # Update the debt in the database
-            database.update_debt(self.debt_id, creditor, date, goods_purchased, quantity, unit_price, total)
-
-            # Close the dialog
-            self.accept()
+            # Update the debt in the database off the UI thread and close the
+            # dialog once it is saved
+            async_database.get_async_database().submit(
+                database.update_debt, self.debt_id, creditor, date, goods_purchased, quantity, unit_price, total,
+                on_result=lambda debt_id: self.accept(),
+                on_error=lambda error: QMessageBox.critical(self, "Error", str(error)))
         except ValueError:
             QMessageBox.warning(self, "Warning", "Please enter valid numeric values for Quantity and Unit Price.")
 
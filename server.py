@@ -0,0 +1,455 @@
+import argparse
+import asyncio
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+import database
+import error_logger
+import validation
+
+# Headless JSON API over database.py for the POS terminals and batch scripts.
+# It needs nothing beyond the standard library: asyncio streams with just
+# enough HTTP/1.1 for JSON clients, including keep-alive. SQLite allows one
+# writer at a time, so every write goes through a single writer thread with
+# a connection of its own for the life of the server, and never queues on the
+# database lock or for a pooled connection; reads are spread over a pool of
+# reader threads using the pooled connections. Every write is recorded in the
+# activity log under API_USERNAME. GET /<table> returns one page and a
+# "next" token; pass it as ?page= to get the following page (see the
+# get_*_page functions in database.py). ?order=date pages by (date, id).
+#
+#   GET    /<table>?page=<token>&limit=<n>   list rows
+#   GET    /<table>/<id>                     one row
+#   POST   /<table>                          create, returns {"id": ...}
+#   PUT    /<table>/<id>                     update
+#   DELETE /<table>/<id>                     delete
+#   POST   /batch  {"requests": [{"method", "path", "body"}, ...]}
+#   GET    /search?q=<words>&limit=<n>       full-text search over every table
+#   GET    /health
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+PAGE_LIMIT = 100
+MAX_PAGE_LIMIT = 1000
+MAX_BATCH_SIZE = 100
+# Who API writes are logged as; the API has no logins of its own
+API_USERNAME = "api"
+MAX_BODY_SIZE = 1024 * 1024
+KEEP_ALIVE_TIMEOUT = 15
+
+# Columns returned for each table; users leaves out the password hash
+RESOURCES = {
+    "products": ["id", "name", "stock", "sold_stock", "available_stock"],
+    "purchases": ["id", "date", "item_name", "quantity", "unit_price", "total_price"],
+    "sales": ["id", "item_name", "date", "customer_name", "quantity", "unit_price", "total_price"],
+    "debtors": ["id", "name", "item", "date", "quantity", "unit_price", "total"],
+    "debts": ["id", "creditor", "date", "goods_purchased", "quantity", "unit_price", "total"],
+    "users": ["id", "username", "is_admin", "has_permissions"],
+}
+
+SEARCH_FIELDS = ["table", "id", "name", "item", "date", "quantity", "total"]
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _text(body, field):
+    return validation.validate_required(body.get(field), field)
+
+
+def _row_exists(table, row_id):
+    rows = database.fetch_rows(table, ["id"], row_id, 1, inclusive=True)
+    return bool(rows) and rows[0][0] == row_id
+
+
+def _saved(row_id):
+    # The data functions log their own errors and return None
+    if row_id is None:
+        raise ApiError(HTTPStatus.INTERNAL_SERVER_ERROR, "The change could not be saved; see error.log.")
+    return row_id
+
+
+def _create_product(body):
+    name = _text(body, "name")
+    stock = validation.parse_quantity(body.get("stock", 0))
+    sold_stock = validation.parse_quantity(body.get("sold_stock", 0))
+    if database.product_exists(name):
+        raise ApiError(HTTPStatus.CONFLICT, "Product already exists.")
+    return database.add_product(name, stock, sold_stock)
+
+
+def _update_product(product_id, body):
+    return database.update_product(product_id, _text(body, "name"), validation.parse_quantity(body.get("stock")),
+                                   validation.parse_quantity(body.get("sold_stock", 0)))
+
+
+def _purchase_fields(body):
+    quantity = validation.parse_quantity(body.get("quantity"))
+    unit_price = validation.parse_unit_price(body.get("unit_price"))
+    return (validation.validate_item_name(body.get("item_name", "")), validation.validate_date(body.get("date", "")),
+            quantity, unit_price)
+
+
+def _create_purchase(body):
+    item_name, date, quantity, unit_price = _purchase_fields(body)
+    return database.post_purchase(item_name, date, quantity, unit_price)
+
+
+def _update_purchase(purchase_id, body):
+    item_name, date, quantity, unit_price = _purchase_fields(body)
+    return database.edit_purchase(purchase_id, date, item_name, quantity, unit_price, quantity * unit_price)
+
+
+def _sale_fields(body):
+    item_name, date, quantity, unit_price = _purchase_fields(body)
+    return item_name, date, _text(body, "customer_name"), quantity, unit_price
+
+
+def _create_sale(body):
+    item_name, date, customer_name, quantity, unit_price = _sale_fields(body)
+    try:
+        return database.post_sale(item_name, date, customer_name, quantity, unit_price)
+    except database.StockError as e:
+        raise ApiError(HTTPStatus.CONFLICT, str(e))
+
+
+def _update_sale(sale_id, body):
+    item_name, date, customer_name, quantity, unit_price = _sale_fields(body)
+    return database.edit_sale(sale_id, date, customer_name, item_name, quantity, unit_price)
+
+
+def _debtor_fields(body):
+    return (_text(body, "name"), _text(body, "item"), validation.validate_date(body.get("date", "")),
+            validation.parse_quantity(body.get("quantity")), validation.parse_unit_price(body.get("unit_price")))
+
+
+def _create_debtor(body):
+    return database.post_debtor(*_debtor_fields(body))
+
+
+def _update_debtor(debtor_id, body):
+    return database.update_debtor(debtor_id, *_debtor_fields(body))
+
+
+def _debt_fields(body):
+    return (_text(body, "creditor"), validation.validate_date(body.get("date", "")), _text(body, "goods_purchased"),
+            validation.parse_quantity(body.get("quantity")), validation.parse_unit_price(body.get("unit_price")))
+
+
+def _create_debt(body):
+    return database.add_debt(*_debt_fields(body))
+
+
+def _update_debt(debt_id, body):
+    creditor, date, goods_purchased, quantity, unit_price = _debt_fields(body)
+    return database.update_debt(debt_id, creditor, date, goods_purchased, quantity, unit_price, quantity * unit_price)
+
+
+# (create, update, delete) for each writable table
+WRITERS = {
+    "products": (_create_product, _update_product, database.delete_product),
+    "purchases": (_create_purchase, _update_purchase, database.delete_purchase),
+    "sales": (_create_sale, _update_sale, database.delete_sale),
+    "debtors": (_create_debtor, _update_debtor, database.delete_debtor),
+    "debts": (_create_debt, _update_debt, database.delete_debt),
+}
+
+
+ACTION_WORDS = {"create": "Created", "update": "Updated", "delete": "Deleted"}
+
+
+def _write(table, action, row_id, body):
+    """Runs on the writer thread."""
+    create, update, delete = WRITERS[table]
+    if action == "create":
+        row_id = _saved(create(body))
+    elif not _row_exists(table, row_id):
+        raise ApiError(HTTPStatus.NOT_FOUND, f"No {table} row with id {row_id}.")
+    elif action == "update":
+        _saved(update(row_id, body))
+    else:
+        _saved(delete(row_id))
+    database.log_activity(API_USERNAME, f"{ACTION_WORDS[action]} {table} row {row_id} via the API")
+    return row_id
+
+
+# The keyset-paged readers; their rows are in the same column order as RESOURCES
+PAGE_READERS = {
+    "products": database.get_products_page,
+    "purchases": database.get_purchases_page,
+    "sales": database.get_sales_page,
+    "debtors": database.get_debtors_page,
+    "debts": database.get_debts_page,
+    "users": database.get_users_page,
+}
+
+
+def _read_page(table, limit, token, order):
+    """Runs on a reader thread."""
+    if order == "id":
+        rows, token = PAGE_READERS[table](limit, token)
+    elif "date" in RESOURCES[table]:
+        rows, token = PAGE_READERS[table](limit, token, order=order)
+    else:
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"{table} can only be ordered by id.")
+    columns = RESOURCES[table]
+    return {"rows": [dict(zip(columns, row)) for row in rows], "next": token}
+
+
+def _read_row(table, row_id):
+    columns = RESOURCES[table]
+    rows = database.fetch_rows(table, columns, row_id, 1, inclusive=True)
+    if not rows or rows[0][0] != row_id:
+        raise ApiError(HTTPStatus.NOT_FOUND, f"No {table} row with id {row_id}.")
+    return dict(zip(columns, rows[0]))
+
+
+def _int_parameter(query, name, default):
+    values = query.get(name)
+    if not values:
+        return default
+    try:
+        return int(values[0])
+    except ValueError:
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"'{name}' must be an integer.")
+
+
+class ApiServer:
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, read_workers=database.POOL_SIZE):
+        self.host = host
+        self.port = port
+        self.readers = ThreadPoolExecutor(read_workers, thread_name_prefix="api-read")
+        self.writer = ThreadPoolExecutor(1, thread_name_prefix="api-write", initializer=database.hold_connection)
+        self.server = None
+        self.connections = {}  # connection task -> its stream writer
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        # Port 0 picks a free port; report the one we got
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            # Idle keep-alive connections would otherwise be cancelled mid-read
+            for writer in list(self.connections.values()):
+                writer.close()
+            if self.connections:
+                await asyncio.wait(list(self.connections), timeout=KEEP_ALIVE_TIMEOUT)
+            await self.server.wait_closed()
+        self.readers.shutdown(wait=True)
+        self.writer.submit(database.drop_connection)
+        self.writer.shutdown(wait=True)
+
+    async def _run(self, executor, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+
+    # Routing
+
+    async def dispatch(self, method, target, body, nested=False):
+        """Handle one request and return (status, JSON-serialisable response).
+
+        nested is set for the entries of a batch, which may not be batches themselves.
+        """
+        try:
+            return HTTPStatus.OK, await self._route(method, target, body, nested)
+        except ApiError as e:
+            return e.status, {"error": str(e)}
+        except database.DuplicateError as e:
+            return HTTPStatus.CONFLICT, {"error": str(e)}
+        except ValueError as e:
+            return HTTPStatus.BAD_REQUEST, {"error": str(e)}
+        except Exception as e:
+            error_logger.log_error(e)
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {"error": "Internal server error."}
+
+    async def _route(self, method, target, body, nested=False):
+        url = urlsplit(target)
+        parts = [part for part in url.path.split("/") if part]
+
+        if parts == ["health"] and method == "GET":
+            return {"status": "ok"}
+        if parts == ["batch"] and method == "POST":
+            if nested:
+                raise ApiError(HTTPStatus.BAD_REQUEST, "A batch cannot contain another batch.")
+            return await self._batch(body)
+        if parts == ["search"] and method == "GET":
+            query = parse_qs(url.query)
+            limit = min(max(_int_parameter(query, "limit", database.SEARCH_LIMIT), 1), MAX_PAGE_LIMIT)
+            results = await self._run(self.readers, database.search, query.get("q", [""])[0], limit)
+            return {"results": [dict(zip(SEARCH_FIELDS, result)) for result in results]}
+
+        if not parts or len(parts) > 2 or parts[0] not in RESOURCES:
+            raise ApiError(HTTPStatus.NOT_FOUND, f"Unknown path '{url.path}'.")
+        table = parts[0]
+        row_id = None
+        if len(parts) == 2:
+            try:
+                row_id = int(parts[1])
+            except ValueError:
+                raise ApiError(HTTPStatus.NOT_FOUND, f"'{parts[1]}' is not a row id.")
+
+        if method == "GET":
+            if row_id is not None:
+                return await self._run(self.readers, _read_row, table, row_id)
+            query = parse_qs(url.query)
+            limit = min(max(_int_parameter(query, "limit", PAGE_LIMIT), 1), MAX_PAGE_LIMIT)
+            token = query.get("page", [None])[0]
+            order = query.get("order", ["id"])[0]
+            return await self._run(self.readers, _read_page, table, limit, token, order)
+
+        if table not in WRITERS:
+            raise ApiError(HTTPStatus.METHOD_NOT_ALLOWED, f"{table} is read-only.")
+        if method == "POST" and row_id is None:
+            action = "create"
+        elif method == "PUT" and row_id is not None:
+            action = "update"
+        elif method == "DELETE" and row_id is not None:
+            action = "delete"
+        else:
+            raise ApiError(HTTPStatus.METHOD_NOT_ALLOWED, f"{method} is not supported on {url.path}.")
+        if action != "delete" and not isinstance(body, dict):
+            raise ApiError(HTTPStatus.BAD_REQUEST, "Expected a JSON object.")
+        return {"id": await self._run(self.writer, _write, table, action, row_id, body)}
+
+    async def _batch(self, body):
+        requests = body.get("requests") if isinstance(body, dict) else None
+        if not isinstance(requests, list):
+            raise ApiError(HTTPStatus.BAD_REQUEST, "Expected {\"requests\": [...]}.")
+        if len(requests) > MAX_BATCH_SIZE:
+            raise ApiError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"At most {MAX_BATCH_SIZE} requests per batch.")
+
+        # Run in order, so a batch can create a row and then refer to it
+        responses = []
+        for request in requests:
+            if not isinstance(request, dict) or not isinstance(request.get("path"), str):
+                responses.append({"status": HTTPStatus.BAD_REQUEST, "body": {"error": "Invalid batch entry."}})
+                continue
+            status, response = await self.dispatch(str(request.get("method", "GET")).upper(), request["path"],
+                                                   request.get("body"), nested=True)
+            responses.append({"status": int(status), "body": response})
+        return {"responses": responses}
+
+    # HTTP
+
+    async def _handle_connection(self, reader, writer):
+        task = asyncio.current_task()
+        self.connections[task] = writer
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(self._read_request(reader), KEEP_ALIVE_TIMEOUT)
+                except ApiError as e:
+                    await self._respond(writer, e.status, {"error": str(e)}, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                method, target, body, keep_alive = request
+                status, response = await self.dispatch(method, target, body)
+                await self._respond(writer, status, response, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            del self.connections[task]
+            writer.close()
+
+    async def _read_request(self, reader):
+        request_line = await reader.readline()
+        if not request_line.strip():
+            return None
+        try:
+            method, target, version = request_line.decode("latin-1").split()
+        except ValueError:
+            raise ApiError(HTTPStatus.BAD_REQUEST, "Malformed request line.")
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get("content-length", 0))
+        except ValueError:
+            raise ApiError(HTTPStatus.BAD_REQUEST, "Invalid Content-Length.")
+        if length > MAX_BODY_SIZE:
+            raise ApiError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Request body too large.")
+        body = None
+        if length:
+            try:
+                body = json.loads(await reader.readexactly(length))
+            except (UnicodeDecodeError, json.JSONDecodeError):
+                raise ApiError(HTTPStatus.BAD_REQUEST, "Request body is not valid JSON.")
+
+        connection = headers.get("connection", "").lower()
+        if version == "HTTP/1.0":
+            keep_alive = connection == "keep-alive"
+        else:
+            keep_alive = connection != "close"
+        return method.upper(), target, body, keep_alive
+
+    async def _respond(self, writer, status, response, keep_alive):
+        payload = json.dumps(response).encode("utf-8")
+        status = HTTPStatus(status)
+        writer.write(
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+            "\r\n".encode("latin-1") + payload)
+        await writer.drain()
+
+
+async def _serve(host, port):
+    server = ApiServer(host, port)
+    await server.start()
+    print(f"Serving the Motob API on http://{host}:{server.port}", flush=True)
+    try:
+        await server.server.serve_forever()
+    finally:
+        await server.close()
+
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """Run the API until interrupted. The database must already be initialised."""
+    try:
+        asyncio.run(_serve(host, port))
+    except KeyboardInterrupt:
+        pass
+
+
+def add_arguments(parser):
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--database", help=f"SQLite file to serve (default {database.DATABASE_FILE})")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the Motob database as a JSON API")
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.database:
+        database.DATABASE_FILE = args.database
+    error_logger.init_error_log()
+    database.initialize_database()
+    database.start_checkpoint_scheduler()
+    try:
+        serve(args.host, args.port)
+    finally:
+        database.shutdown_database()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
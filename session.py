@@ -0,0 +1,62 @@
+import database
+from admin_gui import AdminWindow
+from motob_app import MotobApp
+from user_gui import MainUserWindow
+
+
+class SessionManager:
+    """Builds the windows a login needs, and only once someone has logged in.
+
+    There is a single MotobApp, created on the first successful login and
+    kept for every later one; it moves between the admin and user windows,
+    which are likewise built on first use and shown again on the next login.
+    """
+
+    def __init__(self):
+        self.motob_app = None
+        self.admin_window = None
+        self.user_window = None
+        self.username = None
+
+    def get_motob_app(self):
+        if self.motob_app is None:
+            self.motob_app = MotobApp()
+        return self.motob_app
+
+    def _attach_motob_app(self, window):
+        motob_app = self.get_motob_app()
+        previous = motob_app.parentWidget()
+        if previous is not None and previous.layout() is not None:
+            previous.layout().removeWidget(motob_app)
+        window.attach_motob_app(motob_app)
+
+    def start_admin_session(self, username, logout_function):
+        self.end_session()
+        if self.admin_window is None:
+            self.admin_window = AdminWindow(self.get_motob_app(), logout_function)
+        else:
+            self._attach_motob_app(self.admin_window)
+        self.username = username
+        database.log_activity(username, "Logged in (admin)")
+        self.admin_window.show()
+        return self.admin_window
+
+    def start_user_session(self, username, logout_function):
+        self.end_session()
+        if self.user_window is None:
+            self.user_window = MainUserWindow(username, logout_function, self.get_motob_app())
+        else:
+            self.user_window.set_username(username)
+            self._attach_motob_app(self.user_window)
+        self.username = username
+        database.log_activity(username, "Logged in (user)")
+        self.user_window.show()
+        return self.user_window
+
+    def end_session(self):
+        for window in (self.admin_window, self.user_window):
+            if window is not None:
+                window.hide()
+        if self.username is not None:
+            database.log_activity(self.username, "Logged out")
+        self.username = None
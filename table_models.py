@@ -0,0 +1,788 @@
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, deque
+from functools import partial
+from itertools import accumulate
+import weakref
+
+from PyQt5.QtCore import Qt, QAbstractTableModel, QEvent, QModelIndex, QRect, QVariant, pyqtSignal
+from PyQt5.QtGui import QCursor
+from PyQt5.QtWidgets import QApplication, QStyle, QStyledItemDelegate, QStyleOptionButton
+
+import async_database
+import database
+import error_logger
+
+# Rows are pulled from SQLite one page at a time as the view scrolls
+# (canFetchMore/fetchMore). Only the id that starts each page is kept for
+# every page seen so far; the rows themselves live in a small LRU cache and
+# are re-read by id when a page that fell out of it is scrolled back into view.
+#
+# The model also listens for changes made through the database module and
+# applies each one to the single page the row belongs to, so adding, editing
+# or deleting a row costs the same however long the table is. Pages therefore
+# don't stay exactly PAGE_SIZE long; each keeps its own row count. All of
+# these reads run on the async_database workers, never on the GUI thread.
+PAGE_SIZE = 256
+MAX_CACHED_PAGES = 16
+
+
+
+class _ChangeForwarder:
+    # Holds the model weakly: a model without a parent can be garbage
+    # collected without its destroyed signal ever reaching Python
+    def __init__(self, model):
+        self.model_ref = weakref.ref(model)
+
+    def __call__(self, table, change, record_id):
+        model = self.model_ref()
+        if model is None:
+            database.remove_change_listener(self)
+            return
+        model._database_changed.emit(table, change, record_id)
+
+
+class SqlTableModel(QAbstractTableModel):
+    """Read-only model over one table, ordered by id.
+
+    `columns` are the SQL columns to show, the first of which must be id.
+    With `action_column` an extra, empty last column is added for the
+    Edit/Delete actions. Rows added, edited or deleted through the database
+    module appear, change or disappear without reloading the table.
+    """
+
+    # Emitted once the rows asked for by refresh(background=True) are in
+    loaded = pyqtSignal()
+
+    # Carries database change notifications onto the thread the model lives in
+    _database_changed = pyqtSignal(str, str, int)
+
+    def __init__(self, table, columns, headers, action_column=True, parent=None,
+                 page_size=PAGE_SIZE, max_cached_pages=MAX_CACHED_PAGES):
+        super().__init__(parent)
+        self.table = table
+        self.columns = list(columns)
+        self.headers = list(headers)
+        self.action_column = len(self.columns) if action_column else None
+        self.page_size = page_size
+        self.max_cached_pages = max_cached_pages
+        self._generation = 0
+        self._loading = False
+        self._filter = (None, [], None)
+        self._changed_while_loading = False
+        self._fetching = False
+        self._pending_pages = set()
+        self._task = None
+        self._tasks = deque()
+        self._reset_state()
+
+        self._database_changed.connect(self._apply_change)
+        listener = _ChangeForwarder(self)
+        database.add_change_listener(listener)
+        self.destroyed.connect(lambda: database.remove_change_listener(listener))
+        # A read still in flight must not report back to a deleted model
+        self.destroyed.connect(lambda: async_database.get_async_database().cancel(self))
+        self.destroyed.connect(lambda: async_database.get_async_database().cancel((self, "task")))
+
+    def _reset_state(self):
+        self._page_starts = []   # lowest id each page may hold
+        self._page_counts = []
+        self._page_offsets = None  # first row of each page, worked out again after a change
+        self._pages = OrderedDict()
+        self._row_count = 0
+        self._last_id = None
+        self._exhausted = False
+
+    # Qt model interface
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return self._row_count
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.headers)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return QVariant()
+        if orientation == Qt.Horizontal and 0 <= section < len(self.headers):
+            return self.headers[section]
+        if orientation == Qt.Vertical:
+            return section + 1
+        return QVariant()
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.column() == self.action_column:
+            return QVariant()
+        if role == Qt.DisplayRole:
+            record = self.record(index.row())
+            if record is None:
+                return QVariant()
+            value = record[index.column()]
+            return "" if value is None else str(value)
+        if role == Qt.TextAlignmentRole:
+            return Qt.AlignCenter
+        return QVariant()
+
+    def canFetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self._loading or self._fetching:
+            return False
+        return not self._exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        if not self.canFetchMore(parent):
+            return
+        self._fetching = True
+        self._schedule(self._fetch_more())
+
+    def _fetch_more(self):
+        try:
+            rows = yield partial(self._fetch_rows, self._last_id, self.page_size)
+        except Exception:
+            # The worker has logged it
+            self._exhausted = True
+            return
+        finally:
+            self._fetching = False
+        self._append_page(rows)
+
+    def _append_page(self, rows):
+        if len(rows) < self.page_size:
+            self._exhausted = True
+        if not rows:
+            return
+
+        # A short page means the end of the table was reached
+        page_number = len(self._page_starts)
+        self._page_starts.append(rows[0][0])
+        self._page_counts.append(len(rows))
+        self._page_offsets = None
+        self._last_id = rows[-1][0]
+        self._cache_page(page_number, rows)
+
+        self.beginInsertRows(QModelIndex(), self._row_count, self._row_count + len(rows) - 1)
+        self._row_count += len(rows)
+        self.endInsertRows()
+
+    # Background reads
+    #
+    # Every read after the first page goes through one queue of tasks per
+    # model, run one at a time so each sees the pages as the one before it
+    # left them. A task is a generator that yields a function to call on the
+    # async_database workers and is sent back its result (or has the error
+    # thrown into it) on the GUI thread. refresh() drops the whole queue.
+
+    def _schedule(self, task):
+        self._tasks.append(task)
+        if self._task is None:
+            self._run_tasks()
+
+    def _run_tasks(self, result=None, error=None):
+        while self._task is not None or self._tasks:
+            if self._task is None:
+                self._task = self._tasks.popleft()
+                result, error = None, None
+            task, generation = self._task, self._generation
+            try:
+                read = task.send(result) if error is None else task.throw(error)
+            except StopIteration:
+                read = None
+            except Exception as e:
+                error_logger.log_error(e)
+                read = None
+            if generation != self._generation:
+                # The task refreshed the model, which dropped it and the queue
+                task.close()
+                return
+            if read is None:
+                self._task = None
+                continue
+            async_database.get_async_database().submit(
+                read, key=(self, "task"),
+                on_result=partial(self._on_task_read, generation),
+                on_error=partial(self._on_task_failed, generation))
+            return
+
+    def _on_task_read(self, generation, result):
+        if generation == self._generation:
+            self._run_tasks(result)
+
+    def _on_task_failed(self, generation, error):
+        if generation == self._generation:
+            self._run_tasks(error=error)
+
+    def _drop_tasks(self):
+        # Not closed here: refresh() may be running inside the current task
+        self._task = None
+        self._tasks.clear()
+        self._fetching = False
+        self._pending_pages = set()
+        async_database.get_async_database().cancel((self, "task"))
+
+    # Row access
+
+    def _fetch_rows(self, start_id, limit, inclusive=False, end_id=None):
+        where, parameters, index = self._filter
+        return database.fetch_rows(self.table, self.columns, start_id, limit, inclusive, end_id,
+                                   where=where, parameters=parameters, index=index)
+
+    def _cache_page(self, page_number, rows):
+        self._pages[page_number] = rows
+        self._pages.move_to_end(page_number)
+        while len(self._pages) > self.max_cached_pages:
+            self._pages.popitem(last=False)
+
+    def _load_page(self, page_number):
+        # Use with yield from inside a task
+        rows = self._pages.get(page_number)
+        if rows is not None:
+            self._pages.move_to_end(page_number)
+            return rows
+        # A page holds every id from its own start up to the next page's start,
+        # so it reads back correctly even after rows were added or removed.
+        # The first page starts from the beginning of the table, which matters
+        # once an edit makes an earlier row match the filter.
+        if page_number + 1 < len(self._page_starts):
+            end_id = self._page_starts[page_number + 1]
+        else:
+            end_id = self._last_id + 1
+        start_id = self._page_starts[page_number] if page_number else None
+        rows = yield partial(self._fetch_rows, start_id, None, True, end_id)
+        self._cache_page(page_number, rows)
+        return rows
+
+    def _show_page(self, page_number):
+        try:
+            yield from self._load_page(page_number)
+        except Exception:
+            return
+        finally:
+            self._pending_pages.discard(page_number)
+        first = self._offsets()[page_number]
+        if self._page_counts[page_number]:
+            self.dataChanged.emit(self.index(first, 0),
+                                  self.index(first + self._page_counts[page_number] - 1, len(self.headers) - 1))
+
+    def _offsets(self):
+        if self._page_offsets is None:
+            self._page_offsets = [0] + list(accumulate(self._page_counts))[:-1]
+        return self._page_offsets
+
+    def record(self, row):
+        """Return the database row shown at `row`, or None if it is out of range.
+
+        A row whose page has dropped out of the cache is also None for now;
+        the page is read in the background and its rows repainted once it is in.
+        """
+        if not 0 <= row < self._row_count:
+            return None
+        offsets = self._offsets()
+        # bisect_right skips over pages that have been emptied by deletes
+        page_number = bisect_right(offsets, row) - 1
+        rows = self._pages.get(page_number)
+        if rows is None:
+            if page_number not in self._pending_pages:
+                self._pending_pages.add(page_number)
+                self._schedule(self._show_page(page_number))
+            return None
+        self._pages.move_to_end(page_number)
+        offset = row - offsets[page_number]
+        return rows[offset] if offset < len(rows) else None
+
+    def record_id(self, row):
+        record = self.record(row)
+        return record[0] if record is not None else None
+
+    def record_by_id(self, record_id):
+        """Read the row with `record_id` straight from the database."""
+        rows = database.fetch_rows(self.table, self.columns, record_id, 1, inclusive=True)
+        if rows and rows[0][0] == record_id:
+            return rows[0]
+        return None
+
+    def _matching_record(self, record_id):
+        # Like record_by_id, but None unless the row passes the filter
+        rows = yield partial(self._fetch_rows, record_id, 1, True)
+        if rows and rows[0][0] == record_id:
+            return rows[0]
+        return None
+
+    # Change notifications
+
+    def _apply_change(self, table, change, record_id):
+        if table != self.table:
+            return
+        if self._loading:
+            # The background read may or may not include this change; read again
+            self._changed_while_loading = True
+            return
+        if change == "reload":
+            self.refresh(background=True)
+            return
+        self._schedule(self._change_task(change, record_id))
+
+    def _change_task(self, change, record_id):
+        try:
+            if change == "insert":
+                yield from self._insert_record(record_id)
+            elif change == "update":
+                yield from self._update_record(record_id)
+            elif change == "delete":
+                yield from self._remove_record(record_id)
+        except Exception as e:
+            error_logger.log_error(e)
+            self.refresh(background=True)
+
+    def _locate(self, record_id):
+        """Find where record_id belongs.
+
+        Returns (page number, rows of that page, position of record_id in
+        them, whether it is there, whether the page was already cached). A
+        page that had to be read from the database already reflects the
+        change being applied.
+        """
+        page_number = max(bisect_right(self._page_starts, record_id) - 1, 0)
+        cached = page_number in self._pages
+        rows = yield from self._load_page(page_number)
+        position = bisect_left([row[0] for row in rows], record_id)
+        found = position < len(rows) and rows[position][0] == record_id
+        return page_number, rows, position, found, cached
+
+    def _insert_record(self, record_id):
+        if self._last_id is None or record_id > self._last_id:
+            # Rows past the last one fetched turn up with the next fetchMore
+            if not self._exhausted:
+                return
+            record = yield from self._matching_record(record_id)
+            if record is None:
+                return
+            if not self._page_counts or self._page_counts[-1] >= self.page_size:
+                self._page_starts.append(record_id)
+                self._page_counts.append(0)
+                self._page_offsets = None
+                self._cache_page(len(self._page_counts) - 1, [])
+            page_number = len(self._page_counts) - 1
+            rows = yield from self._load_page(page_number)
+            position = len(rows)
+            self._last_id = record_id
+        else:
+            page_number, rows, position, found, cached = yield from self._locate(record_id)
+            if cached:
+                if found:
+                    return
+                record = yield from self._matching_record(record_id)
+                if record is None:
+                    return
+            elif not found or len(rows) != self._page_counts[page_number] + 1:
+                return
+            else:
+                record = None  # already in the page that was just read
+            self._page_starts[page_number] = min(self._page_starts[page_number], record_id)
+
+        self._insert_at(page_number, rows, position, record)
+
+    def _insert_at(self, page_number, rows, position, record):
+        row = self._offsets()[page_number] + position
+        self.beginInsertRows(QModelIndex(), row, row)
+        if len(rows) == self._page_counts[page_number]:
+            rows.insert(position, record)
+        self._page_counts[page_number] += 1
+        self._page_offsets = None
+        self._row_count += 1
+        self.endInsertRows()
+
+    def _update_record(self, record_id):
+        # With a filter, an edit can also bring a row into the table or take it out
+        if not self._page_starts or record_id > self._last_id:
+            if self._filter[0]:
+                yield from self._insert_record(record_id)
+            return
+        page_number, rows, position, found, cached = yield from self._locate(record_id)
+        if cached:
+            record = yield from self._matching_record(record_id)
+            if record is None:
+                if found:
+                    self._remove_at(page_number, rows, position, cached)
+                return
+            if not found:
+                self._insert_at(page_number, rows, position, record)
+                return
+            rows[position] = record
+        elif len(rows) == self._page_counts[page_number] + 1 and found:
+            self._insert_at(page_number, rows, position, None)
+            return
+        elif len(rows) == self._page_counts[page_number] - 1 and not found:
+            self._remove_at(page_number, rows, position, cached)
+            return
+        elif not found:
+            return
+        row = self._offsets()[page_number] + position
+        self.dataChanged.emit(self.index(row, 0), self.index(row, len(self.columns) - 1))
+
+    def _remove_record(self, record_id):
+        if not self._page_starts or record_id > self._last_id:
+            return
+        page_number, rows, position, found, cached = yield from self._locate(record_id)
+        if cached:
+            if not found:
+                return
+        elif found or len(rows) != self._page_counts[page_number] - 1:
+            return
+        self._remove_at(page_number, rows, position, cached)
+
+    def _remove_at(self, page_number, rows, position, cached):
+        row = self._offsets()[page_number] + position
+        self.beginRemoveRows(QModelIndex(), row, row)
+        if cached:
+            del rows[position]
+        self._page_counts[page_number] -= 1
+        self._page_offsets = None
+        self._row_count -= 1
+        self.endRemoveRows()
+
+    def set_filter(self, where=None, parameters=(), index=None):
+        """Show only the rows matching a filter from database.build_filter().
+
+        The rows are read again in the background; call with no arguments to
+        show every row.
+        """
+        self._filter = (where, list(parameters), index)
+        self.refresh(background=True)
+
+    def refresh(self, background=False):
+        """Drop everything loaded so far and start again from the first page.
+
+        With background=True the first page is read by the async_database
+        workers and the rows appear, followed by `loaded`, once it is done;
+        a newer refresh cancels the read if it is still outstanding. Without
+        it the first page is read before refresh returns.
+        """
+        self.beginResetModel()
+        self._drop_tasks()
+        self._reset_state()
+        self._generation += 1
+        self._loading = background
+        self._changed_while_loading = False
+        self.endResetModel()
+        if background:
+            async_database.get_async_database().submit(
+                self._fetch_rows, None, self.page_size, key=self,
+                on_result=partial(self._on_first_page_loaded, self._generation),
+                on_error=partial(self._on_first_page_failed, self._generation))
+        else:
+            try:
+                self._append_page(self._fetch_rows(None, self.page_size))
+            except Exception as e:
+                error_logger.log_error(e)
+                self._exhausted = True
+            self.loaded.emit()
+
+    def _on_first_page_loaded(self, generation, rows):
+        # A refresh that started after this read has made it stale
+        if generation != self._generation:
+            return
+        if self._changed_while_loading:
+            self.refresh(background=True)
+            return
+        self._loading = False
+        self._append_page(rows)
+        self.loaded.emit()
+
+    def _on_first_page_failed(self, generation, error):
+        # The worker has logged it; show an empty table rather than spin forever
+        self._on_first_page_loaded(generation, [])
+
+    def is_loading(self):
+        return self._loading
+
+    def cached_row_count(self):
+        return sum(len(rows) for rows in self._pages.values())
+
+
+class KeysetPagedModel(QAbstractTableModel):
+    """Rows paged by a database token, appended as the view scrolls.
+
+    Subclasses set headers and implement page_reader(), returning a callable
+    that takes the token of the page to read and returns (rows, next token),
+    like the get_*_page functions. Every page, the first included, is read on
+    the async_database workers. A page that fails to load is logged and can
+    be asked for again.
+    """
+
+    # Emitted on the GUI thread each time a page has been added
+    loaded = pyqtSignal()
+
+    headers = []
+
+    def __init__(self, parent=None, page_size=PAGE_SIZE):
+        super().__init__(parent)
+        self.page_size = page_size
+        self._rows = []
+        self._token = None
+        self._exhausted = True
+        self._loading = False
+        self._generation = 0
+        self.destroyed.connect(lambda: async_database.get_async_database().cancel(self))
+
+    def page_reader(self):
+        raise NotImplementedError
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.headers)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return QVariant()
+        if orientation == Qt.Horizontal and 0 <= section < len(self.headers):
+            return self.headers[section]
+        if orientation == Qt.Vertical:
+            return section + 1
+        return QVariant()
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self._loading and not self._exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        if self.canFetchMore(parent):
+            self._read_page(self._token)
+
+    def refresh(self):
+        """Start again from the first page."""
+        self.beginResetModel()
+        self._clear_rows()
+        self._token = None
+        self._exhausted = False
+        self._generation += 1
+        self.endResetModel()
+        self._read_page(None)
+
+    def _clear_rows(self):
+        self._rows = []
+
+    def _read_page(self, token):
+        self._loading = True
+        async_database.get_async_database().submit(
+            self.page_reader(), token, key=self,
+            on_result=partial(self._on_page_loaded, self._generation),
+            on_error=partial(self._on_page_failed, self._generation))
+
+    def _on_page_loaded(self, generation, page):
+        if generation != self._generation:
+            return
+        self._loading = False
+        self._append_page(page)
+        self.loaded.emit()
+
+    def _on_page_failed(self, generation, error):
+        # The worker has logged it; the token is unchanged, so the same page is read next time
+        if generation == self._generation:
+            self._loading = False
+
+    def _append_page(self, page):
+        rows, self._token = page
+        self._exhausted = self._token is None
+        if not rows:
+            return
+        self.beginInsertRows(QModelIndex(), len(self._rows), len(self._rows) + len(rows) - 1)
+        self._add_rows(rows)
+        self.endInsertRows()
+
+    def _add_rows(self, rows):
+        self._rows.extend(rows)
+
+    def is_loading(self):
+        return self._loading
+
+
+class ActivityLogModel(KeysetPagedModel):
+    """Read-only model over the activity log, newest first.
+
+    Pages come from database.get_activity_log() as the view scrolls, each
+    continuing from the token of the one before, so opening the log reads one
+    page however many entries it holds. Entries logged after the first page
+    was read show up on the next refresh().
+    """
+
+    headers = ["Time (UTC)", "User", "Action"]
+
+    def __init__(self, parent=None, page_size=PAGE_SIZE):
+        super().__init__(parent, page_size)
+        self.criteria = {}
+
+    def page_reader(self):
+        return partial(database.get_activity_log, self.page_size, **self.criteria)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return QVariant()
+        # Rows are (id, timestamp, username, action); the id is not shown
+        value = self._rows[index.row()][index.column() + 1]
+        return "" if value is None else str(value)
+
+    def set_filter(self, **criteria):
+        """Show only the entries matching get_activity_log() criteria, read again in the background."""
+        self.criteria = {name: value for name, value in criteria.items() if value}
+        self.refresh()
+
+
+class UserPermissionsModel(KeysetPagedModel):
+    """Users with a checkbox column per permission in database.USER_PERMISSIONS.
+
+    Users are read a page at a time as the view scrolls. Ticking a box, or
+    set_permissions() for several rows at once, writes in one transaction on
+    the database workers; once it is in, only the rows that changed are
+    repainted.
+    """
+
+    # The usernames whose permissions changed and the {permission: granted} written
+    permissions_changed = pyqtSignal(list, dict)
+    write_failed = pyqtSignal(object)
+
+    permission_headers = {"has_permissions": "Edit & Delete Privilege"}
+
+    def __init__(self, parent=None, page_size=PAGE_SIZE):
+        super().__init__(parent, page_size)
+        self.permissions = list(database.USER_PERMISSIONS)
+        self.headers = ["Username", "Admin"] + [self.permission_headers.get(permission, permission)
+                                                for permission in self.permissions]
+        self._rows = []  # [id, username, is_admin, *permissions]
+        self._row_by_username = {}
+
+    def page_reader(self):
+        return partial(database.get_users_page, self.page_size)
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        flags = Qt.ItemIsEnabled | Qt.ItemIsSelectable
+        if index.column() >= 2:
+            flags |= Qt.ItemIsUserCheckable
+        return flags
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return QVariant()
+        value = self._rows[index.row()][index.column() + 1]
+        if index.column() == 0:
+            return value if role == Qt.DisplayRole else QVariant()
+        if role == Qt.CheckStateRole:
+            return Qt.Checked if value else Qt.Unchecked
+        return QVariant()
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if role != Qt.CheckStateRole or not index.isValid() or index.column() < 2:
+            return False
+        # The box changes once the write is in; see _permissions_written
+        self.set_permissions([index.row()], **{self.permissions[index.column() - 2]: value == Qt.Checked})
+        return True
+
+    def _clear_rows(self):
+        self._rows = []
+        self._row_by_username = {}
+
+    def _add_rows(self, rows):
+        for row in rows:
+            self._row_by_username[row[1]] = len(self._rows)
+            self._rows.append(list(row))
+
+    def username(self, row):
+        return self._rows[row][1]
+
+    def set_permissions(self, rows, **permissions):
+        """Grant or revoke permissions for the users at `rows`, e.g. has_permissions=True.
+
+        Returns the DatabaseRequest, whose finished signal carries the
+        usernames whose permissions actually changed.
+        """
+        usernames = [self.username(row) for row in rows]
+        if not usernames or not permissions:
+            return None
+        return async_database.get_async_database().submit(
+            database.set_user_permissions, usernames,
+            on_result=partial(self._permissions_written, usernames, permissions),
+            on_error=self.write_failed.emit, **permissions)
+
+    def _permissions_written(self, usernames, permissions, changed):
+        # Every user asked for now holds these values, including any whose
+        # row was out of date; repaint just the rows that show something new
+        first_column = 2 + min(self.permissions.index(permission) for permission in permissions)
+        last_column = 2 + max(self.permissions.index(permission) for permission in permissions)
+        for username in usernames:
+            # Users not fetched yet are read with the new values
+            row = self._row_by_username.get(username)
+            if row is None:
+                continue
+            values = self._rows[row]
+            before = list(values)
+            for permission, granted in permissions.items():
+                values[3 + self.permissions.index(permission)] = int(bool(granted))
+            if values != before:
+                self.dataChanged.emit(self.index(row, first_column), self.index(row, last_column),
+                                      [Qt.CheckStateRole])
+        self.permissions_changed.emit(changed, permissions)
+
+
+class RowActionDelegate(QStyledItemDelegate):
+    """Paints Edit/Delete buttons in the action column instead of creating widgets.
+
+    Nothing is allocated per row: the buttons are drawn with the current style
+    and clicks are resolved to the record id of the row that was clicked, so
+    they stay correct however the rows have moved since they were painted.
+    """
+
+    edit_requested = pyqtSignal(int)
+    delete_requested = pyqtSignal(int)
+
+    ACTIONS = ("Edit", "Delete")
+    MARGIN = 3
+
+    def _button_rects(self, rect):
+        width = (rect.width() - self.MARGIN * (len(self.ACTIONS) + 1)) // len(self.ACTIONS)
+        height = rect.height() - 2 * self.MARGIN
+        return [QRect(rect.left() + self.MARGIN + i * (width + self.MARGIN), rect.top() + self.MARGIN, width, height)
+                for i in range(len(self.ACTIONS))]
+
+    def paint(self, painter, option, index):
+        view = self.parent()
+        widget = option.widget
+        style = widget.style() if widget is not None else QApplication.style()
+        cursor = view.viewport().mapFromGlobal(QCursor.pos()) if view is not None else None
+
+        for text, rect in zip(self.ACTIONS, self._button_rects(option.rect)):
+            button = QStyleOptionButton()
+            button.rect = rect
+            button.text = text
+            button.state = QStyle.State_Enabled | QStyle.State_Raised
+            if cursor is not None and rect.contains(cursor):
+                button.state |= QStyle.State_MouseOver
+            style.drawControl(QStyle.CE_PushButton, button, painter, widget)
+
+    def sizeHint(self, option, index):
+        size = super().sizeHint(option, index)
+        metrics = option.fontMetrics
+        width = sum(metrics.horizontalAdvance(text) + 24 for text in self.ACTIONS)
+        size.setWidth(max(size.width(), width + self.MARGIN * (len(self.ACTIONS) + 1)))
+        size.setHeight(max(size.height(), metrics.height() + 12))
+        return size
+
+    def editorEvent(self, event, model, option, index):
+        if event.type() != QEvent.MouseButtonRelease or event.button() != Qt.LeftButton:
+            # Swallow presses and double clicks too, so they don't start editing or selection tricks
+            return event.type() in (QEvent.MouseButtonPress, QEvent.MouseButtonDblClick)
+
+        for text, rect in zip(self.ACTIONS, self._button_rects(option.rect)):
+            if rect.contains(event.pos()):
+                record_id = model.record_id(index.row())
+                if record_id is None:
+                    return True
+                if text == "Edit":
+                    self.edit_requested.emit(record_id)
+                else:
+                    self.delete_requested.emit(record_id)
+                return True
+        return False
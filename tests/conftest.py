@@ -0,0 +1,18 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A freshly migrated database in a temporary directory."""
+    database.close_all_connections()
+    monkeypatch.setattr(database, "DATABASE_FILE", str(tmp_path / "motobdb.db"))
+    database.initialize_database()
+    yield tmp_path / "motobdb.db"
+    database.shutdown_database()
@@ -0,0 +1,85 @@
+import sqlite3
+
+import database
+
+
+SALE = {"item_name": "Soap", "date": "2024-01-02", "customer_name": "Ada", "quantity": 1, "unit_price": 2.5}
+DEBT = {"creditor": "Supplier", "date": "2024-01-03", "goods_purchased": "Soap", "quantity": 1, "unit_price": 2}
+
+
+def outcomes(report):
+    return [status for index, status, detail in report["rows"]]
+
+
+def test_repeated_sales_and_debts_are_all_inserted(db):
+    database.add_product("Soap", 10, 0)
+    report = database.bulk_add_sales([SALE, SALE])
+    assert (report["inserted"], report["duplicates"]) == (2, 0)
+    report = database.bulk_add_debts([DEBT, DEBT])
+    assert (report["inserted"], report["duplicates"]) == (2, 0)
+    with sqlite3.connect(db) as conn:
+        assert conn.execute("SELECT available_stock FROM products WHERE name = 'Soap'").fetchone()[0] == 8
+
+
+def test_purchases_are_deduplicated_by_content(db):
+    purchase = {"date": "2024-01-01", "item_name": "Soap", "quantity": 2, "unit_price": 1.5}
+    report = database.bulk_add_purchases([purchase, purchase])
+    assert outcomes(report) == ["inserted", "duplicate"]
+    report = database.bulk_add_purchases([purchase])
+    assert outcomes(report) == ["duplicate"]
+
+
+def test_known_keys_skip_existing_sales(db):
+    database.add_product("Soap", 10, 0)
+    database.bulk_add_sales([SALE])
+    known_keys = database.get_bulk_keys("sales")
+    report = database.bulk_add_sales([SALE, dict(SALE, customer_name="Bob")], known_keys=known_keys)
+    assert outcomes(report) == ["duplicate", "inserted"]
+    assert ("Soap", "2024-01-02", "Bob", 1, 2.5) in known_keys
+
+
+def test_rejected_sale_does_not_mark_its_key_as_seen(db):
+    database.add_product("Soap", 1, 0)
+    known_keys = set()
+    oversold = dict(SALE, quantity=5)
+    report = database.bulk_add_sales([oversold], known_keys=known_keys)
+    assert outcomes(report) == ["invalid"]
+    assert not known_keys
+
+    database.add_purchase("Soap", "2024-01-01", 10, 1.0)
+    report = database.bulk_add_sales([oversold], known_keys=known_keys)
+    assert outcomes(report) == ["inserted"]
+
+
+def test_bulk_report_marks_invalid_rows(db):
+    report = database.bulk_add_purchases([
+        {"date": "not a date", "item_name": "Soap", "quantity": 1, "unit_price": 1},
+        {"date": "2024-01-01", "item_name": "Soap", "quantity": "many", "unit_price": 1},
+        {"date": "2024-01-01", "item_name": "Soap", "quantity": 1},
+    ])
+    assert outcomes(report) == ["invalid", "invalid", "invalid"]
+    assert report["inserted"] == 0
+
+
+def test_cancelled_import_resumes_without_repeating_sales(db, tmp_path):
+    import importer
+
+    database.add_product("Soap", 100, 0)
+    ledger = tmp_path / "sales.csv"
+    # The same sale six times over: all of them are real
+    ledger.write_text("item,date,customer,qty,price\n" + "Soap,2024-01-02,Ada,1,2.5\n" * 6)
+
+    def cancel_after_first_batch(rows_done, bytes_read, total_bytes, totals):
+        raise importer.ImportCancelled()
+
+    totals = importer.import_file(str(ledger), "sales", batch_size=4, progress=cancel_after_first_batch)
+    assert (totals["inserted"], totals["cancelled"]) == (4, True)
+
+    totals = importer.import_file(str(ledger), "sales", batch_size=4)
+    assert (totals["resumed_from"], totals["inserted"], totals["duplicates"], totals["cancelled"]) == (4, 2, 0, False)
+    with sqlite3.connect(db) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM sales").fetchone()[0] == 6
+
+    # Finished, so the next import of the file starts over
+    totals = importer.import_file(str(ledger), "sales", batch_size=4)
+    assert totals["resumed_from"] == 0
@@ -0,0 +1,92 @@
+import sqlite3
+
+import pytest
+
+import database
+
+
+def count_users(path):
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT count(*) FROM users").fetchone()[0]
+
+
+def test_nested_connection_leaves_outer_transaction_open(db):
+    with database.DatabaseConnection() as (conn, cursor):
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("INSERT INTO users (username, password, is_admin) VALUES ('outer', 'x', 0)")
+        with database.DatabaseConnection() as (inner_conn, inner_cursor):
+            inner_cursor.execute("SELECT count(*) FROM users")
+        assert conn.in_transaction
+        conn.rollback()
+    assert count_users(db) == 0
+
+
+def test_connection_rolls_back_on_error(db):
+    with pytest.raises(RuntimeError):
+        with database.DatabaseConnection() as (conn, cursor):
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("INSERT INTO users (username, password, is_admin) VALUES ('failed', 'x', 0)")
+            raise RuntimeError("abandon the transaction")
+    assert count_users(db) == 0
+
+
+def test_bulk_insert_notifies_reload(db):
+    changes = []
+    listener = lambda table, change, row_id: changes.append((table, change, row_id))
+    database.add_change_listener(listener)
+    try:
+        report = database.bulk_add_purchases([
+            {"date": "2024-01-01", "item_name": "Soap", "quantity": 2, "unit_price": 1.5},
+        ])
+    finally:
+        database.remove_change_listener(listener)
+    assert report["inserted"] == 1
+    assert ("purchases", "reload", 0) in changes
+    assert ("products", "reload", 0) in changes
+
+
+def test_bulk_debts_reject_malformed_dates(db):
+    report = database.bulk_add_debts([
+        {"creditor": "Supplier", "date": "01/02/2024", "goods_purchased": "Soap", "quantity": 1, "unit_price": 2},
+        {"creditor": "Supplier", "date": "2024-02-01", "goods_purchased": "Soap", "quantity": 1, "unit_price": 2},
+    ])
+    assert report["invalid"] == 1
+    assert report["inserted"] == 1
+    assert report["rows"][0][1] == "invalid"
+
+
+def test_bulk_purchase_of_new_item_updates_product_names(db):
+    database.add_product("Liquid Wash 4L", 10, 0)
+    assert database.get_product_names() == ["Liquid Wash 4L"]
+    database.bulk_add_purchases([
+        {"date": "2024-01-01", "item_name": "Brand New", "quantity": 3, "unit_price": 2.0},
+    ])
+    assert database.get_product_names() == ["Brand New", "Liquid Wash 4L"]
+    assert database.get_product_id("Brand New") is not None
+
+
+def test_activity_log_indexes(db):
+    with sqlite3.connect(db) as conn:
+        indexes = {row[1] for row in conn.execute("PRAGMA index_list(activity_logs)")}
+        plan = conn.execute("EXPLAIN QUERY PLAN SELECT id FROM activity_logs WHERE username = 'a' "
+                            "ORDER BY timestamp DESC, username DESC, id DESC LIMIT 10").fetchall()
+    assert indexes == {"idx_activity_logs_time_user", "idx_activity_logs_user_time"}
+    assert "idx_activity_logs_user_time" in plan[0][3]
+
+
+def test_set_user_permissions_returns_only_changed_users(db):
+    for username in ("granted", "revoked"):
+        database.add_user(username, "x")
+    database.grant_permissions("granted")
+
+    changed = database.set_user_permissions(["granted", "revoked", "missing"], has_permissions=True)
+
+    assert changed == ["revoked"]
+    assert database.set_user_permissions(["granted", "revoked"], has_permissions=True) == []
+    with sqlite3.connect(db) as conn:
+        assert conn.execute("SELECT count(*) FROM users WHERE has_permissions = 1").fetchone()[0] == 2
+
+
+def test_set_user_permissions_rejects_unknown_permissions(db):
+    with pytest.raises(ValueError):
+        database.set_user_permissions(["anyone"], is_root=True)
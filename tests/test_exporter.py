@@ -0,0 +1,50 @@
+import csv
+import json
+
+import pytest
+
+import database
+import exporter
+
+
+@pytest.fixture
+def ledger(db):
+    database.post_purchase("Soap", "2024-01-01", 2, 1.5)
+    database.post_debtor("Ada", "Soap", "2024-01-02", 1, 2.0)
+
+
+@pytest.mark.parametrize("table", ["purchases", "debtors"])
+def test_default_jsonl_export_leaves_out_content_hash(ledger, tmp_path, table):
+    path = tmp_path / f"{table}.jsonl"
+    assert exporter.export_table(table, str(path)) == 1
+    with open(path, encoding="utf-8") as file:
+        row = json.loads(file.readline())
+    assert "content_hash" not in row
+    assert row["id"] == 1
+
+
+def test_default_csv_export_leaves_out_content_hash(ledger, tmp_path):
+    path = tmp_path / "purchases.csv"
+    exporter.export_table("purchases", str(path))
+    with open(path, newline="", encoding="utf-8") as file:
+        rows = list(csv.reader(file))
+    assert "content_hash" not in rows[0]
+    assert len(rows) == 2
+
+
+def test_content_hash_cannot_be_selected(ledger, tmp_path):
+    with pytest.raises(ValueError):
+        exporter.export_table("purchases", str(tmp_path / "purchases.csv"), columns=["id", "content_hash"])
+
+
+def test_parquet_export_keeps_fractional_prices(db, tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    # debtors.unit_price is declared INT but stores whatever price was entered
+    database.post_debtor("Ada", "Soap", "2024-01-02", 3, 2.5)
+    path = tmp_path / "debtors.parquet"
+    assert exporter.export_table("debtors", str(path)) == 1
+    table = pq.read_table(path)
+    assert "content_hash" not in table.column_names
+    assert table.column("unit_price").to_pylist() == [2.5]
+    assert table.column("quantity").to_pylist() == [3]
+    assert str(table.schema.field("quantity").type) == "int64"
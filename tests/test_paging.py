@@ -0,0 +1,159 @@
+import os
+import sqlite3
+import time
+
+import pytest
+
+import database
+
+
+@pytest.fixture
+def activity(db):
+    # (timestamp, username, action); two entries share a timestamp
+    entries = [
+        ("2024-01-01 09:00:00", "ada", "Logged in (user)"),
+        ("2024-01-01 10:00:00", "bob", "Logged in (admin)"),
+        ("2024-01-02 08:00:00", "ada", "Added sale"),
+        ("2024-01-02 08:00:00", "bob", "Added purchase"),
+        ("2024-01-03 12:00:00", "ada", "Logged out"),
+        ("2024-01-04 07:30:00", "cy", "Deleted SALE 4"),
+        ("2024-01-05 18:00:00", "bob", "Logged out"),
+    ]
+    with sqlite3.connect(db) as conn:
+        conn.executemany("INSERT INTO activity_logs (timestamp, username, action) VALUES (?, ?, ?)", entries)
+    return entries
+
+
+def read_all(read_page, page_size, **criteria):
+    pages, token = [], None
+    while True:
+        rows, token = read_page(page_size, token, **criteria)
+        pages.append(rows)
+        if token is None:
+            return pages
+
+
+def test_activity_log_pages_newest_first(activity):
+    pages = read_all(database.get_activity_log, 3)
+    assert [len(rows) for rows in pages] == [3, 3, 1]
+    rows = [row for rows in pages for row in rows]
+    assert [row[0] for row in rows] == [7, 6, 5, 4, 3, 2, 1]
+    assert rows[0][1:] == ("2024-01-05 18:00:00", "bob", "Logged out")
+
+
+def test_activity_log_filters(activity):
+    def ids(**criteria):
+        return [row[0] for rows in read_all(database.get_activity_log, 2, **criteria) for row in rows]
+
+    assert ids(username="ada") == [5, 3, 1]
+    assert ids(action="sale") == [6, 3]
+    assert ids(action="logged", username="bob") == [7, 2]
+    assert ids(start_date="2024-01-02", end_date="2024-01-03") == [5, 4, 3]
+    assert ids(username="nobody") == []
+
+
+def test_activity_log_rejects_bad_pages(activity):
+    with pytest.raises(ValueError):
+        database.get_activity_log(0)
+    with pytest.raises(ValueError):
+        database.get_activity_log(3, "not a token")
+
+
+def test_users_pages_cover_every_user(db):
+    for number in range(5):
+        database.add_user(f"user{number}", "hash")
+    pages = read_all(database.get_users_page, 2)
+    assert [len(rows) for rows in pages] == [2, 2, 1]
+    assert [row[1] for rows in pages for row in rows] == [f"user{number}" for number in range(5)]
+    # The password hash never leaves the database
+    assert all(len(row) == 4 for rows in pages for row in rows)
+
+
+@pytest.fixture(scope="session")
+def qapp():
+    # One application for the whole run; the async_database workers belong to it
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    QtWidgets = pytest.importorskip("PyQt5.QtWidgets")
+    return QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+
+def wait_for_page(app, model):
+    deadline = time.monotonic() + 10
+    while model.is_loading():
+        assert time.monotonic() < deadline
+        app.processEvents()
+        time.sleep(0.001)
+
+
+def test_activity_log_model_reads_pages_in_the_background(activity, qapp):
+    from table_models import ActivityLogModel
+
+    model = ActivityLogModel(page_size=3)
+    model.refresh()
+    assert model.rowCount() == 0 and not model.canFetchMore()
+    wait_for_page(qapp, model)
+    assert model.rowCount() == 3
+
+    model.fetchMore()
+    # Nothing is read on the GUI thread, and no second read starts while one is pending
+    assert model.is_loading() and not model.canFetchMore()
+    wait_for_page(qapp, model)
+    while model.canFetchMore():
+        model.fetchMore()
+        wait_for_page(qapp, model)
+    assert model.rowCount() == 7
+    assert model.data(model.index(0, 1)) == "bob"
+
+    model.set_filter(username="ada")
+    wait_for_page(qapp, model)
+    assert [model.data(model.index(row, 2)) for row in range(model.rowCount())] == ["Logged out", "Added sale",
+                                                                                     "Logged in (user)"]
+
+
+def test_activity_log_model_stays_fetchable_after_an_error(activity, qapp, monkeypatch):
+    from table_models import ActivityLogModel
+
+    model = ActivityLogModel(page_size=3)
+    model.refresh()
+    wait_for_page(qapp, model)
+
+    read_page = database.get_activity_log
+    def fail(*args, **kwargs):
+        raise OSError("disk went away")
+    monkeypatch.setattr(database, "get_activity_log", fail)
+    model.fetchMore()
+    wait_for_page(qapp, model)
+    assert model.rowCount() == 3 and model.canFetchMore()
+
+    monkeypatch.setattr(database, "get_activity_log", read_page)
+    model.fetchMore()
+    wait_for_page(qapp, model)
+    # The failed page is read again from the same token: nothing skipped or repeated
+    assert [model.data(model.index(row, 2)) for row in range(model.rowCount())] == [
+        "Logged out", "Deleted SALE 4", "Logged out", "Added purchase", "Added sale", "Logged in (admin)"]
+
+
+def test_user_permissions_model_pages_users(db, qapp):
+    from PyQt5.QtCore import Qt
+    from table_models import UserPermissionsModel
+
+    for number in range(5):
+        database.add_user(f"user{number}", "hash")
+    model = UserPermissionsModel(page_size=2)
+    model.refresh()
+    wait_for_page(qapp, model)
+    while model.canFetchMore():
+        model.fetchMore()
+        wait_for_page(qapp, model)
+    assert [model.username(row) for row in range(model.rowCount())] == [f"user{number}" for number in range(5)]
+
+    request = model.set_permissions([1, 4], has_permissions=True)
+    changed = []
+    request.finished.connect(changed.append)
+    deadline = time.monotonic() + 10
+    while not changed:
+        assert time.monotonic() < deadline
+        qapp.processEvents()
+    assert changed == [["user1", "user4"]]
+    assert model.data(model.index(4, 2), Qt.CheckStateRole) == Qt.Checked
+    assert model.data(model.index(3, 2), Qt.CheckStateRole) == Qt.Unchecked
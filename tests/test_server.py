@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+
+import database
+import server
+
+
+def run_requests(*requests):
+    async def run():
+        api = server.ApiServer()
+        try:
+            return [await api.dispatch(*request) for request in requests]
+        finally:
+            await api.close()
+    return asyncio.run(run())
+
+
+def test_batch_runs_entries_in_order(db):
+    [(status, response)] = run_requests(("POST", "/batch", {"requests": [
+        {"method": "POST", "path": "/products", "body": {"name": "Soap", "stock": 5}},
+        {"method": "POST", "path": "/sales", "body": {"item_name": "Soap", "date": "2024-01-02",
+                                                        "customer_name": "Ada", "quantity": 2, "unit_price": 2.5}},
+        {"method": "GET", "path": "/products/1"},
+        {"method": "DELETE", "path": "/sales/99"},
+    ]}))
+    assert status == 200
+    assert [entry["status"] for entry in response["responses"]] == [200, 200, 200, 404]
+    assert response["responses"][2]["body"]["available_stock"] == 3
+
+
+@pytest.mark.parametrize("path", ["/batch", "/batch/", "//batch", "/batch?x=1", "batch"])
+def test_batch_cannot_contain_a_batch(db, path):
+    inner = {"requests": [{"method": "POST", "path": "/products", "body": {"name": "Soap"}}]}
+    [(status, response)] = run_requests(("POST", "/batch", {"requests": [
+        {"method": "POST", "path": path, "body": inner},
+    ]}))
+    assert status == 200
+    # "//batch" is a URL with host "batch" and no path, so it is simply not found
+    assert response["responses"][0]["status"] in (400, 404)
+    assert not database.product_exists("Soap")
+
+
+def test_batch_rejects_malformed_entries(db):
+    (status, response), (too_many, _) = run_requests(
+        ("POST", "/batch", {"requests": ["/products", {"method": "GET"}, {"path": 5}]}),
+        ("POST", "/batch", {"requests": [{"path": "/health"}] * (server.MAX_BATCH_SIZE + 1)}),
+    )
+    assert [entry["status"] for entry in response["responses"]] == [400, 400, 400]
+    assert too_many == 413
+
+
+def test_api_writes_are_logged(db):
+    run_requests(
+        ("POST", "/products", {"name": "Soap", "stock": 5}),
+        ("PUT", "/products/1", {"name": "Soap", "stock": 6}),
+        ("DELETE", "/products/1", None),
+        ("DELETE", "/products/1", None),
+    )
+    database.flush_activity_log()
+    rows, token = database.get_activity_log(username=server.API_USERNAME)
+    assert [row[3] for row in rows] == [
+        "Deleted products row 1 via the API",
+        "Updated products row 1 via the API",
+        "Created products row 1 via the API",
+    ]
@@ -7,19 +7,22 @@ class MainUserWindow(QMainWindow):
     # Define a signal for logout
     logout_signal = pyqtSignal()
 
-    def __init__(self, username, logout_function=None):
+    def __init__(self, username, logout_function=None, motob_app=None):
         super().__init__()
-        self.username = username
         self.logout_function = logout_function
-        self.setWindowTitle(f"Welcome, {username}")
+        self.set_username(username)
+
+        self.setup_ui(motob_app)
 
-        self.setup_ui()
+    def set_username(self, username):
+        self.username = username
+        self.setWindowTitle(f"Welcome, {username}")
 
-    def setup_ui(self):
+    def setup_ui(self, motob_app=None):
         self.tab_widget = QTabWidget()
         self.motob_app_tab = QWidget()
         self.tab_widget.addTab(self.motob_app_tab, "Motob App")
-        self.setup_motob_app_tab()
+        self.setup_motob_app_tab(motob_app)
 
         self.logout_button = QPushButton("Logout")
         self.logout_button.clicked.connect(self.logout)
@@ -32,14 +35,18 @@ class MainUserWindow(QMainWindow):
         central_widget.setLayout(layout)
         self.setCentralWidget(central_widget)
 
-    def setup_motob_app_tab(self):
-        layout = QVBoxLayout(self.motob_app_tab)
+    def setup_motob_app_tab(self, motob_app=None):
+        self.motob_app_layout = QVBoxLayout(self.motob_app_tab)
         label = QLabel("Motob Transactions:")
         label.setAlignment(Qt.AlignCenter)
-        layout.addWidget(label)
+        self.motob_app_layout.addWidget(label)
+
+        # Logged-in sessions share one MotobApp (see session.py)
+        self.attach_motob_app(motob_app if motob_app is not None else MotobApp())
 
-        self.motob_app = MotobApp()
-        layout.addWidget(self.motob_app)
+    def attach_motob_app(self, motob_app):
+        self.motob_app = motob_app
+        self.motob_app_layout.addWidget(motob_app)
 
     def logout(self):
         # Emit the logout signal when the logout button is clicked
@@ -0,0 +1,47 @@
+import re
+
+# The same rules the Add Purchase / Add Sale forms enforce with QRegExpValidator,
+# kept free of Qt so the data layer and the importers can use them too.
+DATE_PATTERN = re.compile(r"[0-9]{4}-[0-9]{2}-[0-9]{2}")
+ITEM_NAME_PATTERN = re.compile(r"[A-Za-z]+( [A-Za-z]+)*")
+
+
+def validate_date(date):
+    date = str(date).strip()
+    if not DATE_PATTERN.fullmatch(date):
+        raise ValueError("Invalid date format. Please use YYYY-MM-DD.")
+    return date
+
+
+def validate_item_name(item_name):
+    item_name = str(item_name).strip()
+    if not ITEM_NAME_PATTERN.fullmatch(item_name):
+        raise ValueError("Invalid item name format. Please use alphabetic characters and spaces, but not at the beginning or end.")
+    return item_name
+
+
+def validate_required(value, field):
+    value = "" if value is None else str(value).strip()
+    if not value:
+        raise ValueError(f"Please fill in {field}.")
+    return value
+
+
+def parse_quantity(value):
+    try:
+        quantity = int(float(value))
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid quantity: {value!r}")
+    if quantity < 0:
+        raise ValueError("Values cannot be negative.")
+    return quantity
+
+
+def parse_unit_price(value):
+    try:
+        unit_price = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid unit price: {value!r}")
+    if unit_price < 0:
+        raise ValueError("Values cannot be negative.")
+    return unit_price